@@ -0,0 +1,70 @@
+"""Benchmarks of the rendering of emails, using the testing settings.
+
+    python -m benchmarks.emails
+"""
+import os
+import timeit
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.settings")
+django.setup()
+
+from django.core.cache import cache  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+
+from snitch.converters import (  # noqa: E402
+    BleachPlainTextConverter,
+    HTMLParserPlainTextConverter,
+)
+from snitch.emails import TemplateEmailMessage  # noqa: E402
+
+RECIPIENTS = 1000
+REPEAT = 5
+
+
+def newsletter(index: int, shared_key: str | None = None) -> TemplateEmailMessage:
+    return TemplateEmailMessage(
+        to=f"user{index}@example.com",
+        template_name="newsletter.html",
+        context={"items": range(50)},
+        recipient_context={"name": f"User {index}"},
+        shared_key=shared_key,
+    )
+
+
+def render_each() -> None:
+    for index in range(RECIPIENTS):
+        newsletter(index).render()
+
+
+def render_shared() -> None:
+    cache.clear()
+    for index in range(RECIPIENTS):
+        newsletter(index, shared_key="benchmark").render()
+
+
+def convert(converter_class) -> None:
+    # Without cache, each recipient has its own HTML
+    converter = converter_class(cache_size=0)
+    html = newsletter(0).get_message()
+    for _ in range(RECIPIENTS):
+        converter.convert(html)
+
+
+def report(name: str, function) -> float:
+    best = min(timeit.repeat(function, number=1, repeat=REPEAT))
+    print(f"{name:<20} {best * 1000:10.1f} ms {RECIPIENTS / best:10.0f} emails/s")
+    return best
+
+
+if __name__ == "__main__":
+    call_command("migrate", verbosity=0)
+    print(f"Rendering {RECIPIENTS} emails, best of {REPEAT}")
+    each = report("render each", render_each)
+    shared = report("render shared", render_shared)
+    print(f"Speedup: {each / shared:.1f}x")
+    print(f"Converting {RECIPIENTS} emails to plain text, best of {REPEAT}")
+    bleach = report("bleach", lambda: convert(BleachPlainTextConverter))
+    parser = report("html parser", lambda: convert(HTMLParserPlainTextConverter))
+    print(f"Speedup: {bleach / parser:.1f}x")
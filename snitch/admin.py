@@ -1,24 +1,32 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import PAGE_VAR
 from django.utils.translation import gettext_lazy as _
 
-from snitch.models import Event, EventType, Notification
+from snitch.models import AdminJob, EmailSuppression, Event, EventType, Notification
+from snitch.pagination import EstimatedCountPaginator
 
 
 def notify_action(modeladmin, request, queryset):
-    """Explicit creates notifications for events."""
-    for event in queryset:
-        event.notify()
-    modeladmin.message_user(request, _("Events notified!"))
+    """Explicit creates notifications for events, in the background."""
+    job = AdminJob.enqueue(AdminJob.NOTIFY, queryset, user=request.user)
+    modeladmin.message_user(
+        request,
+        _("Notifying the events in the background, in the admin job %(job)d.")
+        % {"job": job.pk},
+    )
 
 
 notify_action.short_description = _("Notify events")  # type: ignore
 
 
 def send_action(modeladmin, request, queryset):
-    """Explicit sends the notifications using the backend."""
-    for notification in queryset:
-        notification.send(send_async=True)
-    modeladmin.message_user(request, _("Notifications sent!"))
+    """Explicit sends the notifications using the backend, in the background."""
+    job = AdminJob.enqueue(AdminJob.SEND, queryset, user=request.user)
+    modeladmin.message_user(
+        request,
+        _("Sending the notifications in the background, in the admin job %(job)d.")
+        % {"job": job.pk},
+    )
 
 
 send_action.short_description = _("Send notifications")  # type: ignore
@@ -29,15 +37,43 @@ class EventTypeAdmin(admin.ModelAdmin):
     list_display = ["id", "verb", "enabled"]
 
 
+class EstimatedCountAdminMixin:
+    """Paginates the changelist without counting all the rows, counting them up to
+    the requested page."""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_paginator(self, request, queryset, per_page, *args, **kwargs):
+        paginator = super().get_paginator(  # type: ignore
+            request, queryset, per_page, *args, **kwargs
+        )
+        try:
+            paginator.page_number = max(int(request.GET.get(PAGE_VAR, 1)), 1)
+        except ValueError:
+            pass
+        return paginator
+
+
+@admin.register(EmailSuppression)
+class EmailSuppressionAdmin(admin.ModelAdmin):
+    list_display = ["id", "email", "reason", "created"]
+    list_filter = ["reason"]
+    search_fields = ["email"]
+
+
 @admin.register(Event)
-class EventAdmin(admin.ModelAdmin):
+class EventAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
     list_display = ["id", "actor", "verb", "trigger", "target", "notified", "created"]
     list_filter = ["verb", "notified"]
     actions = [notify_action]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_event_objects()
+
 
 @admin.register(Notification)
-class NotificationAdmin(admin.ModelAdmin):
+class NotificationAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
     list_display = [
         "id",
         "event",
@@ -50,3 +86,50 @@ class NotificationAdmin(admin.ModelAdmin):
     list_filter = ["event__verb", "read", "sent", "receiver_content_type"]
     search_fields = ["receiver_id"]
     actions = [send_action]
+
+    def get_queryset(self, request):
+        return (
+            super()
+            .get_queryset(request)
+            .select_related("receiver_content_type")
+            .with_event_objects()
+        )
+
+
+@admin.register(AdminJob)
+class AdminJobAdmin(admin.ModelAdmin):
+    list_display = [
+        "id",
+        "action",
+        "status",
+        "progress",
+        "processed",
+        "failed",
+        "total",
+        "user",
+        "created",
+        "finished_at",
+    ]
+    list_filter = ["action", "status"]
+    list_select_related = ["user"]
+    readonly_fields = [
+        "action",
+        "status",
+        "progress",
+        "user",
+        "total",
+        "processed",
+        "failed",
+        "finished_at",
+    ]
+    fields = readonly_fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description=_("progress"))
+    def progress(self, obj):
+        return f"{obj.progress}%"
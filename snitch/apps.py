@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_init, post_save
 from django.utils.translation import gettext_lazy as _
 
 
@@ -8,6 +9,36 @@ class SimpleSnitchConfig(AppConfig):
     name: str = "snitch"
     verbose_name: str = _("Snitch")
 
+    def ready(self):
+        super().ready()
+        from celery.signals import worker_process_init
+
+        from snitch.loaders import warm_template_cache
+
+        worker_process_init.connect(warm_template_cache, weak=False)
+        self.connect_counters()
+        try:
+            from push_notifications.models import APNSDevice, GCMDevice
+        except ImportError:
+            return
+        from snitch.devices import invalidate_device_cache, remember_device_user
+
+        for device_class in [GCMDevice, APNSDevice]:
+            post_init.connect(remember_device_user, sender=device_class)
+            post_save.connect(invalidate_device_cache, sender=device_class)
+            post_delete.connect(invalidate_device_cache, sender=device_class)
+
+    def connect_counters(self):
+        """Updates the counters of notifications when they are deleted."""
+        from snitch.counters import update_counters_on_delete
+        from snitch.helpers import get_notification_model
+        from snitch.settings import NOTIFICATION_COUNTERS
+
+        if NOTIFICATION_COUNTERS:
+            post_delete.connect(
+                update_counters_on_delete, sender=get_notification_model()
+            )
+
 
 class SnitchConfig(SimpleSnitchConfig):
     """The default AppConfig for admin which does automatic discovery."""
@@ -0,0 +1,134 @@
+import gzip
+import hashlib
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Iterator
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, models
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from snitch.exceptions import InvalidArchive
+from snitch.helpers import get_notification_model
+from snitch.settings import ARCHIVE_BATCH_SIZE
+
+MANIFEST = "manifest.json"
+
+
+class Archiver:
+    """Exports the notifications and the events created before a date to compressed
+    JSON lines files, one row for each line, with a manifest of the number of rows
+    and the checksum of each file. The rows are read in batches by ID, so the memory
+    used doesn't depend on the size of the tables.
+    """
+
+    batch_size: int
+
+    def __init__(self, batch_size: int = ARCHIVE_BATCH_SIZE) -> None:
+        self.batch_size = batch_size
+
+    def querysets(
+        self, before: datetime, using: str = DEFAULT_DB_ALIAS
+    ) -> dict[str, models.QuerySet]:
+        """Gets the rows to archive of each model, by the name of its file."""
+        from snitch.models import Event
+
+        return {
+            "notifications": get_notification_model()
+            .objects.using(using)
+            .filter(created__lt=before),
+            "events": Event.objects.using(using).filter(created__lt=before),
+        }
+
+    def rows(self, queryset: models.QuerySet) -> Iterator[dict[str, Any]]:
+        """Gets the values of the rows of the queryset, in batches by ID."""
+        fields = [field.attname for field in queryset.model._meta.concrete_fields]
+        last = None
+        while True:
+            batch = queryset.order_by("pk")
+            if last is not None:
+                batch = batch.filter(pk__gt=last)
+            values = list(batch.values(*fields)[: self.batch_size])
+            if not values:
+                break
+            yield from values
+            last = values[-1][queryset.model._meta.pk.attname]
+
+    def export(
+        self, directory: str | Path, before: datetime, using: str = DEFAULT_DB_ALIAS
+    ) -> dict[str, Any]:
+        """Writes the files of the rows created before the date to the directory,
+        and the manifest. Returns the manifest.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        manifest: dict[str, Any] = {
+            "before": before.isoformat(),
+            "created": timezone.now().isoformat(),
+            "files": {},
+        }
+        for name, queryset in self.querysets(before, using=using).items():
+            file_name = f"{name}.jsonl.gz"
+            checksum = hashlib.sha256()
+            rows, last = 0, None
+            with gzip.open(directory / file_name, "wb") as archive:
+                for row in self.rows(queryset):
+                    line = (
+                        json.dumps(row, cls=DjangoJSONEncoder, sort_keys=True) + "\n"
+                    ).encode()
+                    archive.write(line)
+                    checksum.update(line)
+                    rows += 1
+                    last = row[queryset.model._meta.pk.attname]
+            manifest["files"][name] = {
+                "file": file_name,
+                "rows": rows,
+                "last": last,
+                "sha256": checksum.hexdigest(),
+            }
+        with open(directory / MANIFEST, "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+        return manifest
+
+    def verify(
+        self, directory: str | Path, using: str = DEFAULT_DB_ALIAS
+    ) -> dict[str, Any]:
+        """Checks that the files of the archive have the rows and the checksums of
+        the manifest, and that the rows in the database created before the date of
+        the archive are all in it. Some of them can be already deleted, so a
+        pruning can be resumed against the same archive. Returns the manifest, or
+        raises :class:`InvalidArchive`.
+        """
+        directory = Path(directory)
+        try:
+            with open(directory / MANIFEST) as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            raise InvalidArchive(f"The manifest of the archive {directory} is missing.")
+        before = datetime.fromisoformat(manifest["before"])
+        querysets = self.querysets(before, using=using)
+        for name, expected in manifest["files"].items():
+            checksum = hashlib.sha256()
+            rows = 0
+            try:
+                with gzip.open(directory / expected["file"], "rb") as archive:
+                    for line in archive:
+                        checksum.update(line)
+                        rows += 1
+            except (OSError, EOFError):
+                raise InvalidArchive(f"The file {expected['file']} can't be read.")
+            if rows != expected["rows"] or checksum.hexdigest() != expected["sha256"]:
+                raise InvalidArchive(f"The file {expected['file']} is corrupted.")
+            # Rows of the database not archived, created after the export
+            current = querysets[name].aggregate(rows=Count("pk"), last=Max("pk"))
+            if current["rows"] > rows or (
+                current["last"] is not None
+                and (expected["last"] is None or current["last"] > expected["last"])
+            ):
+                raise InvalidArchive(
+                    f"The {name} of the database don't match the file "
+                    f"{expected['file']}."
+                )
+        return manifest
@@ -1,12 +1,37 @@
 import logging
-from typing import TYPE_CHECKING, Callable, Type
+import random
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import TYPE_CHECKING, Any, Callable, Type
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User as AuthUser
-from django.db import models
-
-from snitch.emails import TemplateEmailMessage
-from snitch.settings import ENABLED_SEND_NOTIFICATIONS
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from snitch.devices import device_cache
+from snitch.emails import TemplateEmailMessage, send_messages
+from snitch.exceptions import SnitchError
+from snitch.helpers import get_notification_model
+from snitch.limiters import QuotaLimiter
+from snitch.settings import (
+    EMAIL_BATCH_SIZE,
+    EMAIL_DIGEST_INTERVAL,
+    EMAIL_DIGEST_TEMPLATE,
+    ENABLED_SEND_EMAILS,
+    ENABLED_SEND_NOTIFICATIONS,
+    PUSH_DEVICE_CACHE,
+    PUSH_MAX_RETRIES,
+    PUSH_PROVIDERS,
+    PUSH_RATE_LIMIT_CACHE_ALIAS,
+    PUSH_RATE_LIMIT_MAX_DELAY,
+    PUSH_RATE_LIMITS,
+    PUSH_RETRY_BACKOFF,
+    PUSH_RETRY_BACKOFF_MAX,
+)
+from snitch.tasks import retry_push_notification_task
 
 if TYPE_CHECKING:  # pragma: no cover
     from push_notifications.models import APNSDevice, GCMDevice
@@ -45,6 +70,12 @@ class AbstractBackend:
         """A subclass should to implement the send method."""
         raise NotImplementedError
 
+    @classmethod
+    def prefetch(cls, receivers: list["models.Model"]) -> None:
+        """Hook called with each batch of receivers of an event, before creating
+        their notifications, to fetch at once what is needed to send them."""
+        return None
+
 
 class PushNotificationBackend(AbstractBackend):
     """A backend class to send push notifications depending on the platform."""
@@ -54,6 +85,30 @@ class PushNotificationBackend(AbstractBackend):
     click_action: str | None
     default_batch_sending: bool = True
     batch_sending: bool
+    max_retries: int = PUSH_MAX_RETRIES
+    retry_backoff: int = PUSH_RETRY_BACKOFF
+    retry_backoff_max: int = PUSH_RETRY_BACKOFF_MAX
+    attempt: int = 0
+    # Sendings deferred by the quota, that already reserved it
+    reserved: bool = False
+    max_quota_delay: float = PUSH_RATE_LIMIT_MAX_DELAY
+    quota_limiter_class: Type[QuotaLimiter] = QuotaLimiter
+    use_device_cache: bool = PUSH_DEVICE_CACHE
+    # django-push-notifications already deactivates the devices when sending
+    deactivate_invalid_devices: bool = False
+    # Errors returned by the providers when the registration ID is not valid anymore
+    invalid_registration_errors: set[str] = {
+        "NotRegistered",
+        "InvalidRegistration",
+        "MismatchSenderId",
+        "Unregistered",
+        "UnregisteredError",
+        "SenderIdMismatchError",
+        "BadDeviceToken",
+        "DeviceTokenNotForTopic",
+        "UNREGISTERED",
+        "SENDER_ID_MISMATCH",
+    }
 
     def __init__(self, *args, **kwargs):
         """Adds attributes for the push notification from the handler."""
@@ -62,6 +117,8 @@ class PushNotificationBackend(AbstractBackend):
         self.action_id = self.handler.get_action_id()
         self.click_action = self.handler.get_click_action()
         self.batch_sending = kwargs.get("batch_sending", self.default_batch_sending)
+        # The attempt is recorded once, for all the platforms
+        self._attempt_recorded = False
 
     def extra_data(self, devices: "models.QuerySet | models.Model") -> dict:
         """Gets the extra data to add to the push, to be hooked if needed. It tries to
@@ -89,11 +146,23 @@ class PushNotificationBackend(AbstractBackend):
         self,
         device_class: Type["GCMDevice"] | Type["APNSDevice"],
     ) -> "models.QuerySet":
-        """Gets the devices using the given class."""
+        """Gets the active devices using the given class. If the device cache is
+        used, the devices of the users without devices are not queried.
+        """
         if self.user is not None:
-            return device_class.objects.filter(user=self.user)
+            devices = device_class.objects.filter(user=self.user, active=True)
+            if self.use_device_cache:
+                has_devices = device_cache.get(device_class, self.user.pk)
+                if has_devices is None:
+                    has_devices = devices.exists()
+                    device_cache.set(device_class, self.user.pk, has_devices)
+                if not has_devices:
+                    return device_class.objects.none()
+            return devices
         if self.notification and self.notification.receiver_class() == device_class:
-            return device_class.objects.filter(pk=self.notification.receiver_id)
+            return device_class.objects.filter(
+                pk=self.notification.receiver_id, active=True
+            )
         return device_class.objects.none()
 
     def pre_send(
@@ -159,6 +228,157 @@ class PushNotificationBackend(AbstractBackend):
             extra.update(extra_data)
         return message, extra
 
+    def _error_reason(self, error: Any) -> str | None:
+        """Gets the reason of an error returned by a provider. The error can be a
+        string, a dict with the key "error", or an exception.
+        """
+        if error is None:
+            return None
+        if isinstance(error, str):
+            return error
+        if isinstance(error, dict):
+            return error.get("error")
+        if isinstance(error, Exception):
+            return getattr(error, "status", None) or error.__class__.__name__
+        return str(error)
+
+    def _registration_ids(self, devices: "models.QuerySet") -> list[str]:
+        """Gets the registration IDs of the devices, in the same order used by
+        django-push-notifications to send the batch. The devices should be ordered
+        with :meth:`sending_order`.
+        """
+        return list(devices.values_list("registration_id", flat=True))
+
+    def sending_order(self, devices: "models.QuerySet") -> "models.QuerySet":
+        """Gets the devices that django-push-notifications sends in a batch, in the
+        order they are sent: grouped by application, and by ID in each application.
+        """
+        devices = devices.filter(active=True)
+        if hasattr(devices.model, "cloud_message_type"):
+            devices = devices.filter(cloud_message_type="FCM")
+        return devices.order_by("application_id", "pk")
+
+    def parse_response(
+        self, registration_ids: list[str], response: Any
+    ) -> dict[str, str | None]:
+        """Parses the response of a provider, and gets a dict with the error reason
+        for each registration ID, or None if it was a success. The registration IDs
+        not found in the response are omitted.
+        """
+        results: dict[str, str | None] = {}
+        if isinstance(response, list):
+            # APNS batch, a list of results for each application
+            for item in response:
+                results.update(self.parse_response(registration_ids, item))
+        elif isinstance(response, dict) and "results" in response:
+            # Legacy GCM and single APNS, a list of results in order
+            for registration_id, result in zip(registration_ids, response["results"]):
+                results[registration_id] = (
+                    self._error_reason(result) if isinstance(result, dict) else None
+                )
+        elif isinstance(response, dict):
+            # APNS bulk, a result for each registration ID
+            for registration_id, result in response.items():
+                results[registration_id] = (
+                    None if result == "Success" else self._error_reason(result)
+                )
+        elif hasattr(response, "responses"):
+            # FCM batch response, a list of send responses in order
+            for registration_id, result in zip(registration_ids, response.responses):
+                results[registration_id] = (
+                    None if result.success else self._error_reason(result.exception)
+                )
+        return results
+
+    def deactivate_devices(
+        self, device_class: Type["GCMDevice"] | Type["APNSDevice"], results: dict
+    ) -> int:
+        """Deactivates, in bulk, the devices with an invalid registration ID according
+        to the results of a sending, if the backend has to do it. Anyway, the cached
+        devices of their users are invalidated.
+        """
+        invalid_registration_ids = [
+            registration_id
+            for registration_id, reason in results.items()
+            if reason in self.invalid_registration_errors
+        ]
+        if not invalid_registration_ids:
+            return 0
+        devices = device_class.objects.filter(
+            registration_id__in=invalid_registration_ids
+        )
+        if self.use_device_cache:
+            device_cache.invalidate(
+                device_class, devices.values_list("user_id", flat=True)
+            )
+        if not self.deactivate_invalid_devices:
+            # Already deactivated by django-push-notifications
+            return 0
+        deactivated = devices.filter(active=True).update(active=False)
+        logger.info("Deactivated %d devices with invalid registration ID", deactivated)
+        return deactivated
+
+    def _platform(self, device_class: Type["GCMDevice"] | Type["APNSDevice"]) -> str:
+        """Gets the name of the platform of the given device class."""
+        if device_class._meta.model_name == "apnsdevice":
+            return "apns"
+        return "fcm"
+
+    def get_quota_limiter(
+        self, device_class: Type["GCMDevice"] | Type["APNSDevice"]
+    ) -> QuotaLimiter | None:
+        """Gets the quota limiter for the platform of the given device class, if
+        there is a rate limit configured for it.
+        """
+        platform = self._platform(device_class)
+        if platform not in PUSH_RATE_LIMITS:
+            return None
+        tokens, period = PUSH_RATE_LIMITS[platform]
+        return self.quota_limiter_class(
+            name=f"push-{platform}",
+            tokens=tokens,
+            period=period,
+            cache_alias=PUSH_RATE_LIMIT_CACHE_ALIAS,
+        )
+
+    def throttle(self, devices: "models.QuerySet") -> "models.QuerySet":
+        """Consumes the quota of the platform for the given devices, and returns the
+        devices that can be sent right now. The quota of the rest of devices is
+        reserved after the sendings already deferred, and they are sent when it's
+        refilled, without counting it as an attempt. They are recorded as failed if
+        they would wait longer than the maximum delay.
+        """
+        quota_limiter = self.get_quota_limiter(devices.model)
+        # Ephemeral notifications can't be deferred
+        if quota_limiter is None or self.notification is None or self.reserved:
+            return devices
+        registration_ids = self._registration_ids(devices)
+        granted = quota_limiter.acquire(len(registration_ids))
+        if granted < len(registration_ids):
+            deferred = registration_ids[granted:]
+            countdown = quota_limiter.reserve(
+                len(deferred), max_wait=self.max_quota_delay
+            )
+            if countdown is not None:
+                logger.info("Push quota exceeded, deferring %d devices", len(deferred))
+                self.schedule_retry(
+                    devices.model,
+                    deferred,
+                    countdown=countdown,
+                    attempt=self.attempt,
+                    reserved=True,
+                )
+            else:
+                logger.warning(
+                    "Push quota exceeded, %d devices over the maximum delay",
+                    len(deferred),
+                )
+                self.record_delivery(delivered=0, failed=len(deferred))
+            if not granted:
+                return devices.none()
+            devices = devices.filter(registration_id__in=registration_ids[:granted])
+        return devices
+
     def _send_to_devices(
         self,
         devices: "models.QuerySet",
@@ -167,26 +387,163 @@ class PushNotificationBackend(AbstractBackend):
         ],
     ):
         """Sends a batch of pushes."""
+        results: dict[str, str | None] = {}
+        if devices.query.is_empty():
+            return None
+        devices = self.throttle(self.sending_order(devices))
+        if devices.query.is_empty():
+            return None
         if self.batch_sending:
             self.pre_send()
+            registration_ids = self._registration_ids(devices)
             try:
                 message, extra = message_builder(devices)
-                devices.send_message(message=message, extra=extra)
+                response = devices.send_message(message=message, extra=extra)
+                results.update(
+                    {registration_id: None for registration_id in registration_ids}
+                )
+                results.update(self.parse_response(registration_ids, response))
             except Exception as exception:
                 logger.warning("Error sending a batch push message: %s", str(exception))
+                reason = self._error_reason(exception)
+                results.update(
+                    {registration_id: reason for registration_id in registration_ids}
+                )
             self.post_send()
         else:
             for device in devices:
                 self.pre_send(device=device)
                 try:
                     message, extra = message_builder(device)
-                    device.send_message(message=message, extra=extra)
+                    response = device.send_message(message=message, extra=extra)
+                    results[device.registration_id] = None
+                    results.update(
+                        self.parse_response([device.registration_id], response)
+                    )
                 except Exception as exception:
                     logger.warning(
                         "Error sending a single push message: %s", str(exception)
                     )
+                    results[device.registration_id] = self._error_reason(exception)
                 self.post_send(device=device)
+        self.deactivate_devices(devices.model, results)
+        self.handle_results(devices.model, results)
+        return None
+
+    def retry_countdown(self) -> float:
+        """Gets the number of seconds to wait until the next attempt, using an
+        exponential backoff with jitter.
+        """
+        backoff = min(self.retry_backoff_max, self.retry_backoff * 2**self.attempt)
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+    def schedule_retry(
+        self,
+        device_class: Type["GCMDevice"] | Type["APNSDevice"],
+        registration_ids: list[str],
+        countdown: float,
+        attempt: int,
+        reserved: bool = False,
+    ) -> None:
+        """Schedules a new sending only for the devices with the given registration
+        IDs, using a Celery task. If reserved, the quota is already consumed.
+        """
+        device_pks = list(
+            device_class.objects.filter(
+                registration_id__in=registration_ids, active=True
+            ).values_list("pk", flat=True)
+        )
+        if not device_pks or self.notification is None:
+            return None
+        retry_push_notification_task.apply_async(
+            (
+                self.notification.pk,
+                f"{self.__class__.__module__}.{self.__class__.__qualname__}",
+                device_class._meta.label,
+                device_pks,
+                attempt,
+                reserved,
+            ),
+            countdown=countdown,
+        )
+        return None
+
+    def record_delivery(self, delivered: int, failed: int) -> None:
+        """Records the delivery status of the notification, if there is one. The
+        attempt is counted once for each sending or retry, for all the platforms.
+        """
+        if self.notification is None or self.notification.pk is None:
+            return None
+        attempts = 0 if self._attempt_recorded else 1
+        self.notification.__class__.objects.filter(pk=self.notification.pk).update(
+            push_attempts=F("push_attempts") + attempts,
+            push_delivered=F("push_delivered") + delivered,
+            push_failed=F("push_failed") + failed,
+        )
+        self._attempt_recorded = True
+        return None
 
+    def handle_results(
+        self, device_class: Type["GCMDevice"] | Type["APNSDevice"], results: dict
+    ) -> None:
+        """Records the delivery status and retries the sending to the devices that
+        failed with a transient error, if there are attempts left.
+        """
+        if not results:
+            return None
+        delivered = [
+            registration_id
+            for registration_id, reason in results.items()
+            if reason is None
+        ]
+        invalid = [
+            registration_id
+            for registration_id, reason in results.items()
+            if reason in self.invalid_registration_errors
+        ]
+        failed = [
+            registration_id
+            for registration_id, reason in results.items()
+            if reason is not None and reason not in self.invalid_registration_errors
+        ]
+        if failed and self.notification is not None and self.attempt < self.max_retries:
+            self.schedule_retry(
+                device_class,
+                failed,
+                countdown=self.retry_countdown(),
+                attempt=self.attempt + 1,
+            )
+            failed = []
+        self.record_delivery(
+            delivered=len(delivered), failed=len(invalid) + len(failed)
+        )
+        return None
+
+    def _message_builder(
+        self, device_class: Type["GCMDevice"] | Type["APNSDevice"]
+    ) -> Callable[["models.QuerySet | models.Model"], tuple[str | dict | None, dict]]:
+        """Gets the message builder for the given device class."""
+        if device_class._meta.model_name == "apnsdevice":
+            return self._build_apns_message
+        return self._build_gcm_message
+
+    def retry(
+        self,
+        device_class: Type["GCMDevice"] | Type["APNSDevice"],
+        device_pks: list[int],
+        attempt: int,
+        reserved: bool = False,
+    ) -> None:
+        """Sends again the push only to the given devices. If reserved, the quota was
+        already consumed when the sending was deferred."""
+        if not ENABLED_SEND_NOTIFICATIONS:
+            return None
+        self.attempt = attempt
+        self.reserved = reserved
+        devices = device_class.objects.filter(pk__in=device_pks, active=True)
+        self._send_to_devices(
+            devices=devices, message_builder=self._message_builder(device_class)
+        )
         return None
 
     def _send_gcm(self) -> None:
@@ -216,6 +573,116 @@ class PushNotificationBackend(AbstractBackend):
             self._send_apns()
 
 
+class AsyncPushNotificationBackend(PushNotificationBackend):
+    """A backend class that sends the push notifications directly to the providers,
+    multiplexing the requests to all the devices over long-lived HTTP/2 connections.
+    It requires the httpx[http2] package, and the providers configured in the
+    SNITCH_PUSH_PROVIDERS setting.
+    """
+
+    deactivate_invalid_devices: bool = True
+
+    def get_provider(self, platform: str) -> dict:
+        """Gets the configuration of the provider for the given platform."""
+        try:
+            return PUSH_PROVIDERS[platform]
+        except KeyError:
+            raise SnitchError(f"There is no push provider configured for {platform}.")
+
+    def get_headers(self, platform: str) -> dict:
+        """Gets the headers of the requests to the provider, to be hooked to add
+        the authorization.
+        """
+        return dict(self.get_provider(platform).get("headers", {}))
+
+    def build_payload(
+        self,
+        platform: str,
+        registration_id: str,
+        message: str | dict | None,
+        extra: dict,
+    ) -> dict:
+        """Builds the JSON payload of the request for a device."""
+        if platform == "apns":
+            return {"aps": {"alert": message}, **extra} if message else extra
+        notification = {"title": extra.get("title"), "body": message}
+        payload: dict = {
+            "token": registration_id,
+            "data": {key: str(value) for key, value in extra.items()},
+        }
+        if any(notification.values()):
+            payload["notification"] = {
+                key: value for key, value in notification.items() if value
+            }
+        return {"message": payload}
+
+    def parse_reason(self, status_code: int | None, body: dict) -> str | None:
+        """Gets the error reason from a provider response, or None if it was a
+        success.
+        """
+        if status_code is not None and 200 <= status_code < 300:
+            return None
+        # APNS
+        if "reason" in body:
+            return body["reason"]
+        # FCM
+        error = body.get("error")
+        if isinstance(error, dict):
+            for detail in error.get("details", []):
+                if "errorCode" in detail:
+                    return detail["errorCode"]
+            return error.get("status")
+        return error or f"HTTP {status_code}"
+
+    def _send_to_devices(
+        self,
+        devices: "models.QuerySet",
+        message_builder: Callable[
+            ["models.QuerySet | models.Model"], tuple[str | dict | None, dict]
+        ],
+    ):
+        """Sends the push to all the devices concurrently."""
+        from snitch.clients import http2_client
+
+        results: dict[str, str | None] = {}
+        if devices.query.is_empty():
+            return None
+        devices = self.throttle(self.sending_order(devices))
+        if devices.query.is_empty():
+            return None
+        registration_ids = self._registration_ids(devices)
+        if registration_ids:
+            platform = self._platform(devices.model)
+            self.pre_send()
+            try:
+                message, extra = message_builder(devices)
+                url = self.get_provider(platform)["url"]
+                headers = self.get_headers(platform)
+                requests = [
+                    (
+                        registration_id,
+                        url.format(registration_id=registration_id),
+                        headers,
+                        self.build_payload(platform, registration_id, message, extra),
+                    )
+                    for registration_id in registration_ids
+                ]
+                for registration_id, status_code, body in http2_client.send(requests):
+                    results[registration_id] = self.parse_reason(status_code, body)
+            except Exception as exception:
+                logger.warning(
+                    "Error sending an async push message: %s", str(exception)
+                )
+                reason = self._error_reason(exception)
+                results.update(
+                    {registration_id: reason for registration_id in registration_ids}
+                )
+            self.post_send()
+        self.deactivate_devices(devices.model, results)
+        self.handle_results(devices.model, results)
+        return None
+
+
 class EmailNotificationBackend(AbstractBackend):
     """Backend for using the email app to send emails."""
 
@@ -223,6 +690,7 @@ class EmailNotificationBackend(AbstractBackend):
     get_email_kwargs_attr: str = "get_email_kwargs_attr"
     get_email_extra_context_attr: str = "get_email_extra_context"
     get_email_subject_attr: str = "get_email_subject"
+    template_email_recipient_keys_attr: str = "template_email_recipient_keys"
 
     def __use_async(self) -> bool:
         """Check if the email can use async, False by default, because the notification
@@ -254,11 +722,25 @@ class EmailNotificationBackend(AbstractBackend):
             kwargs = getattr(self.handler, self.template_email_kwargs_attr)
         return kwargs
 
+    @classmethod
+    def prefetch(cls, receivers: list["models.Model"]) -> None:
+        """Checks at once if the emails of the receivers are suppressed, so the
+        check of each email is served from the cache."""
+        if not ENABLED_SEND_NOTIFICATIONS:
+            return None
+        TemplateEmailMessage.suppressed(
+            getattr(receiver, receiver.get_email_field_name())
+            for receiver in receivers
+            if hasattr(receiver, "get_email_field_name")
+        )
+        return None
+
     def send(self):
         """Sends the email."""
         if ENABLED_SEND_NOTIFICATIONS:
-            # Gets the handler to extract the arguments from template_email_kwargs
-            kwargs = self.email_kwargs()
+            # Gets the handler to extract the arguments from template_email_kwargs,
+            # copied to not change the ones of the handler class
+            kwargs = dict(self.email_kwargs() or {})
             if kwargs:
                 # Gets to email
                 email = (
@@ -274,7 +756,7 @@ class EmailNotificationBackend(AbstractBackend):
                 if subject:
                     kwargs["subject"] = subject
                 # Context
-                context = kwargs.get("context", {})
+                context = dict(kwargs.get("context", {}))
                 # Adds notification or event
                 if self.notification:
                     context.update({"notification": self.notification})
@@ -282,6 +764,158 @@ class EmailNotificationBackend(AbstractBackend):
                     context.update({"event": self.event})
                 context.update(self.extra_context())
                 kwargs.update({"context": context})
+                # Renders once for the event the context that is not for the
+                # recipient
+                recipient_keys = getattr(
+                    self.handler, self.template_email_recipient_keys_attr, []
+                )
+                if recipient_keys:
+                    # The notification is for the recipient, so it can't be shared
+                    context.pop("notification", None)
+                    kwargs["recipient_context"] = {
+                        key: context.pop(key)
+                        for key in recipient_keys
+                        if key in context
+                    }
+                    kwargs[
+                        "shared_key"
+                    ] = f"{self.handler.event.pk}-{self.handler.__class__.__name__}"
                 # Sends email
                 email = TemplateEmailMessage(**kwargs)
                 email.send(use_async=self.__use_async())
+
+
+class DigestEmailNotificationBackend(EmailNotificationBackend):
+    """Backend that queues the notifications, to send a single email with all the
+    queued notifications of each receiver when the digests are flushed. The handler
+    sets how long the notification can wait in the queue.
+    """
+
+    template_email_digest_interval_attr: str = "template_email_digest_interval"
+    digest_email_class: Type[TemplateEmailMessage] = TemplateEmailMessage
+
+    def interval(self) -> int:
+        """Gets the seconds the notification waits in the queue."""
+        return getattr(
+            self.handler,
+            self.template_email_digest_interval_attr,
+            EMAIL_DIGEST_INTERVAL,
+        )
+
+    def send(self):
+        """Queues the notification in the digest of the receiver. Without a saved
+        notification, the email is sent at the moment.
+        """
+        if self.notification is None or self.notification.pk is None:
+            return super().send()
+        if ENABLED_SEND_NOTIFICATIONS:
+            self.notification.email_digest_at = timezone.now() + timedelta(
+                seconds=self.interval()
+            )
+            self.notification.__class__.objects.filter(pk=self.notification.pk).update(
+                email_digest_at=self.notification.email_digest_at
+            )
+
+    @classmethod
+    def claim(
+        cls, receiver_content_type_id: int, receiver_id: int
+    ) -> list["AbstractNotification"]:
+        """Takes all the queued notifications of the receiver out of the queue, so
+        concurrent flushes don't send them twice. The notifications keep in memory
+        when they were queued, to put them back if the digest can't be sent.
+        """
+        Notification = get_notification_model()
+        with transaction.atomic():
+            notifications = list(
+                Notification.objects.filter(
+                    email_digest_at__isnull=False,
+                    receiver_content_type_id=receiver_content_type_id,
+                    receiver_id=receiver_id,
+                )
+                .select_for_update(skip_locked=True, of=("self",))
+                .select_related("receiver_content_type")
+                .with_event_objects()
+                .order_by("created")
+            )
+            Notification.objects.filter(
+                pk__in=[notification.pk for notification in notifications]
+            ).update(email_digest_at=None)
+        return notifications
+
+    @classmethod
+    def requeue(cls, notifications: list["AbstractNotification"]) -> None:
+        """Puts back the claimed notifications in the queue, when they were queued."""
+        get_notification_model().objects.bulk_update(notifications, ["email_digest_at"])
+
+    @classmethod
+    def digest_email(
+        cls, notifications: list["AbstractNotification"]
+    ) -> TemplateEmailMessage | None:
+        """Builds the digest email for the notifications of a receiver, or None if
+        the receiver doesn't have an email.
+        """
+        user = notifications[0].user
+        email_field_name = getattr(user, "EMAIL_FIELD", None)
+        to = getattr(user, email_field_name) if email_field_name else None
+        if not to:
+            return None
+        return cls.digest_email_class(
+            to=to,
+            subject=_("Your notifications"),
+            template_name=EMAIL_DIGEST_TEMPLATE,
+            context={"notifications": notifications, "user": user},
+        )
+
+    @classmethod
+    def flush(
+        cls, now: datetime | None = None, batch_size: int = EMAIL_BATCH_SIZE
+    ) -> int:
+        """Sends the digests of the receivers that have notifications waiting since
+        before now, with all their queued notifications. The receivers are claimed,
+        rendered and sent in batches, reusing the connection. The notifications of a
+        digest that fails to render, or of a batch that fails to be sent, are put
+        back in the queue. Returns the number of emails sent.
+        """
+        Notification = get_notification_model()
+        receivers = iter(
+            Notification.objects.filter(
+                email_digest_at__lte=timezone.now() if now is None else now
+            )
+            .order_by()
+            .values_list("receiver_content_type_id", "receiver_id")
+            .distinct()
+        )
+        sent = 0
+        while batch := list(islice(receivers, batch_size)):
+            digests: dict[int, list["AbstractNotification"]] = {}
+            emails = []
+            for receiver_content_type_id, receiver_id in batch:
+                notifications = cls.claim(receiver_content_type_id, receiver_id)
+                if notifications:
+                    email = cls.digest_email(notifications)
+                    if email is not None:
+                        digests[id(email)] = notifications
+                        emails.append(email)
+            if not emails or not ENABLED_SEND_EMAILS:
+                continue
+            messages, claimed = [], []
+            for email in TemplateEmailMessage.without_suppressed(emails, batch_size):
+                if email.fake:
+                    continue
+                notifications = digests[id(email)]
+                try:
+                    messages.append(email.build(*email.render()))
+                except Exception:
+                    logger.exception(
+                        "Error rendering the digest of the receiver %s",
+                        notifications[0].receiver_id,
+                    )
+                    cls.requeue(notifications)
+                    continue
+                claimed.extend(notifications)
+            try:
+                sent += send_messages(messages, batch_size=batch_size)
+            except Exception:
+                cls.requeue(claimed)
+                raise
+        return sent
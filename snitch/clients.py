@@ -0,0 +1,119 @@
+import asyncio
+import os
+import threading
+from typing import Any
+
+from snitch.exceptions import SnitchError
+from snitch.settings import PUSH_MAX_CONCURRENCY, PUSH_TIMEOUT
+
+try:
+    import httpx
+except ImportError:
+    raise SnitchError("The HTTP/2 client requires the httpx[http2] package.")
+
+
+# A request is a tuple with the registration ID, the URL, the headers and the JSON
+# payload, and a response a tuple with the registration ID, the status code (None if
+# the request failed) and the JSON body
+PushRequest = tuple[str, str, dict, dict]
+PushResponse = tuple[str, int | None, dict]
+
+
+class HTTP2Client:
+    """A client that keeps long-lived HTTP/2 connections with the push providers, in
+    an event loop running in a background thread. The requests are multiplexed over
+    a single connection for each provider.
+    """
+
+    max_concurrency: int
+    timeout: float
+
+    def __init__(
+        self, max_concurrency: int = PUSH_MAX_CONCURRENCY, timeout: float = PUSH_TIMEOUT
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._client: httpx.AsyncClient | None = None
+        self._pid: int | None = None
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Gets the event loop, starting it if needed. The loop is started again in
+        forked processes, like the Celery workers.
+        """
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._client = None
+                self._pid = os.getpid()
+                thread = threading.Thread(
+                    target=self._loop.run_forever, name="snitch-http2", daemon=True
+                )
+                thread.start()
+        return self._loop
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Gets the HTTP client, that must be created inside the event loop."""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http1=False, http2=True, timeout=self.timeout
+            )
+        return self._client
+
+    async def _send(
+        self,
+        client: httpx.AsyncClient,
+        semaphore: asyncio.Semaphore,
+        request: PushRequest,
+    ) -> PushResponse:
+        """Sends a single request."""
+        registration_id, url, headers, payload = request
+        async with semaphore:
+            try:
+                response = await client.post(url, headers=headers, json=payload)
+            except httpx.HTTPError as exception:
+                return registration_id, None, {"error": exception.__class__.__name__}
+        try:
+            body: Any = response.json()
+        except ValueError:
+            body = {}
+        return (
+            registration_id,
+            response.status_code,
+            body if isinstance(body, dict) else {},
+        )
+
+    async def _send_all(self, requests: list[PushRequest]) -> list[PushResponse]:
+        """Sends all the requests concurrently."""
+        client = self._get_client()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        return await asyncio.gather(
+            *[self._send(client, semaphore, request) for request in requests]
+        )
+
+    def send(self, requests: list[PushRequest]) -> list[PushResponse]:
+        """Sends the requests, blocking until all of them are completed."""
+        if not requests:
+            return []
+        loop = self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(self._send_all(requests), loop)
+        return future.result()
+
+    def close(self) -> None:
+        """Closes the connections and stops the event loop."""
+        with self._lock:
+            if self._loop is None:
+                return None
+            if self._client is not None and self._pid == os.getpid():
+                asyncio.run_coroutine_threadsafe(
+                    self._client.aclose(), self._loop
+                ).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+            self._client = None
+        return None
+
+
+# This global object keeps the connections of the process
+http2_client: HTTP2Client = HTTP2Client()
@@ -0,0 +1,132 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from html.parser import HTMLParser
+
+import bleach
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from snitch.settings import EMAIL_PLAIN_CACHE_SIZE, EMAIL_PLAIN_TEXT_CONVERTER
+
+
+class PlainTextConverter:
+    """Base class to convert the HTML of the emails to plain text. The converted
+    texts are kept in a LRU cache, using as key the hash of the HTML.
+    """
+
+    cache_size: int
+
+    def __init__(self, cache_size: int = EMAIL_PLAIN_CACHE_SIZE) -> None:
+        self.cache_size = cache_size
+        self._cache: OrderedDict[bytes, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def to_plain(self, html: str) -> str:
+        """A subclass should implement the conversion."""
+        raise NotImplementedError
+
+    def convert(self, html: str) -> str:
+        """Gets the plain text of the HTML, from the cache if possible."""
+        if self.cache_size <= 0:
+            return self.to_plain(html)
+        key = hashlib.blake2b(html.encode(), digest_size=16).digest()
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        plain = self.to_plain(html)
+        with self._lock:
+            self._cache[key] = plain
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return plain
+
+
+class BleachPlainTextConverter(PlainTextConverter):
+    """Converts the HTML to plain text with several passes of regular expressions
+    and bleach.
+    """
+
+    def to_plain(self, html: str) -> str:
+        plain = re.sub(r"[\t\n\r\f\v]", "", html)
+        plain = re.sub("<style.*?>.+</style>", "", plain)  # Special case for style tag
+        plain = plain.replace("</p>", "\n")
+        plain = plain.replace("</h1>", "\n\n")
+        plain = bleach.clean(plain, strip=True)
+        return plain.strip()
+
+
+class _PlainTextParser(HTMLParser):
+    """Parser that collects the text of the HTML in a single pass."""
+
+    # Text added when the tag is closed
+    line_breaks: dict[str, str] = {
+        "p": "\n",
+        "div": "\n",
+        "li": "\n",
+        "tr": "\n",
+        "h1": "\n\n",
+        "h2": "\n\n",
+        "h3": "\n\n",
+        "h4": "\n",
+        "h5": "\n",
+        "h6": "\n",
+    }
+    # Tags whose content is not text
+    skipped_tags: set[str] = {"head", "style", "script", "title"}
+    whitespace = re.compile(r"\s+")
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.parts: list[str] = []
+        self.skipping: int = 0
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        if tag in self.skipped_tags:
+            self.skipping += 1
+        elif tag == "br":
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in self.skipped_tags:
+            self.skipping = max(0, self.skipping - 1)
+        elif tag in self.line_breaks:
+            self.parts.append(self.line_breaks[tag])
+
+    def handle_data(self, data: str) -> None:
+        if not self.skipping:
+            self.parts.append(self.whitespace.sub(" ", data))
+
+
+class HTMLParserPlainTextConverter(PlainTextConverter):
+    """Converts the HTML to plain text in a single pass, streaming it through the
+    HTML parser of the standard library. All the tags are removed, the entities are
+    unescaped, and the whitespaces are collapsed as a browser does, adding line
+    breaks after the block elements.
+    """
+
+    def to_plain(self, html: str) -> str:
+        parser = _PlainTextParser()
+        parser.feed(html)
+        parser.close()
+        lines = "".join(parser.parts).split("\n")
+        return "\n".join(line.strip() for line in lines).strip()
+
+
+# Converters already created, by class path, to keep their caches
+_converters: dict[str, PlainTextConverter] = {}
+
+
+def get_plain_text_converter() -> PlainTextConverter:
+    """Gets the converter of the class set in the settings. The setting is read on
+    each call, so it can be overridden, and the converter of each class is created
+    only once.
+    """
+    path = getattr(
+        settings, "SNITCH_EMAIL_PLAIN_TEXT_CONVERTER", EMAIL_PLAIN_TEXT_CONVERTER
+    )
+    if path not in _converters:
+        _converters[path] = import_string(path)()
+    return _converters[path]
@@ -0,0 +1,315 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterable, Iterator
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, models, transaction
+from django.db.models import Count, F, Q, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from snitch.helpers import get_notification_model
+from snitch.settings import (
+    NOTIFICATION_COUNTERS_CACHE_ALIAS,
+    NOTIFICATION_COUNTERS_CACHE_TIMEOUT,
+)
+
+# A receiver is identified by the ID of its content type and its ID
+Receiver = tuple[int, int]
+
+# Set while the deleted notifications are counted in bulk, only in the current
+# thread or task, so the signal receiver doesn't count them again
+_paused: ContextVar[bool] = ContextVar("snitch_counters_paused", default=False)
+
+
+class NotificationCounters:
+    """Counters of the unread and the unreceived notifications of each receiver. The
+    counters are updated in the same transaction than the notifications, and
+    mirrored in the cache, so they can be read without any query. The cached
+    counters are versioned, and a change starts a new version, so a value read
+    before the change can't be cached again after it.
+    """
+
+    prefix: str = "snitch"
+    batch_size: int = 500
+    cache_alias: str
+    timeout: int
+
+    def __init__(
+        self,
+        cache_alias: str = NOTIFICATION_COUNTERS_CACHE_ALIAS,
+        timeout: int = NOTIFICATION_COUNTERS_CACHE_TIMEOUT,
+    ) -> None:
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+
+    @contextmanager
+    def paused(self) -> Iterator[None]:
+        """Stops updating the counters for each notification deleted in the block,
+        when they are updated in bulk by the caller.
+        """
+        token = _paused.set(True)
+        try:
+            yield
+        finally:
+            _paused.reset(token)
+
+    @property
+    def _cache(self) -> Any:
+        """Gets the cache proxy using the alias."""
+        return caches[self.cache_alias]
+
+    @property
+    def _model(self) -> Any:
+        """Gets the model of the counters."""
+        return apps.get_model("snitch.NotificationCounter")
+
+    def _version_key(self, receiver: Receiver) -> str:
+        """Gets the cache key for the version of the counters of the receiver."""
+        return f"{self.prefix}-counters-version-{receiver[0]}-{receiver[1]}"
+
+    def _key(self, receiver: Receiver) -> str:
+        """Gets the cache key for the current version of the counters of the
+        receiver. A new version is started if there is none, that is always
+        different from the previous ones.
+        """
+        version_key = self._version_key(receiver)
+        version = self._cache.get(version_key)
+        if version is None:
+            self._cache.add(version_key, time.time_ns(), self.timeout)
+            version = self._cache.get(version_key)
+        return f"{self.prefix}-counters-{receiver[0]}-{receiver[1]}-{version}"
+
+    def _invalidate(self, receivers: Iterable[Receiver], using: str) -> None:
+        """Starts a new version of the cached counters once the transaction is
+        committed."""
+        keys = [self._version_key(receiver) for receiver in receivers]
+        if keys:
+            transaction.on_commit(lambda: self._cache.delete_many(keys), using=using)
+
+    def get(self, receiver: models.Model) -> dict[str, int]:
+        """Gets the number of unread and unreceived notifications of the receiver."""
+        # The version is read before the counters, so a change committed after
+        # reading them starts a new version
+        key = self._key((ContentType.objects.get_for_model(receiver).pk, receiver.pk))
+        counters = self._cache.get(key)
+        if counters is None:
+            counters = self._model.objects.filter(
+                receiver_content_type=ContentType.objects.get_for_model(receiver),
+                receiver_id=receiver.pk,
+            ).values("unread", "unreceived").first() or {"unread": 0, "unreceived": 0}
+            self._cache.set(key, counters, self.timeout)
+        return counters
+
+    def unread(self, receiver: models.Model) -> int:
+        """Gets the number of unread notifications of the receiver."""
+        return self.get(receiver)["unread"]
+
+    def unreceived(self, receiver: models.Model) -> int:
+        """Gets the number of unreceived notifications of the receiver."""
+        return self.get(receiver)["unreceived"]
+
+    def change(
+        self,
+        deltas: dict[Receiver, tuple[int, int]],
+        using: str = DEFAULT_DB_ALIAS,
+    ) -> None:
+        """Adds the changes of the unread and unreceived notifications to the
+        counters of each receiver. It should be called in the transaction that
+        changes the notifications. The receivers with the same changes are updated
+        together, in batches.
+        """
+        Counter = self._model
+        grouped: dict[tuple[int, int, int], list[int]] = defaultdict(list)
+        for (content_type_id, receiver_id), (unread, unreceived) in deltas.items():
+            if content_type_id is None or receiver_id is None:
+                continue
+            if unread or unreceived:
+                grouped[(content_type_id, unread, unreceived)].append(receiver_id)
+        for (content_type_id, unread, unreceived), receiver_ids in grouped.items():
+            values = {
+                "unread": Greatest(F("unread") + unread, Value(0)),
+                "unreceived": Greatest(F("unreceived") + unreceived, Value(0)),
+                "modified": timezone.now(),
+            }
+            for start in range(0, len(receiver_ids), self.batch_size):
+                batch = receiver_ids[start : start + self.batch_size]
+                counters = Counter.objects.using(using).filter(
+                    receiver_content_type_id=content_type_id, receiver_id__in=batch
+                )
+                existing = set(counters.values_list("receiver_id", flat=True))
+                counters.update(**values)
+                for receiver_id in set(batch) - existing:
+                    self._create(
+                        (content_type_id, receiver_id), unread, unreceived, using
+                    )
+            self._invalidate(
+                [(content_type_id, receiver_id) for receiver_id in receiver_ids],
+                using=using,
+            )
+
+    def _create(
+        self, receiver: Receiver, unread: int, unreceived: int, using: str
+    ) -> None:
+        """Creates the counters of the receiver with the given changes."""
+        Counter = self._model
+        try:
+            with transaction.atomic(using=using):
+                Counter.objects.using(using).create(
+                    receiver_content_type_id=receiver[0],
+                    receiver_id=receiver[1],
+                    unread=max(unread, 0),
+                    unreceived=max(unreceived, 0),
+                )
+        except IntegrityError:
+            # Created by other transaction in the meantime
+            Counter.objects.using(using).filter(
+                receiver_content_type_id=receiver[0], receiver_id=receiver[1]
+            ).update(
+                unread=Greatest(F("unread") + unread, Value(0)),
+                unreceived=Greatest(F("unreceived") + unreceived, Value(0)),
+            )
+
+    def deltas(
+        self, queryset: models.QuerySet, values: dict[str, Any]
+    ) -> dict[Receiver, tuple[int, int]] | None:
+        """Gets the changes of the counters if the notifications of the queryset are
+        updated with the values of the read and received flags, or None if they
+        can't be known before the update.
+        """
+        deltas: dict[Receiver, list[int]] = defaultdict(lambda: [0, 0])
+        for index, field_name in enumerate(["read", "received"]):
+            if field_name not in values:
+                continue
+            value = values[field_name]
+            if not isinstance(value, bool):
+                return None
+            rows = (
+                queryset.exclude(**{field_name: value})
+                .order_by()
+                .values_list("receiver_content_type_id", "receiver_id")
+                .annotate(total=Count("pk"))
+            )
+            for content_type_id, receiver_id, total in rows:
+                deltas[(content_type_id, receiver_id)][index] += (
+                    -total if value else total
+                )
+        return {receiver: tuple(delta) for receiver, delta in deltas.items()}
+
+    def receivers(self, queryset: models.QuerySet) -> list[Receiver]:
+        """Gets the receivers of the notifications of the queryset."""
+        return list(
+            queryset.order_by()
+            .values_list("receiver_content_type_id", "receiver_id")
+            .distinct()
+        )
+
+    def refresh(self, receivers: list[Receiver], using: str = DEFAULT_DB_ALIAS) -> None:
+        """Counts again the notifications of the receivers."""
+        Counter = self._model
+        Notification = get_notification_model()
+        receivers = [receiver for receiver in receivers if None not in receiver]
+        if not receivers:
+            return None
+        rows = (
+            Notification.objects.using(using)
+            .filter(
+                receiver_content_type_id__in={receiver[0] for receiver in receivers},
+                receiver_id__in={receiver[1] for receiver in receivers},
+            )
+            .order_by()
+            .values_list("receiver_content_type_id", "receiver_id")
+            .annotate(
+                unread=Count("pk", filter=Q(read=False)),
+                unreceived=Count("pk", filter=Q(received=False)),
+            )
+        )
+        counts = {
+            (content_type_id, receiver_id): (unread, unreceived)
+            for content_type_id, receiver_id, unread, unreceived in rows
+        }
+        now = timezone.now()
+        with transaction.atomic(using=using):
+            Counter.objects.using(using).bulk_create(
+                [
+                    Counter(
+                        receiver_content_type_id=receiver[0],
+                        receiver_id=receiver[1],
+                        unread=counts.get(receiver, (0, 0))[0],
+                        unreceived=counts.get(receiver, (0, 0))[1],
+                        created=now,
+                        modified=now,
+                    )
+                    for receiver in receivers
+                ],
+                update_conflicts=True,
+                unique_fields=["receiver_content_type", "receiver_id"],
+                update_fields=["unread", "unreceived", "modified"],
+            )
+            self._invalidate(receivers, using=using)
+        return None
+
+    def rebuild(self, batch_size: int = 1000, using: str = DEFAULT_DB_ALIAS) -> int:
+        """Counts again the notifications of all the receivers, in batches of
+        receivers, and removes the counters of the receivers without notifications.
+        Returns the number of receivers counted.
+        """
+        Notification = get_notification_model()
+        started = timezone.now()
+        receivers = (
+            Notification.objects.using(using)
+            .filter(receiver_content_type__isnull=False, receiver_id__isnull=False)
+            .order_by("receiver_content_type_id", "receiver_id")
+            .values_list("receiver_content_type_id", "receiver_id")
+            .distinct()
+        )
+        total = 0
+        last: Receiver | None = None
+        while True:
+            batch_receivers = receivers
+            if last is not None:
+                batch_receivers = batch_receivers.filter(
+                    Q(receiver_content_type_id__gt=last[0])
+                    | Q(receiver_content_type_id=last[0], receiver_id__gt=last[1])
+                )
+            batch = list(batch_receivers[:batch_size])
+            if not batch:
+                break
+            self.refresh(batch, using=using)
+            total += len(batch)
+            last = batch[-1]
+        # Counters of receivers without notifications
+        stale = self._model.objects.using(using).filter(modified__lt=started)
+        with transaction.atomic(using=using):
+            self._invalidate(
+                stale.values_list("receiver_content_type_id", "receiver_id"),
+                using=using,
+            )
+            stale.delete()
+        return total
+
+
+def update_counters_on_delete(
+    sender: Any, instance: models.Model, using: str = DEFAULT_DB_ALIAS, **kwargs
+) -> None:
+    """Signal receiver to update the counters when a notification is deleted,
+    unless they are paused."""
+    if _paused.get():
+        return
+    notification_counters.change(
+        {
+            (instance.receiver_content_type_id, instance.receiver_id): (
+                0 if instance.read else -1,
+                0 if instance.received else -1,
+            )
+        },
+        using=using,
+    )
+
+
+# This global object represents the counters of notifications
+notification_counters: NotificationCounters = NotificationCounters()
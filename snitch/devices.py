@@ -0,0 +1,97 @@
+from typing import TYPE_CHECKING, Any, Iterable, Type
+
+from django.core.cache import caches
+from django.db import models
+
+from snitch.settings import PUSH_DEVICE_CACHE_ALIAS, PUSH_DEVICE_CACHE_TIMEOUT
+
+if TYPE_CHECKING:  # pragma: no cover
+    from push_notifications.models import APNSDevice, GCMDevice
+
+
+class DeviceCache:
+    """Cache of whether each user has active devices, to avoid querying the devices
+    of the users that don't have any. It's invalidated when a device is saved or
+    deleted, and when the push backend deactivates devices. The devices sent are
+    always queried, so a stale cache only costs a query.
+    """
+
+    prefix: str = "snitch"
+    cache_alias: str
+    timeout: int
+
+    def __init__(
+        self,
+        cache_alias: str = PUSH_DEVICE_CACHE_ALIAS,
+        timeout: int = PUSH_DEVICE_CACHE_TIMEOUT,
+    ) -> None:
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+
+    @property
+    def _cache(self) -> Any:
+        """Gets the cache proxy using the alias."""
+        return caches[self.cache_alias]
+
+    def _key(
+        self, device_class: Type["GCMDevice"] | Type["APNSDevice"], user_pk: Any
+    ) -> str:
+        """Gets the cache key for the devices of the user."""
+        return f"{self.prefix}-devices-{device_class._meta.label_lower}-{user_pk}"
+
+    def get(
+        self, device_class: Type["GCMDevice"] | Type["APNSDevice"], user_pk: Any
+    ) -> bool | None:
+        """Gets if the user has active devices, or None if it is not cached."""
+        return self._cache.get(self._key(device_class, user_pk))
+
+    def set(
+        self,
+        device_class: Type["GCMDevice"] | Type["APNSDevice"],
+        user_pk: Any,
+        has_devices: bool,
+    ) -> None:
+        """Caches if the user has active devices."""
+        self._cache.set(self._key(device_class, user_pk), has_devices, self.timeout)
+
+    def invalidate(
+        self, device_class: Type["GCMDevice"] | Type["APNSDevice"], user_pks: Iterable
+    ) -> None:
+        """Removes the cached entries of the given users."""
+        keys = [
+            self._key(device_class, user_pk)
+            for user_pk in set(user_pks)
+            if user_pk is not None
+        ]
+        if keys:
+            self._cache.delete_many(keys)
+
+
+def remember_device_user(
+    sender: Type["GCMDevice"] | Type["APNSDevice"],
+    instance: "models.Model",
+    **kwargs,
+) -> None:
+    """Signal receiver to remember the user of a device when it's loaded, so the
+    cache of the previous user is invalidated too if the device changes of user.
+    """
+    instance._snitch_user_id = getattr(instance, "user_id", None)  # type: ignore
+
+
+def invalidate_device_cache(
+    sender: Type["GCMDevice"] | Type["APNSDevice"],
+    instance: "models.Model",
+    **kwargs,
+) -> None:
+    """Signal receiver to invalidate the cache when a device is saved or deleted,
+    for the current and the previous user of the device.
+    """
+    user_pk = getattr(instance, "user_id", None)
+    device_cache.invalidate(
+        sender, [user_pk, getattr(instance, "_snitch_user_id", user_pk)]
+    )
+    instance._snitch_user_id = user_pk  # type: ignore
+
+
+# This global object represents the cache of devices
+device_cache: DeviceCache = DeviceCache()
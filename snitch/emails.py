@@ -1,15 +1,77 @@
-import re
+import hashlib
+import logging
+import smtplib
 import warnings
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import islice
+from typing import Any, Iterable, Iterator
 
-import bleach
 from django.conf import settings
 from django.contrib.sites.models import Site
-from django.core.mail import EmailMultiAlternatives
+from django.core.cache import caches
+from django.core.mail import EmailMessage, EmailMultiAlternatives, get_connection
 from django.template.loader import render_to_string
 from django.utils import translation
+from django.utils.html import conditional_escape
 
-from snitch.settings import ENABLED_SEND_EMAILS
-from snitch.tasks import send_email_asynchronously
+from snitch.converters import PlainTextConverter, get_plain_text_converter
+from snitch.loaders import template_cache
+from snitch.settings import (
+    EMAIL_ASYNC_SMTP,
+    EMAIL_BATCH_SIZE,
+    EMAIL_RENDER_CACHE_ALIAS,
+    EMAIL_RENDER_CACHE_TIMEOUT,
+    EMAIL_SUPPRESSION,
+    EMAIL_TEMPLATE_CACHE,
+    ENABLED_SEND_EMAILS,
+)
+from snitch.storages import get_body_store
+from snitch.suppressions import normalize_email, suppression_list
+from snitch.tasks import send_batch_email_asynchronously, send_email_asynchronously
+
+logger = logging.getLogger(__name__)
+
+# Emails collected by email_batch, with if they are sent asynchronously
+_collected_emails: ContextVar[
+    list[tuple["TemplateEmailMessage", bool]] | None
+] = ContextVar("snitch_collected_emails", default=None)
+
+
+def send_messages(
+    messages: Iterable[EmailMessage],
+    batch_size: int = EMAIL_BATCH_SIZE,
+    connection: Any | None = None,
+) -> int:
+    """Sends the messages reusing the same connection for each batch of the given
+    size. If the connection is lost, it reconnects and tries again the message that
+    failed, so the messages already sent are not duplicated. Returns the number of
+    messages sent. With the asyncio SMTP client enabled, and without a given
+    connection, the messages of each batch are sent concurrently.
+    """
+    messages = iter(messages)
+    sent = 0
+    if connection is None and EMAIL_ASYNC_SMTP:
+        from snitch.smtp import smtp_client
+
+        while batch := list(islice(messages, batch_size)):
+            sent += smtp_client.send(batch)
+        return sent
+    connection = connection or get_connection()
+    while batch := list(islice(messages, batch_size)):
+        connection.open()
+        try:
+            for message in batch:
+                try:
+                    sent += connection.send_messages([message]) or 0
+                except (smtplib.SMTPServerDisconnected, ConnectionError) as exception:
+                    logger.warning("Reconnecting to send an email: %s", str(exception))
+                    connection.close()
+                    connection.open()
+                    sent += connection.send_messages([message]) or 0
+        finally:
+            connection.close()
+    return sent
 
 
 class TemplateEmailMessage:
@@ -22,6 +84,8 @@ class TemplateEmailMessage:
     default_from_email: str = ""
     fake: bool = False
     use_i18n: bool = False
+    # Converter of the plain version, the one in the settings if not set
+    plain_text_converter: PlainTextConverter | None = None
 
     def __init__(
         self,
@@ -34,6 +98,8 @@ class TemplateEmailMessage:
         reply_to: str | list | None = None,
         bcc: str | list | None = None,
         cc: str | list | None = None,
+        recipient_context: dict | None = None,
+        shared_key: str | None = None,
     ):
         self.template_name = (
             self.default_template_name if template_name is None else template_name
@@ -63,6 +129,65 @@ class TemplateEmailMessage:
         self.from_email = self.default_from_email if from_email is None else from_email
         self.attaches = [] if attaches is None else attaches
         self.default_context = {} if context is None else context
+        # Context that changes for each recipient, replaced in the message rendered
+        # once for all the emails with the same shared key
+        self.recipient_context = {} if recipient_context is None else recipient_context
+        self.shared_key = shared_key
+
+    def recipients(self) -> list[str]:
+        """Gets all the recipients of the email."""
+        return [
+            address
+            for address in [*self.to, *(self.cc or []), *(self.bcc or [])]
+            if address
+        ]
+
+    def remove_suppressed(self, suppressed: set[str]) -> bool:
+        """Removes the suppressed addresses from the recipients. Returns if there
+        are recipients left.
+        """
+        for attr_name in ["to", "cc", "bcc"]:
+            addresses = getattr(self, attr_name)
+            if addresses:
+                setattr(
+                    self,
+                    attr_name,
+                    [
+                        address
+                        for address in addresses
+                        if not address or normalize_email(address) not in suppressed
+                    ],
+                )
+        return bool(self.recipients())
+
+    @classmethod
+    def suppressed(cls, addresses: Iterable[str]) -> set[str]:
+        """Gets the given addresses that are suppressed, checking all of them at
+        once. The results are cached, so it can be used to check in advance the
+        recipients of the emails that will be sent.
+        """
+        if not EMAIL_SUPPRESSION:
+            return set()
+        return suppression_list.suppressed(addresses)
+
+    @classmethod
+    def without_suppressed(
+        cls, emails: Iterable["TemplateEmailMessage"], batch_size: int
+    ) -> Iterator["TemplateEmailMessage"]:
+        """Checks the recipients of each batch of emails at once, before rendering
+        them, and yields the emails with recipients that are not suppressed.
+        """
+        emails = iter(email for email in emails if email.recipients())
+        while batch := list(islice(emails, batch_size)):
+            if not EMAIL_SUPPRESSION:
+                yield from batch
+                continue
+            suppressed = cls.suppressed(
+                address for email in batch for address in email.recipients()
+            )
+            for email in batch:
+                if not suppressed or email.remove_suppressed(suppressed):
+                    yield email
 
     def get_language(self) -> str:
         """Gets the language for the email."""
@@ -75,84 +200,250 @@ class TemplateEmailMessage:
         self.default_context.update({"site": current_site})
         return self.default_context
 
+    def render_template(self, context: dict) -> str:
+        """Renders the template, compiled only once in the process if the cache of
+        templates is enabled.
+        """
+        if EMAIL_TEMPLATE_CACHE:
+            return template_cache.render(self.template_name, context)
+        return render_to_string(self.template_name, context, using="django")
+
     def preview(self) -> str:
         """Renders the message for a preview."""
         context = self.get_context()
-        message = render_to_string(self.template_name, context, using="django")
+        message = self.render_template(context)
         return message
 
     def get_message(self) -> str:
         """Gets the message."""
         context = self.get_context()
-        message = render_to_string(self.template_name, context, using="django")
+        message = self.render_template(context)
         return message
 
     def get_plain_message(self, message: str | None = None) -> str:
         """Gets a plain version of the message."""
         if message is None:
             message = self.get_message()
-        message_plain = re.sub(r"[\t\n\r\f\v]", "", message)
-        message_plain = re.sub(
-            "<style.*?>.+</style>", "", message_plain
-        )  # Special case for style tag
-        message_plain = message_plain.replace("</p>", "\n")
-        message_plain = message_plain.replace("</h1>", "\n\n")
-        message_plain = bleach.clean(message_plain, strip=True)
-        return message_plain.strip()
+        converter = self.plain_text_converter or get_plain_text_converter()
+        return converter.convert(message)
+
+    def _placeholder(self, key: str) -> str:
+        """Gets the placeholder used to render a recipient context value."""
+        return f"%%snitch-{key}%%"
+
+    def _shared_cache_key(self) -> str:
+        """Gets the cache key of the message rendered for the shared key."""
+        key = (
+            f"snitch-email-{self.shared_key}-{self.template_name}-"
+            f"{translation.get_language()}"
+        )
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def get_shared_messages(self) -> tuple[str, str]:
+        """Gets the message and its plain version rendering the template only once
+        for all the emails with the same shared key, and replacing then the values
+        of the recipient context. These values should be rendered in the template
+        as they are, without filters or attribute lookups.
+        """
+        cache = caches[EMAIL_RENDER_CACHE_ALIAS]
+        cache_key = self._shared_cache_key()
+        shared = cache.get(cache_key)
+        if shared is None:
+            self.default_context.update(
+                {key: self._placeholder(key) for key in self.recipient_context}
+            )
+            message = self.get_message()
+            shared = (message, self.get_plain_message(message))
+            cache.set(cache_key, shared, EMAIL_RENDER_CACHE_TIMEOUT)
+        message, message_plain = shared
+        for key, value in self.recipient_context.items():
+            value = conditional_escape(value)
+            message = message.replace(self._placeholder(key), value)
+            message_plain = message_plain.replace(
+                self._placeholder(key), self.get_plain_message(value)
+            )
+        return message, message_plain
 
     def async_send(self, message, message_plain):
         if not self.fake:
-            send_email_asynchronously.delay(
-                self.subject,
-                message_plain,
-                message,
-                self.from_email,
-                self.to,
-                self.cc,
-                self.bcc,
-                self.reply_to,
-            )
-            if self.attaches:
+            store = get_body_store()
+            if store is None:
+                send_email_asynchronously.delay(
+                    self.subject,
+                    message_plain,
+                    message,
+                    self.from_email,
+                    self.to,
+                    self.cc,
+                    self.bcc,
+                    self.reply_to,
+                )
+            else:
+                send_email_asynchronously.delay(
+                    self.subject,
+                    store.put(message_plain),
+                    store.put(message),
+                    self.from_email,
+                    self.to,
+                    self.cc,
+                    self.bcc,
+                    self.reply_to,
+                    stored=True,
+                    attaches=store.put_attaches(self.attaches),
+                )
+            if self.attaches and store is None:
                 warnings.warn(
                     "Attaches will not added to the email, use async=False to send "
                     "attaches."
                 )
 
+    def build(self, message: str, message_plain: str) -> EmailMultiAlternatives:
+        """Builds the email with the rendered messages."""
+        email = EmailMultiAlternatives(
+            subject=self.subject,
+            body=message_plain,
+            bcc=self.bcc,
+            cc=self.cc,
+            from_email=self.from_email,
+            to=self.to,
+            reply_to=self.reply_to,
+        )
+        email.attach_alternative(message, "text/html")
+        for attach in self.attaches:
+            attach_file_name, attach_content, attach_content_type = attach
+            email.attach(attach_file_name, attach_content, attach_content_type)
+        return email
+
     def sync_send(self, message, message_plain):
         if not self.fake:
-            email = EmailMultiAlternatives(
-                subject=self.subject,
-                body=message_plain,
-                bcc=self.bcc,
-                cc=self.cc,
-                from_email=self.from_email,
-                to=self.to,
-                reply_to=self.reply_to,
-            )
-            email.attach_alternative(message, "text/html")
-            for attach in self.attaches:
-                attach_file_name, attach_content, attach_content_type = attach
-                email.attach(attach_file_name, attach_content, attach_content_type)
-            email.send()
-
-    def send(self, use_async: bool = True, language: str | None = None):
-        """Sends the email at the moment or using a Celery task."""
-        if not ENABLED_SEND_EMAILS:
-            return
+            self.build(message, message_plain).send()
 
-        use_async = not self.attaches and use_async
+    def render(self) -> tuple[str, str]:
+        """Renders the message and its plain version, in the language of the email."""
         if self.use_i18n and settings.USE_I18N:
             language = self.get_language()
             translation.activate(language)
         self.subject = "%s" % self.subject
+        if self.shared_key is not None and self.recipient_context:
+            return self.get_shared_messages()
+        self.default_context.update(self.recipient_context)
         message = self.get_message()
         message_plain = self.get_plain_message(message)
+        return message, message_plain
+
+    @classmethod
+    def async_send_batch(
+        cls, emails: Iterable["TemplateEmailMessage"], batch_size: int
+    ) -> int:
+        """Renders the emails and enqueues them in tasks of the given size. The
+        identical bodies are sent only once in each task. Returns the number of
+        emails enqueued.
+        """
+        enqueued = 0
+        store = get_body_store()
+        emails = iter(emails)
+        while batch := list(islice(emails, batch_size)):
+            bodies: dict[tuple[str, str], int] = {}
+            payloads = []
+            for email in batch:
+                if email.fake:
+                    continue
+                message, message_plain = email.render()
+                body = bodies.setdefault((message_plain, message), len(bodies))
+                payload = {
+                    "subject": email.subject,
+                    "body": body,
+                    "from_email": email.from_email,
+                    "to": email.to,
+                    "cc": email.cc,
+                    "bcc": email.bcc,
+                    "reply_to": email.reply_to,
+                }
+                if email.attaches and store is not None:
+                    payload["attaches"] = store.put_attaches(email.attaches)
+                payloads.append(payload)
+                if email.attaches and store is None:
+                    warnings.warn(
+                        "Attaches will not added to the email, use async=False to "
+                        "send attaches."
+                    )
+            if payloads:
+                body_list = [list(body) for body in bodies]
+                if store is not None:
+                    body_list = [
+                        [store.put(part) for part in body] for body in body_list
+                    ]
+                send_batch_email_asynchronously.delay(
+                    body_list, payloads, stored=store is not None
+                )
+                enqueued += len(payloads)
+        return enqueued
+
+    @classmethod
+    def send_batch(
+        cls,
+        emails: Iterable["TemplateEmailMessage"],
+        batch_size: int = EMAIL_BATCH_SIZE,
+        use_async: bool = False,
+    ) -> int:
+        """Renders and sends the emails reusing a single connection, at the moment
+        or using Celery tasks. Returns the number of emails sent or enqueued.
+        """
+        if not ENABLED_SEND_EMAILS:
+            return 0
+        emails = cls.without_suppressed(emails, batch_size)
+        if use_async:
+            return cls.async_send_batch(emails, batch_size=batch_size)
+        return send_messages(
+            (email.build(*email.render()) for email in emails if not email.fake),
+            batch_size=batch_size,
+        )
+
+    def send(self, use_async: bool = True, language: str | None = None):
+        """Sends the email at the moment or using a Celery task, or at the end of the
+        block of ``email_batch`` if there is one."""
+        if not ENABLED_SEND_EMAILS:
+            return
+        # Attaches can only be sent in the task using the store
+        use_async = use_async and (not self.attaches or get_body_store() is not None)
+        collected = _collected_emails.get()
+        if collected is not None:
+            collected.append((self, use_async))
+            return
+        if not list(self.without_suppressed([self], batch_size=1)):
+            return
+
+        message, message_plain = self.render()
         if use_async:
             self.async_send(message, message_plain)
         else:
             self.sync_send(message, message_plain)
 
 
+@contextmanager
+def email_batch(batch_size: int = EMAIL_BATCH_SIZE) -> Iterator[None]:
+    """Collects the emails sent in the block, and sends them at the end with
+    ``TemplateEmailMessage.send_batch``, reusing the connection for the ones sent at
+    the moment, and sharing the Celery tasks for the asynchronous ones. The emails
+    of a nested block are sent by the outer one.
+    """
+    if _collected_emails.get() is not None:
+        yield
+        return
+    emails: list[tuple[TemplateEmailMessage, bool]] = []
+    token = _collected_emails.set(emails)
+    try:
+        yield
+    finally:
+        _collected_emails.reset(token)
+        for use_async in [False, True]:
+            batch = [email for email, is_async in emails if is_async == use_async]
+            if batch:
+                TemplateEmailMessage.send_batch(
+                    batch, batch_size=batch_size, use_async=use_async
+                )
+
+
 class AdminsTemplateEmailMessage(TemplateEmailMessage):
     """Emails only for admins."""
 
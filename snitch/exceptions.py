@@ -8,3 +8,15 @@ class HandlerError(SnitchError):
 
 class AlreadyRegistered(SnitchError):
     """Event handlers already register."""
+
+
+class InvalidCursor(SnitchError):
+    """The cursor of a page of notifications is not valid."""
+
+
+class InvalidPageSize(SnitchError):
+    """The size of a page of notifications is not valid."""
+
+
+class InvalidArchive(SnitchError):
+    """The archive of notifications doesn't match its manifest or the database."""
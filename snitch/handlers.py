@@ -1,3 +1,4 @@
+from itertools import islice
 from typing import TYPE_CHECKING, Tuple, Type
 
 from django.apps import apps
@@ -13,6 +14,12 @@ from snitch.helpers import (
     get_notification_model,
     send_event_to_user,
 )
+from snitch.settings import (
+    EMAIL_BATCH_SIZE,
+    EMAIL_DIGEST_INTERVAL,
+    RETENTION_DAYS,
+    RETENTION_READ_DAYS,
+)
 from snitch.tasks import create_notification_task
 
 if TYPE_CHECKING:  # pragma: no cover
@@ -35,12 +42,18 @@ class EventHandler:
     notification_creation_async: bool = False
     notification_backends: list[Type["AbstractBackend"]] = []
 
+    # Retention, in days
+    retention_days: int | None = RETENTION_DAYS
+    read_retention_days: int | None = RETENTION_READ_DAYS
+
     # Cool down
     cool_down_manager_class: Type["AbstractCoolDownManager"] | None = None
 
     # Email backend
     template_email_async: bool = False
     template_email_kwargs: dict = {}
+    template_email_recipient_keys: list[str] = []
+    template_email_digest_interval: int = EMAIL_DIGEST_INTERVAL
 
     # Push notification backend
     action_attribute: str = "actor"
@@ -200,20 +213,33 @@ class EventHandler:
         into the database.
         """
         if not self.ephemeral:
+            from snitch.emails import email_batch
+
             # Creates a notification
             ContentType = apps.get_model("contenttypes.ContentType")
             Notification = get_notification_model()
-            for receiver in self.audience().iterator():
-                if self.should_notify(receiver=receiver):
-                    if self.notification_creation_async:
-                        create_notification_task.delay(
-                            self.event.pk,
-                            receiver.id,
-                            ContentType.objects.get_for_model(receiver).pk,
-                        )
-                    else:
-                        notification = Notification(event=self.event, receiver=receiver)
-                        notification.save()
+            receivers = self.audience().iterator()
+            while batch := list(islice(receivers, EMAIL_BATCH_SIZE)):
+                # The backends can fetch at once what they need for the batch
+                for backend_class in self.notification_backends:
+                    backend_class.prefetch(batch)
+                # The emails of the notifications sent in the process are sent
+                # together for each batch
+                with email_batch():
+                    for receiver in batch:
+                        if not self.should_notify(receiver=receiver):
+                            continue
+                        if self.notification_creation_async:
+                            create_notification_task.delay(
+                                self.event.pk,
+                                receiver.id,
+                                ContentType.objects.get_for_model(receiver).pk,
+                            )
+                        else:
+                            notification = Notification(
+                                event=self.event, receiver=receiver
+                            )
+                            notification.save()
         else:
             # Only sends the event to the user
             for user in self.audience().iterator():
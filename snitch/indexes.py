@@ -0,0 +1,15 @@
+from django.db import models
+from django.db.models import Q
+
+
+class PartialIndex(models.Index):
+    """An index with a condition that can be unnamed, to be named with the model
+    like the rest of unnamed indexes, with a short name of fixed length. It's
+    useful for the indexes of abstract models, whose names depend on the model.
+    """
+
+    suffix = "prt"
+
+    def __init__(self, *args, condition: Q | None = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.condition = condition
@@ -0,0 +1,112 @@
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+from django.core.cache import caches
+
+
+class QuotaLimiter:
+    """A token bucket shared by all the workers, that uses the Django cache to limit
+    the number of requests sent to a provider. The bucket holds up to the given
+    number of tokens, and it is refilled continuously at a rate of that number of
+    tokens for each period of time. Tokens can also be reserved in advance, leaving
+    the bucket in debt, so the reservations are spread over time in order.
+    """
+
+    prefix: str = "snitch"
+    name: str
+    tokens: int
+    period: int
+    cache_alias: str
+    lock_timeout: int = 5
+    lock_attempts: int = 50
+    lock_delay: float = 0.01
+
+    def __init__(
+        self, name: str, tokens: int, period: int = 1, cache_alias: str = "default"
+    ) -> None:
+        self.name = name
+        self.tokens = tokens
+        self.period = period
+        self.cache_alias = cache_alias
+
+    @property
+    def _cache(self) -> Any:
+        """Gets the cache proxy using the alias."""
+        return caches[self.cache_alias]
+
+    @property
+    def rate(self) -> float:
+        """Gets the number of tokens refilled each second."""
+        return self.tokens / self.period
+
+    def _key(self) -> str:
+        """Get the cache key of the bucket."""
+        return f"{self.prefix}-quota-{self.name}"
+
+    @contextmanager
+    def _lock(self) -> Iterator[None]:
+        """Serializes the updates of the bucket between the workers. If the lock
+        can't be acquired in time, the bucket is updated anyway.
+        """
+        lock_key = f"{self._key()}-lock"
+        locked = False
+        for _ in range(self.lock_attempts):
+            locked = self._cache.add(lock_key, 1, self.lock_timeout)
+            if locked:
+                break
+            time.sleep(self.lock_delay)
+        try:
+            yield
+        finally:
+            if locked:
+                self._cache.delete(lock_key)
+
+    def _available(self, now: float) -> float:
+        """Gets the number of tokens in the bucket at the given time, that is negative
+        while there are reservations not refilled yet."""
+        state = self._cache.get(self._key())
+        if state is None:
+            return float(self.tokens)
+        available, updated = state
+        return min(float(self.tokens), available + (now - updated) * self.rate)
+
+    def _store(self, available: float, now: float) -> None:
+        """Stores the tokens of the bucket, until it would be full again."""
+        timeout = int((self.tokens - available) / self.rate) + 1
+        self._cache.set(self._key(), (available, now), timeout)
+
+    def wait_time(self, tokens: int = 1) -> float:
+        """Gets the number of seconds until the given number of tokens are refilled,
+        after the ones already reserved.
+        """
+        missing = tokens - self._available(time.time())
+        return max(0.0, missing / self.rate)
+
+    def acquire(self, tokens: int = 1) -> int:
+        """Tries to consume the given number of tokens, and returns the number of
+        tokens granted, that could be less than the requested if the bucket has not
+        enough tokens.
+        """
+        if tokens <= 0:
+            return 0
+        with self._lock():
+            now = time.time()
+            available = self._available(now)
+            granted = max(0, min(tokens, int(available)))
+            self._store(available - granted, now)
+        return granted
+
+    def reserve(self, tokens: int, max_wait: float | None = None) -> float | None:
+        """Consumes in advance the given number of tokens, after the ones already
+        reserved, and returns the number of seconds until they are refilled. Nothing
+        is reserved, and None is returned, if that is longer than the maximum wait.
+        """
+        with self._lock():
+            now = time.time()
+            available = self._available(now)
+            wait = max(0.0, (tokens - available) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                return None
+            self._store(available - tokens, now)
+        return wait
@@ -0,0 +1,107 @@
+import logging
+import threading
+from typing import Any, Iterable
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+
+from snitch.settings import EMAIL_DIGEST_TEMPLATE
+
+logger = logging.getLogger(__name__)
+
+
+class TemplateCache:
+    """Cache of the compiled templates of the emails in the process, by template
+    name, so the templates are not compiled again for each email when the cached
+    loader of Django is not configured. The translations are applied when the
+    templates are rendered, so a compiled template serves all the languages. It
+    counts the hits and the misses to be monitored.
+    """
+
+    using: str
+    hits: int
+    misses: int
+
+    def __init__(self, using: str = "django") -> None:
+        self.using = using
+        self.hits = 0
+        self.misses = 0
+        self._templates: dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def get(self, template_name: str) -> Any:
+        """Gets the compiled template."""
+        template = self._templates.get(template_name)
+        with self._lock:
+            if template is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if template is None:
+            template = get_template(template_name, using=self.using)
+            self._templates[template_name] = template
+        return template
+
+    def render(self, template_name: str, context: dict) -> str:
+        """Renders the template with the context."""
+        return self.get(template_name).render(context)
+
+    def warm(self, template_names: Iterable[str]) -> int:
+        """Compiles the templates, and loads the current site. Returns the number of
+        templates compiled.
+        """
+        compiled = 0
+        for template_name in set(template_names):
+            if template_name in self._templates:
+                continue
+            try:
+                self._templates[template_name] = get_template(
+                    template_name, using=self.using
+                )
+            except TemplateDoesNotExist:
+                logger.warning("Email template %s doesn't exist", template_name)
+                continue
+            compiled += 1
+        if "django.contrib.sites" in settings.INSTALLED_APPS and hasattr(
+            settings, "SITE_ID"
+        ):
+            Site.objects.get_current()
+        return compiled
+
+    def stats(self) -> dict[str, int]:
+        """Gets the hits, the misses and the number of cached templates."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._templates)}
+
+    def clear(self) -> None:
+        """Removes the cached templates and resets the counters."""
+        with self._lock:
+            self._templates = {}
+            self.hits = 0
+            self.misses = 0
+
+
+def handler_template_names() -> list[str]:
+    """Gets the email templates referenced by the registered handlers."""
+    from snitch.backends import DigestEmailNotificationBackend
+    from snitch.handlers import manager
+
+    template_names = []
+    for handler_class in manager._registry.values():
+        template_name = handler_class.template_email_kwargs.get("template_name")
+        if template_name:
+            template_names.append(template_name)
+        if DigestEmailNotificationBackend in handler_class.notification_backends:
+            template_names.append(EMAIL_DIGEST_TEMPLATE)
+    return template_names
+
+
+def warm_template_cache(**kwargs) -> None:
+    """Signal receiver to warm the cache of templates when a worker starts."""
+    compiled = template_cache.warm(handler_template_names())
+    logger.info("Compiled %d email templates", compiled)
+
+
+# This global object keeps the compiled templates of the process
+template_cache: TemplateCache = TemplateCache()
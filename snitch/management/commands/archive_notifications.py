@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+from snitch.archives import Archiver
+from snitch.exceptions import InvalidArchive
+from snitch.settings import ARCHIVE_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports the notifications and the events created before a date to "
+        "compressed JSON lines files, or verifies an exported archive."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", help="Directory of the archive.")
+        parser.add_argument(
+            "--days",
+            type=int,
+            help="Archives the rows created more than these days ago.",
+        )
+        parser.add_argument(
+            "--before",
+            type=datetime.fromisoformat,
+            help="Archives the rows created before this date, in ISO format.",
+        )
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Verifies the archive in the directory, instead of exporting it.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=ARCHIVE_BATCH_SIZE,
+            help="Number of rows read in each batch.",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Database used to read the notifications.",
+        )
+
+    def handle(self, *args, **options):
+        archiver = Archiver(batch_size=options["batch_size"])
+        if options["verify"]:
+            try:
+                manifest = archiver.verify(
+                    options["directory"], using=options["database"]
+                )
+            except InvalidArchive as error:
+                raise CommandError(str(error))
+            self.stdout.write(f"Archive of rows before {manifest['before']} is valid.")
+            return None
+        if options["before"] is not None:
+            before = options["before"]
+            if timezone.is_naive(before):
+                before = timezone.make_aware(before)
+        elif options["days"] is not None:
+            before = timezone.now() - timedelta(days=options["days"])
+        else:
+            raise CommandError("The date is required, with --days or --before.")
+        manifest = archiver.export(
+            options["directory"], before=before, using=options["database"]
+        )
+        for name, archived in manifest["files"].items():
+            self.stdout.write(f"{archived['rows']} {name} archived.")
+        return None
@@ -0,0 +1,58 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from snitch.archives import Archiver
+from snitch.exceptions import InvalidArchive
+from snitch.retention import Pruner
+from snitch.settings import RETENTION_BATCH_SIZE, RETENTION_SLEEP
+
+
+class Command(BaseCommand):
+    help = "Deletes the notifications and the events out of the retention."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=RETENTION_BATCH_SIZE,
+            help="Size of the ranges of IDs deleted in each batch.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=RETENTION_SLEEP,
+            help="Seconds to wait between batches.",
+        )
+        parser.add_argument(
+            "--archive",
+            help=(
+                "Directory of an archive, verified before deleting. Only the rows "
+                "created before the date of the archive are deleted."
+            ),
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Database used to delete the notifications.",
+        )
+
+    def handle(self, *args, **options):
+        before = None
+        if options["archive"]:
+            try:
+                manifest = Archiver().verify(
+                    options["archive"], using=options["database"]
+                )
+            except InvalidArchive as error:
+                raise CommandError(str(error))
+            before = datetime.fromisoformat(manifest["before"])
+        pruner = Pruner(
+            batch_size=options["batch_size"], sleep=options["sleep"], before=before
+        )
+        deleted = pruner.prune(using=options["database"])
+        self.stdout.write(
+            f"{deleted['notifications']} notifications and {deleted['events']} "
+            "events deleted."
+        )
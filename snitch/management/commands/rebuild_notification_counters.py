@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from snitch.counters import notification_counters
+
+
+class Command(BaseCommand):
+    help = "Counts again the unread and unreceived notifications of each receiver."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of receivers counted in each batch.",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Database used to count the notifications.",
+        )
+
+    def handle(self, *args, **options):
+        total = notification_counters.rebuild(
+            batch_size=options["batch_size"], using=options["database"]
+        )
+        self.stdout.write(f"Counters of {total} receivers rebuilt.")
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from snitch.helpers import get_notification_model
+from snitch.settings import RENDER_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Renders the snapshot of the notifications not rendered yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=RENDER_BATCH_SIZE,
+            help="Number of notifications rendered in each batch.",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Database used to render the notifications.",
+        )
+
+    def handle(self, *args, **options):
+        Notification = get_notification_model()
+        total = Notification.objects.using(options["database"]).render(
+            batch_size=options["batch_size"]
+        )
+        self.stdout.write(f"{total} notifications rendered.")
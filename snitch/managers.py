@@ -1,12 +1,109 @@
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Iterable
+
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractBaseUser
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
+from django.db.models.query import ModelIterable
+from django.utils import timezone
+
+from snitch.exceptions import InvalidPageSize
+from snitch.pagination import FeedPage, decode_cursor, encode_cursor
+from snitch.settings import (
+    NOTIFICATION_COUNTERS,
+    NOTIFICATION_SNAPSHOT,
+    RENDER_BATCH_SIZE,
+)
+
+logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
+# Generic relations of the events
+EVENT_OBJECTS: tuple[str, ...] = ("actor", "trigger", "target")
+
+
+def prefetch_event_objects(events: Iterable[Any], using: str | None = None) -> None:
+    """Gets the actors, triggers and targets of the events, with a single query for
+    each content type, and caches them in the events.
+    """
+    events = [event for event in events if event is not None]
+    if not events:
+        return None
+    fields = [events[0]._meta.get_field(name) for name in EVENT_OBJECTS]
+    object_ids: dict[int, set] = defaultdict(set)
+    for event in events:
+        for field in fields:
+            content_type_id = getattr(event, field.ct_field + "_id")
+            object_id = getattr(event, field.fk_field)
+            if content_type_id is not None and object_id is not None:
+                object_ids[content_type_id].add(object_id)
+    objects: dict[tuple[int, Any], models.Model] = {}
+    for content_type_id, ids in object_ids.items():
+        model = (
+            ContentType.objects.db_manager(using).get_for_id(content_type_id)
+        ).model_class()
+        if model is None:
+            continue
+        for obj in model._base_manager.using(using).filter(pk__in=ids):
+            objects[(content_type_id, obj.pk)] = obj
+    for event in events:
+        for field in fields:
+            content_type_id = getattr(event, field.ct_field + "_id")
+            object_id = getattr(event, field.fk_field)
+            obj = objects.get((content_type_id, object_id))
+            if obj is None and content_type_id is not None and object_id is not None:
+                # Not found, the relation will get it lazily
+                continue
+            field.set_cached_value(event, obj)
+    return None
+
+
+class EventObjectsQuerySet(models.QuerySet):
+    """Base queryset that can get the generic relations of the events when it's
+    evaluated, grouping the objects of all the events by content type.
+    """
+
+    _event_objects: bool = False
+
+    def _events(self, results: list) -> Iterable[Any]:
+        """A subclass should get the events of the results."""
+        raise NotImplementedError
+
+    def _clone(self) -> "EventObjectsQuerySet":
+        clone = super()._clone()
+        clone._event_objects = self._event_objects
+        return clone
+
+    def _fetch_all(self) -> None:
+        fetched = self._result_cache is None
+        super()._fetch_all()
+        if (
+            fetched
+            and self._event_objects
+            and issubclass(self._iterable_class, ModelIterable)
+        ):
+            prefetch_event_objects(self._events(self._result_cache), using=self.db)
+
+
+class EventQuerySet(EventObjectsQuerySet):
+    def _events(self, results: list) -> Iterable[Any]:
+        return results
+
+    def with_event_objects(self) -> "EventQuerySet":
+        """Gets the actors, triggers and targets of the events, with a query for
+        each content type.
+        """
+        clone = self._chain()
+        clone._event_objects = True
+        return clone
+
 
-class NotificationQuerySet(models.QuerySet):
+class NotificationQuerySet(EventObjectsQuerySet):
     def accessible(self, user: AbstractBaseUser) -> "NotificationQuerySet":
         """Gets the notifications accessible by the given user."""
         if not user.is_authenticated:
@@ -19,3 +116,146 @@ class NotificationQuerySet(models.QuerySet):
     def unread(self) -> "NotificationQuerySet":
         """Gets the unread notifications."""
         return self.filter(read=False)
+
+    def _events(self, results: list) -> Iterable[Any]:
+        return [notification.event for notification in results]
+
+    def with_event_objects(self) -> "NotificationQuerySet":
+        """Gets the events of the notifications in the same query, and their actors,
+        triggers and targets with a query for each content type.
+        """
+        clone = self.select_related("event")
+        clone._event_objects = True
+        return clone
+
+    def after(self, cursor: str | None = None) -> "NotificationQuerySet":
+        """Gets the notifications after the cursor, from newest to oldest. The
+        cursor is the creation date and the ID of the last notification of the
+        previous page, so the query uses the feed index at any depth, and the
+        ordering is read from the index, that ends with both of them.
+        """
+        notifications = self.order_by("-created", "-pk")
+        if cursor is None:
+            return notifications
+        created, pk = decode_cursor(cursor)
+        return notifications.filter(created__lte=created).filter(
+            Q(created__lt=created) | Q(pk__lt=pk)
+        )
+
+    def page(self, cursor: str | None = None, size: int = 20) -> FeedPage:
+        """Gets a page of notifications after the cursor, with their events, unless
+        the notifications are rendered when created. The size must be at least 1."""
+        if size < 1:
+            raise InvalidPageSize(f"The page size {size} is not valid.")
+        notifications = self.after(cursor)
+        if not NOTIFICATION_SNAPSHOT:
+            notifications = notifications.with_event_objects()
+        notifications = list(notifications[: size + 1])
+        next_cursor = None
+        if len(notifications) > size:
+            notifications = notifications[:size]
+            next_cursor = encode_cursor(notifications[-1].created, notifications[-1].pk)
+        return FeedPage(notifications, next_cursor)
+
+    def render(self, batch_size: int = RENDER_BATCH_SIZE) -> int:
+        """Renders the snapshot of the notifications not rendered yet, in batches by
+        ID. The notifications that fail to render are logged and skipped. Returns the
+        number of notifications rendered.
+        """
+        fields = ["title", "text", "action_type", "action_id", "extra_data"]
+        notifications = (
+            self.filter(rendered_at__isnull=True)
+            .order_by("pk")
+            .select_related("receiver_content_type")
+            .prefetch_related("receiver")
+            .with_event_objects()
+        )
+        total, last = 0, None
+        while True:
+            batch = notifications
+            if last is not None:
+                batch = batch.filter(pk__gt=last)
+            batch = list(batch[:batch_size])
+            if not batch:
+                break
+            last = batch[-1].pk
+            rendered = []
+            for notification in batch:
+                try:
+                    notification.render()
+                except Exception:
+                    logger.exception(
+                        "Error rendering the notification %s", notification.pk
+                    )
+                    continue
+                rendered.append(notification)
+            self.model._base_manager.using(self.db).bulk_update(
+                rendered, fields + ["rendered_at"]
+            )
+            total += len(rendered)
+        return total
+
+    def mark_read(self) -> int:
+        """Marks the unread notifications as read in a single update, setting when
+        they were read. Returns the number of notifications marked.
+        """
+        return self.filter(read=False).update(read=True, read_at=timezone.now())
+
+    def mark_received(self) -> int:
+        """Marks the unreceived notifications as received in a single update,
+        setting when they were received. Returns the number of notifications marked.
+        """
+        return self.filter(received=False).update(
+            received=True, received_at=timezone.now()
+        )
+
+    def mark_all_read(
+        self, user: AbstractBaseUser, before: datetime | None = None
+    ) -> int:
+        """Marks as read all the notifications of the user, or only the ones created
+        before the given date. Returns the number of notifications marked.
+        """
+        notifications = self.accessible(user)
+        if before is not None:
+            notifications = notifications.filter(created__lte=before)
+        return notifications.mark_read()
+
+    def update(self, **kwargs) -> int:
+        """Updates the notifications, changing the counters of the receivers in the
+        same transaction if the read or received flags are updated. The rows are
+        locked first, so the changes are counted on the rows as they are updated,
+        and concurrent updates of the same rows wait and don't count them twice.
+        """
+        if not NOTIFICATION_COUNTERS or not {"read", "received"} & set(kwargs):
+            return super().update(**kwargs)
+        from snitch.counters import notification_counters
+
+        with transaction.atomic(using=self.db):
+            pks = list(
+                self.order_by()
+                .select_for_update(of=("self",))
+                .values_list("pk", flat=True)
+            )
+            locked = self.model._base_manager.using(self.db).filter(pk__in=pks)
+            if set(kwargs) <= {"read", "read_at", "received", "received_at"}:
+                # Only the flags change, so the rows that have them already are
+                # left as they are
+                locked = locked.exclude(
+                    **{
+                        field_name: kwargs[field_name]
+                        for field_name in ["read", "received"]
+                        if field_name in kwargs
+                    }
+                )
+            deltas = notification_counters.deltas(locked, kwargs)
+            receivers = (
+                notification_counters.receivers(locked) if deltas is None else []
+            )
+            updated = models.QuerySet.update(locked, **kwargs)
+            if deltas is None:
+                notification_counters.refresh(receivers, using=self.db)
+            else:
+                notification_counters.change(deltas, using=self.db)
+        return updated
+
+    update.alters_data = True  # type: ignore
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:39
+
+import django.utils.timezone
+import model_utils.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("snitch", "0009_notification_email_digest_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EmailSuppression",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created",
+                    model_utils.fields.AutoCreatedField(
+                        default=django.utils.timezone.now,
+                        editable=False,
+                        verbose_name="created",
+                    ),
+                ),
+                (
+                    "modified",
+                    model_utils.fields.AutoLastModifiedField(
+                        default=django.utils.timezone.now,
+                        editable=False,
+                        verbose_name="modified",
+                    ),
+                ),
+                (
+                    "email",
+                    models.EmailField(
+                        max_length=254, unique=True, verbose_name="email"
+                    ),
+                ),
+                (
+                    "reason",
+                    models.CharField(
+                        choices=[
+                            ("hard_bounce", "hard bounce"),
+                            ("complaint", "complaint"),
+                            ("manual", "manual"),
+                        ],
+                        default="hard_bounce",
+                        max_length=32,
+                        verbose_name="reason",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "email suppression",
+                "verbose_name_plural": "email suppressions",
+                "ordering": ("-created",),
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:43
+
+from django.db import migrations, models
+
+import snitch.indexes
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("snitch", "0010_emailsuppression"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                fields=["receiver_content_type", "receiver_id", "-created", "-id"],
+                name="snitch_noti_receive_8a5084_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="notification",
+            index=snitch.indexes.PartialIndex(
+                condition=models.Q(("read", False)),
+                fields=["receiver_content_type", "receiver_id", "-created", "-id"],
+                name="snitch_noti_receive_6c4e42_prt",
+            ),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:47
+
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("snitch", "0011_notification_feed_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NotificationCounter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created",
+                    model_utils.fields.AutoCreatedField(
+                        default=django.utils.timezone.now,
+                        editable=False,
+                        verbose_name="created",
+                    ),
+                ),
+                (
+                    "modified",
+                    model_utils.fields.AutoLastModifiedField(
+                        default=django.utils.timezone.now,
+                        editable=False,
+                        verbose_name="modified",
+                    ),
+                ),
+                (
+                    "receiver_id",
+                    models.PositiveIntegerField(verbose_name="receiver id"),
+                ),
+                (
+                    "unread",
+                    models.PositiveIntegerField(default=0, verbose_name="unread"),
+                ),
+                (
+                    "unreceived",
+                    models.PositiveIntegerField(default=0, verbose_name="unreceived"),
+                ),
+                (
+                    "receiver_content_type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="contenttypes.contenttype",
+                        verbose_name="receiver content type",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "notification counter",
+                "verbose_name_plural": "notification counters",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="notificationcounter",
+            constraint=models.UniqueConstraint(
+                fields=("receiver_content_type", "receiver_id"),
+                name="snitch_notification_counter_receiver",
+            ),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:15
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("snitch", "0014_adminjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notification",
+            name="action_id",
+            field=models.CharField(
+                blank=True, max_length=255, null=True, verbose_name="action id"
+            ),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="action_type",
+            field=models.CharField(
+                blank=True, max_length=255, null=True, verbose_name="action type"
+            ),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="extra_data",
+            field=models.JSONField(
+                blank=True,
+                encoder=django.core.serializers.json.DjangoJSONEncoder,
+                null=True,
+                verbose_name="extra data",
+            ),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="rendered_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="rendered at"
+            ),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="text",
+            field=models.TextField(blank=True, null=True, verbose_name="text"),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="title",
+            field=models.CharField(
+                blank=True, max_length=255, null=True, verbose_name="title"
+            ),
+        ),
+    ]
@@ -1,3 +1,6 @@
+import logging
+import pickle
+from itertools import islice
 from typing import TYPE_CHECKING
 
 from django.conf import settings
@@ -5,22 +8,33 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User as AuthUser
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
-from django.utils import translation
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, router, transaction
+from django.db.models import F, Max
+from django.db.models.functions import Least
+from django.utils import timezone, translation
 from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 from model_utils.models import TimeStampedModel
 
+from snitch.counters import notification_counters
 from snitch.handlers import manager
-from snitch.helpers import receiver_content_type_choices
-from snitch.managers import NotificationQuerySet
-from snitch.settings import NOTIFICATION_EAGER
+from snitch.helpers import get_notification_model, receiver_content_type_choices
+from snitch.indexes import PartialIndex
+from snitch.managers import EventQuerySet, NotificationQuerySet
+from snitch.settings import (
+    ADMIN_JOB_CHUNK_SIZE,
+    NOTIFICATION_COUNTERS,
+    NOTIFICATION_EAGER,
+    NOTIFICATION_SNAPSHOT,
+)
 
 if TYPE_CHECKING:  # pragma: no cover
     from snitch import EventHandler
     from snitch.backends import AbstractBackend
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 
 class EventType(models.Model):
@@ -92,6 +106,8 @@ class Event(TimeStampedModel):
 
     notified = models.BooleanField(_("notified"), default=False)
 
+    objects = EventQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("event")
         verbose_name_plural = _("events")
@@ -138,7 +154,24 @@ class AbstractNotification(TimeStampedModel):
     receiver_id = models.PositiveIntegerField(_("receiver id"), null=True)
     sent = models.BooleanField(_("sent"), default=False)
     received = models.BooleanField(_("received"), default=False)
+    received_at = models.DateTimeField(_("received at"), null=True, blank=True)
     read = models.BooleanField(_("read"), default=False)
+    read_at = models.DateTimeField(_("read at"), null=True, blank=True)
+    push_attempts = models.PositiveIntegerField(_("push attempts"), default=0)
+    push_delivered = models.PositiveIntegerField(_("push delivered"), default=0)
+    push_failed = models.PositiveIntegerField(_("push failed"), default=0)
+    email_digest_at = models.DateTimeField(_("email digest at"), null=True, blank=True)
+    # Snapshot of the handler, rendered when created
+    title = models.CharField(_("title"), max_length=255, null=True, blank=True)
+    text = models.TextField(_("text"), null=True, blank=True)
+    action_type = models.CharField(
+        _("action type"), max_length=255, null=True, blank=True
+    )
+    action_id = models.CharField(_("action id"), max_length=255, null=True, blank=True)
+    extra_data = models.JSONField(
+        _("extra data"), null=True, blank=True, encoder=DjangoJSONEncoder
+    )
+    rendered_at = models.DateTimeField(_("rendered at"), null=True, blank=True)
 
     objects = NotificationQuerySet.as_manager()
 
@@ -147,6 +180,23 @@ class AbstractNotification(TimeStampedModel):
         verbose_name_plural = _("notifications")
         ordering = ("-created",)
         abstract = True
+        # The indexes are named with the model, so the names are short enough
+        indexes = [
+            # Notifications accessible by the receiver, by creation
+            models.Index(
+                fields=["receiver_content_type", "receiver_id", "-created", "-id"],
+            ),
+            # Only the unread notifications, usually a small part of them
+            PartialIndex(
+                fields=["receiver_content_type", "receiver_id", "-created", "-id"],
+                condition=models.Q(read=False),
+            ),
+            # Only the notifications queued in a digest, almost all are not
+            PartialIndex(
+                fields=["email_digest_at"],
+                condition=models.Q(email_digest_at__isnull=False),
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"'{str(self.event)}' to {str(self.user)}"
@@ -191,6 +241,41 @@ class AbstractNotification(TimeStampedModel):
         """Gets the handler for the notification."""
         return self.event.handler(notification=self)
 
+    def render(self) -> None:
+        """Stores in the notification the title, the text, the action and the extra
+        data of the handler, so they can be read without the handler. It doesn't
+        save the notification."""
+        handler: "EventHandler" = self.handler()
+        receiver = self.receiver
+        language = (
+            handler.get_language(self.user)
+            if settings.USE_I18N
+            else translation.get_language()
+        )
+        with translation.override(language):
+            title = handler.get_title(receivers=receiver)
+            text = handler.get_text(receivers=receiver)
+            self.extra_data = handler.get_extra_data(receivers=receiver)
+        self.title = title[:255] if title else title
+        self.text = text
+        self.action_type = handler.get_action_type()
+        action_id = handler.get_action_id()
+        self.action_id = str(action_id) if action_id is not None else None
+        self.rendered_at = timezone.now()
+
+    def rendered(self) -> dict:
+        """Gets the title, the text, the action and the extra data, from the snapshot
+        if it's rendered, or from the handler."""
+        if self.rendered_at is None:
+            self.render()
+        return {
+            "title": self.title,
+            "text": self.text,
+            "action_type": self.action_type,
+            "action_id": self.action_id,
+            "extra_data": self.extra_data,
+        }
+
     def send(self, send_async: bool = False) -> None:
         """Sends a push notification to the devices of the user."""
         from snitch.tasks import send_notification_task
@@ -210,14 +295,62 @@ class AbstractNotification(TimeStampedModel):
                     backend: "AbstractBackend" = backend_class(self)
                     backend.send()
                 self.sent = True
-                self.save()
+                # Only updates the sent flag, to keep the delivery status recorded by
+                # the backends
+                self.save(update_fields=["sent"])
                 # Calls to after send
                 handler.after_send(receiver=self.receiver)
 
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._counted = self._counted_state()
+
+    def _counted_state(self) -> tuple[bool | None, bool | None]:
+        """Gets the read and received flags, as counted in the counters of the
+        receiver, without loading them if they are deferred."""
+        return self.__dict__.get("read"), self.__dict__.get("received")
+
+    def _counters_delta(self, is_insert: bool) -> tuple[int, int]:
+        """Gets the change in the counters of unread and unreceived notifications of
+        the receiver, since the notification was loaded or saved."""
+        read, received = self._counted
+        if is_insert:
+            read, received = True, True
+        return (
+            int(bool(read)) - int(self.read) if read is not None else 0,
+            int(bool(received)) - int(self.received) if received is not None else 0,
+        )
+
     def save(self, *args, **kwargs) -> None:
         """Overwrite to sending push notifications when saving."""
         is_insert: bool = self._state.adding
-        super().save(*args, **kwargs)
+        if is_insert and NOTIFICATION_SNAPSHOT and self.rendered_at is None:
+            try:
+                self.render()
+            except Exception:
+                # The notification is created anyway, to be rendered later
+                logger.exception(
+                    "Error rendering the notification of the event %s",
+                    self.event_id,
+                )
+        if NOTIFICATION_COUNTERS:
+            using = kwargs.get("using") or router.db_for_write(self.__class__)
+            with transaction.atomic(using=using):
+                super().save(*args, **kwargs)
+                update_fields = kwargs.get("update_fields")
+                if update_fields is None or {"read", "received"} & set(update_fields):
+                    notification_counters.change(
+                        {
+                            (
+                                self.receiver_content_type_id,
+                                self.receiver_id,
+                            ): self._counters_delta(is_insert)
+                        },
+                        using=using,
+                    )
+                    self._counted = self._counted_state()
+        else:
+            super().save(*args, **kwargs)
         if is_insert:
             # Calls after notify once the notification is inserted
             handler: "EventHandler" = self.handler()
@@ -230,3 +363,222 @@ class Notification(AbstractNotification):
 
     class Meta(AbstractNotification.Meta):
         swappable: str = "SNITCH_NOTIFICATION_MODEL"
+
+
+class EmailSuppression(TimeStampedModel):
+    """An email address that shouldn't receive more emails, because it bounced or
+    complained."""
+
+    HARD_BOUNCE, COMPLAINT, MANUAL = "hard_bounce", "complaint", "manual"
+    REASON_CHOICES = (
+        (HARD_BOUNCE, _("hard bounce")),
+        (COMPLAINT, _("complaint")),
+        (MANUAL, _("manual")),
+    )
+
+    email = models.EmailField(_("email"), max_length=254, unique=True)
+    reason = models.CharField(
+        _("reason"), max_length=32, choices=REASON_CHOICES, default=HARD_BOUNCE
+    )
+
+    class Meta:
+        verbose_name = _("email suppression")
+        verbose_name_plural = _("email suppressions")
+        ordering = ("-created",)
+
+    def __str__(self) -> str:
+        return self.email
+
+
+class NotificationCounter(TimeStampedModel):
+    """Number of unread and unreceived notifications of a receiver, updated with
+    the notifications."""
+
+    receiver = GenericForeignKey("receiver_content_type", "receiver_id")
+    receiver_content_type = models.ForeignKey(
+        ContentType,
+        verbose_name=_("receiver content type"),
+        on_delete=models.CASCADE,
+    )
+    receiver_id = models.PositiveIntegerField(_("receiver id"))
+    unread = models.PositiveIntegerField(_("unread"), default=0)
+    unreceived = models.PositiveIntegerField(_("unreceived"), default=0)
+
+    class Meta:
+        verbose_name = _("notification counter")
+        verbose_name_plural = _("notification counters")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["receiver_content_type", "receiver_id"],
+                name="snitch_notification_counter_receiver",
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.unread} unread notifications of {str(self.receiver)}"
+
+
+class AdminJob(TimeStampedModel):
+    """A bulk action of the admin, executed in the background in chunks of the
+    selected objects, to follow its progress."""
+
+    NOTIFY, SEND = "notify", "send"
+    ACTION_CHOICES = ((NOTIFY, _("notify events")), (SEND, _("send notifications")))
+    PENDING, RUNNING, FINISHED = "pending", "running", "finished"
+    STATUS_CHOICES = (
+        (PENDING, _("pending")),
+        (RUNNING, _("running")),
+        (FINISHED, _("finished")),
+    )
+
+    action = models.CharField(_("action"), max_length=32, choices=ACTION_CHOICES)
+    status = models.CharField(
+        _("status"), max_length=32, choices=STATUS_CHOICES, default=PENDING
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name=_("user"),
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
+    total = models.PositiveIntegerField(_("total"), default=0)
+    processed = models.PositiveIntegerField(_("processed"), default=0)
+    failed = models.PositiveIntegerField(_("failed"), default=0)
+    finished_at = models.DateTimeField(_("finished at"), null=True, blank=True)
+    # Pickled query of the selected objects, split in chunks in the background
+    query = models.BinaryField(_("query"), null=True, editable=False)
+
+    class Meta:
+        verbose_name = _("admin job")
+        verbose_name_plural = _("admin jobs")
+        ordering = ("-created",)
+
+    def __str__(self) -> str:
+        return f"{self.get_action_display()} ({self.progress}%)"
+
+    @property
+    def progress(self) -> int:
+        """Percentage of the objects already processed."""
+        if not self.total:
+            return 100 if self.status == self.FINISHED else 0
+        return int(100 * (self.processed + self.failed) / self.total)
+
+    @classmethod
+    def enqueue(
+        cls,
+        action: str,
+        queryset: models.QuerySet,
+        user: models.Model | None = None,
+        chunk_size: int = ADMIN_JOB_CHUNK_SIZE,
+    ) -> "AdminJob":
+        """Creates a job for the objects of the queryset, and enqueues a single task
+        once the transaction is committed, that splits them in chunks in the
+        background. The objects are not read in the request.
+        """
+        from snitch.tasks import dispatch_admin_job_task
+
+        empty = queryset.query.is_empty()
+        job = cls.objects.create(
+            action=action,
+            user=user if user is not None and user.is_authenticated else None,
+            status=cls.FINISHED if empty else cls.PENDING,
+            finished_at=timezone.now() if empty else None,
+            query=None if empty else pickle.dumps(queryset.query),
+        )
+        if not empty:
+            transaction.on_commit(
+                lambda: dispatch_admin_job_task.delay(job.pk, chunk_size)
+            )
+        return job
+
+    def queryset(self) -> models.QuerySet:
+        """Gets the queryset of the selected objects."""
+        if self.action == self.NOTIFY:
+            queryset = Event.objects.all()
+        else:
+            queryset = get_notification_model().objects.all()
+        if self.query is None:
+            return queryset.none()
+        queryset.query = pickle.loads(self.query)
+        return queryset
+
+    def dispatch(self, chunk_size: int = ADMIN_JOB_CHUNK_SIZE) -> int:
+        """Counts the selected objects, and enqueues a task for each chunk of them.
+        Only the objects that existed when dispatched are included, and a job is
+        only dispatched once. Returns the number of objects enqueued.
+        """
+        from snitch.tasks import run_admin_job_task
+
+        if not AdminJob.objects.filter(pk=self.pk, status=self.PENDING).update(
+            status=self.RUNNING
+        ):
+            return 0
+        queryset = self.queryset()
+        last = queryset.aggregate(last=Max("pk"))["last"]
+        if last is None:
+            pks = queryset.none().values_list("pk", flat=True)
+        else:
+            pks = (
+                queryset.filter(pk__lte=last)
+                .order_by("pk")
+                .values_list("pk", flat=True)
+            )
+        total = pks.count()
+        AdminJob.objects.filter(pk=self.pk).update(total=total)
+        dispatched = 0
+        iterator = pks.iterator(chunk_size=chunk_size)
+        while chunk := list(islice(iterator, chunk_size)):
+            run_admin_job_task.delay(self.pk, chunk)
+            dispatched += len(chunk)
+        # Objects removed while they were dispatched
+        if dispatched < total:
+            AdminJob.objects.filter(pk=self.pk).update(total=dispatched)
+        self._finish()
+        return dispatched
+
+    def _finish(self) -> None:
+        """Marks the job as finished if all the objects are processed."""
+        AdminJob.objects.filter(
+            pk=self.pk, total__lte=F("processed") + F("failed")
+        ).exclude(status=self.FINISHED).update(
+            status=self.FINISHED, finished_at=timezone.now()
+        )
+
+    def run(self, pks: list[int]) -> int:
+        """Executes the action for a chunk of objects, and updates the progress.
+        Returns the number of objects processed.
+        """
+        AdminJob.objects.filter(pk=self.pk, status=self.PENDING).update(
+            status=self.RUNNING
+        )
+        processed, failed = 0, 0
+        if self.action == self.NOTIFY:
+            objects = Event.objects.filter(pk__in=pks)
+        else:
+            objects = (
+                get_notification_model()
+                .objects.filter(pk__in=pks)
+                .select_related("event")
+            )
+        for obj in objects:
+            try:
+                if self.action == self.NOTIFY:
+                    obj.notify()
+                else:
+                    obj.send(send_async=False)
+                processed += 1
+            except Exception:
+                logger.exception("Error in the admin job %s", self.pk)
+                failed += 1
+        # Objects removed since the job was created
+        failed += len(pks) - processed - failed
+        # A chunk delivered again by the broker can't count over the total
+        capped = Least(F("processed") + processed, F("total"))
+        AdminJob.objects.filter(pk=self.pk).update(
+            processed=capped,
+            failed=Least(F("failed") + failed, F("total") - capped),
+            modified=timezone.now(),
+        )
+        self._finish()
+        return processed
@@ -0,0 +1,87 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import Any
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+from snitch.exceptions import InvalidCursor
+from snitch.settings import ADMIN_COUNT_LIMIT
+
+
+def encode_cursor(created: datetime, pk: Any) -> str:
+    """Gets an opaque cursor from the creation date and the ID of a notification."""
+    value = f"{created.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(value).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Gets the creation date and the ID of the notification of the cursor."""
+    try:
+        value = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created, pk = value.split("|")
+        return datetime.fromisoformat(created), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor(f"The cursor {cursor} is not valid.")
+
+
+class FeedPage:
+    """A page of notifications, with the cursor of the next page, or None if it's
+    the last page."""
+
+    def __init__(self, notifications: list, next_cursor: str | None = None) -> None:
+        self.notifications = notifications
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.notifications)
+
+    def __len__(self) -> int:
+        return len(self.notifications)
+
+    @property
+    def has_next(self) -> bool:
+        """Checks if there are more notifications after this page."""
+        return self.next_cursor is not None
+
+
+def estimate_count(queryset: QuerySet) -> int | None:
+    """Gets the estimated number of rows of the table of the queryset, if it's not
+    filtered and the database keeps the estimation, as PostgreSQL does.
+    """
+    connection = connections[queryset.db]
+    if queryset.query.where or connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] > 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator for large tables, that counts the rows only up to a limit, or up to
+    the requested page if it's deeper. Over the limit, the estimated number of rows
+    of the table is used if possible, or otherwise there is always a page after the
+    rows counted, so the next pages can be reached.
+    """
+
+    count_limit: int = ADMIN_COUNT_LIMIT
+    # Number of the page requested, to count the rows at least up to it
+    page_number: int = 1
+
+    @cached_property
+    def count(self) -> int:
+        if not isinstance(self.object_list, QuerySet):
+            return super().count
+        limit = max(self.count_limit, self.page_number * self.per_page)
+        count = self.object_list.order_by()[: limit + 1].count()
+        if count <= limit:
+            return count
+        estimated = estimate_count(self.object_list) or 0
+        return estimated if estimated > limit else limit + 1
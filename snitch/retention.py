@@ -0,0 +1,195 @@
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any
+
+from django.db import DEFAULT_DB_ALIAS, models, transaction
+from django.db.models import Count, Exists, Max, Min, OuterRef, Q
+from django.db.models.deletion import Collector
+from django.db.models.signals import post_delete, pre_delete
+from django.utils import timezone
+
+from snitch.counters import notification_counters, update_counters_on_delete
+from snitch.handlers import EventHandler, manager
+from snitch.helpers import get_notification_model
+from snitch.settings import NOTIFICATION_COUNTERS, RETENTION_BATCH_SIZE, RETENTION_SLEEP
+
+
+class PruneCollector(Collector):
+    """Collector of Django that ignores the signal receiver of the counters, as they
+    are updated once for each batch when pruning.
+    """
+
+    def _has_signal_listeners(self, model: type[models.Model]) -> bool:
+        receivers = post_delete._live_receivers(model)
+        if isinstance(receivers, tuple):
+            # Synchronous and asynchronous receivers, since Django 5.0
+            receivers = [*receivers[0], *receivers[1]]
+        return pre_delete.has_listeners(model) or any(
+            receiver is not update_counters_on_delete for receiver in receivers
+        )
+
+
+class Pruner:
+    """Deletes the old notifications, and the read ones, and the events without
+    notifications, using the retention of the handler of each verb. The rows are
+    deleted in batches of ranges of IDs, waiting between them, so the tables are
+    never locked for long. If a date is given, only the rows created before it are
+    deleted, for example the ones already archived.
+    """
+
+    batch_size: int
+    sleep: float
+    before: datetime | None
+
+    def __init__(
+        self,
+        batch_size: int = RETENTION_BATCH_SIZE,
+        sleep: float = RETENTION_SLEEP,
+        before: datetime | None = None,
+    ) -> None:
+        self.batch_size = batch_size
+        self.sleep = sleep
+        self.before = before
+
+    def retentions(self) -> dict[tuple[int | None, int | None], list[str]]:
+        """Gets the registered verbs grouped by their retention days, of all the
+        notifications and of the read ones."""
+        retentions: dict[tuple[int | None, int | None], list[str]] = defaultdict(list)
+        for verb, handler in manager._registry.items():
+            retentions[(handler.retention_days, handler.read_retention_days)].append(
+                verb
+            )
+        return retentions
+
+    def conditions(
+        self, now: datetime, prefix: str = "", read: bool = True
+    ) -> Q | None:
+        """Gets the conditions of the rows to delete, or None if nothing should be
+        deleted. The prefix is the path to the event, and the read retention is only
+        used for notifications.
+        """
+        conditions = Q()
+        verbs = self.retentions()
+        # Verbs without handler use the default retention
+        others = ~Q(
+            **{f"{prefix}verb__in": [v for group in verbs.values() for v in group]}
+        )
+        groups = [
+            (Q(**{f"{prefix}verb__in": group}), days) for days, group in verbs.items()
+        ]
+        groups.append(
+            (others, (EventHandler.retention_days, EventHandler.read_retention_days))
+        )
+        for verb_condition, (days, read_days) in groups:
+            if days is not None:
+                conditions |= verb_condition & Q(created__lt=now - timedelta(days=days))
+            if read and read_days is not None:
+                conditions |= verb_condition & Q(
+                    read=True, created__lt=now - timedelta(days=read_days)
+                )
+        if conditions and self.before is not None:
+            conditions &= Q(created__lt=self.before)
+        return conditions or None
+
+    def _ranges(self, queryset: models.QuerySet) -> Any:
+        """Gets the ranges of IDs of the rows of the queryset, in batches."""
+        bounds = queryset.aggregate(first=Min("pk"), last=Max("pk"))
+        if bounds["first"] is None:
+            return
+        for start in range(bounds["first"], bounds["last"] + 1, self.batch_size):
+            yield start, start + self.batch_size
+
+    def _wait(self) -> None:
+        """Waits between batches, to let other queries use the tables."""
+        if self.sleep > 0:
+            time.sleep(self.sleep)
+
+    def _delete(self, queryset: models.QuerySet, using: str) -> int:
+        """Deletes the rows of the queryset with a single query if there are no
+        cascades or signals, or with the collector of Django otherwise. The counters
+        are paused, as they are updated once for each batch.
+        """
+        with notification_counters.paused():
+            if PruneCollector(using=using).can_fast_delete(queryset):
+                return queryset._raw_delete(using)
+            _, deleted = queryset.delete()
+        return deleted.get(queryset.model._meta.label, 0)
+
+    def prune_notifications(
+        self, now: datetime | None = None, using: str = DEFAULT_DB_ALIAS
+    ) -> int:
+        """Deletes the notifications out of the retention. They are deleted with a
+        single query when nothing depends on them, and the counters are updated once
+        for each batch.
+        """
+        Notification = get_notification_model()
+        conditions = self.conditions(now or timezone.now(), prefix="event__")
+        if conditions is None:
+            return 0
+        notifications = Notification.objects.using(using)
+        total = 0
+        for start, end in self._ranges(notifications):
+            with transaction.atomic(using=using):
+                pks = list(
+                    notifications.filter(conditions, pk__gte=start, pk__lt=end)
+                    .select_for_update(of=("self",))
+                    .values_list("pk", flat=True)
+                )
+                if not pks:
+                    continue
+                batch = notifications.filter(pk__in=pks)
+                if NOTIFICATION_COUNTERS:
+                    rows = (
+                        batch.order_by()
+                        .values_list("receiver_content_type_id", "receiver_id")
+                        .annotate(
+                            unread=Count("pk", filter=Q(read=False)),
+                            unreceived=Count("pk", filter=Q(received=False)),
+                        )
+                    )
+                    notification_counters.change(
+                        {
+                            (content_type_id, receiver_id): (-unread, -unreceived)
+                            for content_type_id, receiver_id, unread, unreceived in rows
+                        },
+                        using=using,
+                    )
+                total += self._delete(batch, using)
+            self._wait()
+        return total
+
+    def prune_events(
+        self, now: datetime | None = None, using: str = DEFAULT_DB_ALIAS
+    ) -> int:
+        """Deletes the events out of the retention without notifications."""
+        from snitch.models import Event
+
+        Notification = get_notification_model()
+        conditions = self.conditions(now or timezone.now(), read=False)
+        if conditions is None:
+            return 0
+        events = Event.objects.using(using)
+        orphans = events.filter(conditions).filter(
+            ~Exists(Notification.objects.filter(event=OuterRef("pk")))
+        )
+        total = 0
+        for start, end in self._ranges(events):
+            with transaction.atomic(using=using):
+                deleted, _ = orphans.filter(pk__gte=start, pk__lt=end).delete()
+            if deleted:
+                total += deleted
+                self._wait()
+        return total
+
+    def prune(
+        self, now: datetime | None = None, using: str = DEFAULT_DB_ALIAS
+    ) -> dict[str, int]:
+        """Deletes the notifications and then the events out of the retention.
+        Returns the number of rows deleted of each one.
+        """
+        now = now or timezone.now()
+        return {
+            "notifications": self.prune_notifications(now=now, using=using),
+            "events": self.prune_events(now=now, using=using),
+        }
@@ -11,6 +11,76 @@ ENABLED_SEND_NOTIFICATIONS = getattr(
     settings, "SNITCH_ENABLED_SEND_NOTIFICATIONS", True
 )
 ENABLED_SEND_EMAILS = getattr(settings, "SNITCH_ENABLED_SEND_EMAILS", True)
+EMAIL_BATCH_SIZE = getattr(settings, "SNITCH_EMAIL_BATCH_SIZE", 100)
+EMAIL_ASYNC_SMTP = getattr(settings, "SNITCH_EMAIL_ASYNC_SMTP", False)
+EMAIL_SMTP_POOL_SIZE = getattr(settings, "SNITCH_EMAIL_SMTP_POOL_SIZE", 10)
+EMAIL_SMTP_TIMEOUT = getattr(settings, "SNITCH_EMAIL_SMTP_TIMEOUT", 30)
+EMAIL_PLAIN_TEXT_CONVERTER = getattr(
+    settings,
+    "SNITCH_EMAIL_PLAIN_TEXT_CONVERTER",
+    "snitch.converters.BleachPlainTextConverter",
+)
+EMAIL_PLAIN_CACHE_SIZE = getattr(settings, "SNITCH_EMAIL_PLAIN_CACHE_SIZE", 128)
+EMAIL_BODY_STORE = getattr(settings, "SNITCH_EMAIL_BODY_STORE", None)
+EMAIL_BODY_COMPRESS = getattr(settings, "SNITCH_EMAIL_BODY_COMPRESS", False)
+EMAIL_BODY_CACHE_ALIAS = getattr(settings, "SNITCH_EMAIL_BODY_CACHE_ALIAS", "default")
+EMAIL_BODY_CACHE_TIMEOUT = getattr(
+    settings, "SNITCH_EMAIL_BODY_CACHE_TIMEOUT", 60 * 60 * 24
+)
+EMAIL_BODY_STORAGE_LOCATION = getattr(
+    settings, "SNITCH_EMAIL_BODY_STORAGE_LOCATION", "snitch/emails"
+)
+EMAIL_RENDER_CACHE_ALIAS = getattr(
+    settings, "SNITCH_EMAIL_RENDER_CACHE_ALIAS", "default"
+)
+EMAIL_RENDER_CACHE_TIMEOUT = getattr(settings, "SNITCH_EMAIL_RENDER_CACHE_TIMEOUT", 300)
+EMAIL_DIGEST_INTERVAL = getattr(settings, "SNITCH_EMAIL_DIGEST_INTERVAL", 60 * 60)
+EMAIL_DIGEST_TEMPLATE = getattr(
+    settings, "SNITCH_EMAIL_DIGEST_TEMPLATE", "snitch/email_digest.html"
+)
+EMAIL_SUPPRESSION = getattr(settings, "SNITCH_EMAIL_SUPPRESSION", False)
+EMAIL_SUPPRESSION_CACHE_ALIAS = getattr(
+    settings, "SNITCH_EMAIL_SUPPRESSION_CACHE_ALIAS", "default"
+)
+EMAIL_SUPPRESSION_CACHE_TIMEOUT = getattr(
+    settings, "SNITCH_EMAIL_SUPPRESSION_CACHE_TIMEOUT", 60 * 60
+)
+EMAIL_TEMPLATE_CACHE = getattr(
+    settings, "SNITCH_EMAIL_TEMPLATE_CACHE", not settings.DEBUG
+)
 NOTIFICATION_MODEL = getattr(
     settings, "SNITCH_NOTIFICATION_MODEL", "snitch.Notification"
 )
+NOTIFICATION_COUNTERS = getattr(settings, "SNITCH_NOTIFICATION_COUNTERS", False)
+NOTIFICATION_SNAPSHOT = getattr(settings, "SNITCH_NOTIFICATION_SNAPSHOT", False)
+RENDER_BATCH_SIZE = getattr(settings, "SNITCH_RENDER_BATCH_SIZE", 500)
+NOTIFICATION_COUNTERS_CACHE_ALIAS = getattr(
+    settings, "SNITCH_NOTIFICATION_COUNTERS_CACHE_ALIAS", "default"
+)
+NOTIFICATION_COUNTERS_CACHE_TIMEOUT = getattr(
+    settings, "SNITCH_NOTIFICATION_COUNTERS_CACHE_TIMEOUT", 60 * 60
+)
+ADMIN_COUNT_LIMIT = getattr(settings, "SNITCH_ADMIN_COUNT_LIMIT", 10000)
+ADMIN_JOB_CHUNK_SIZE = getattr(settings, "SNITCH_ADMIN_JOB_CHUNK_SIZE", 100)
+RETENTION_DAYS = getattr(settings, "SNITCH_RETENTION_DAYS", None)
+RETENTION_READ_DAYS = getattr(settings, "SNITCH_RETENTION_READ_DAYS", None)
+RETENTION_BATCH_SIZE = getattr(settings, "SNITCH_RETENTION_BATCH_SIZE", 1000)
+RETENTION_SLEEP = getattr(settings, "SNITCH_RETENTION_SLEEP", 0.1)
+ARCHIVE_BATCH_SIZE = getattr(settings, "SNITCH_ARCHIVE_BATCH_SIZE", 1000)
+
+# Push notifications
+# ------------------------------------------------------------------------------
+PUSH_MAX_RETRIES = getattr(settings, "SNITCH_PUSH_MAX_RETRIES", 3)
+PUSH_RETRY_BACKOFF = getattr(settings, "SNITCH_PUSH_RETRY_BACKOFF", 5)
+PUSH_RETRY_BACKOFF_MAX = getattr(settings, "SNITCH_PUSH_RETRY_BACKOFF_MAX", 600)
+PUSH_RATE_LIMITS = getattr(settings, "SNITCH_PUSH_RATE_LIMITS", {})
+PUSH_RATE_LIMIT_CACHE_ALIAS = getattr(
+    settings, "SNITCH_PUSH_RATE_LIMIT_CACHE_ALIAS", "default"
+)
+PUSH_RATE_LIMIT_MAX_DELAY = getattr(settings, "SNITCH_PUSH_RATE_LIMIT_MAX_DELAY", 3600)
+PUSH_PROVIDERS = getattr(settings, "SNITCH_PUSH_PROVIDERS", {})
+PUSH_MAX_CONCURRENCY = getattr(settings, "SNITCH_PUSH_MAX_CONCURRENCY", 100)
+PUSH_TIMEOUT = getattr(settings, "SNITCH_PUSH_TIMEOUT", 30)
+PUSH_DEVICE_CACHE = getattr(settings, "SNITCH_PUSH_DEVICE_CACHE", False)
+PUSH_DEVICE_CACHE_ALIAS = getattr(settings, "SNITCH_PUSH_DEVICE_CACHE_ALIAS", "default")
+PUSH_DEVICE_CACHE_TIMEOUT = getattr(settings, "SNITCH_PUSH_DEVICE_CACHE_TIMEOUT", 300)
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.core.mail.message import sanitize_address
+
+from snitch.exceptions import SnitchError
+from snitch.settings import EMAIL_SMTP_POOL_SIZE, EMAIL_SMTP_TIMEOUT
+
+try:
+    import aiosmtplib
+except ImportError:
+    raise SnitchError("The asyncio SMTP client requires the aiosmtplib package.")
+
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSMTPClient:
+    """A client that keeps a small pool of SMTP connections, in an event loop running
+    in a background thread, and sends the messages concurrently using all of them.
+    The connections use the email settings of Django.
+    """
+
+    pool_size: int
+    timeout: float
+
+    def __init__(
+        self, pool_size: int = EMAIL_SMTP_POOL_SIZE, timeout: float = EMAIL_SMTP_TIMEOUT
+    ) -> None:
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._idle: list[aiosmtplib.SMTP] = []
+        self._pid: int | None = None
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Gets the event loop, starting it if needed. The loop is started again in
+        forked processes, like the Celery workers.
+        """
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._idle = []
+                self._pid = os.getpid()
+                thread = threading.Thread(
+                    target=self._loop.run_forever, name="snitch-smtp", daemon=True
+                )
+                thread.start()
+        return self._loop
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        """Opens a new connection to the SMTP server."""
+        smtp = aiosmtplib.SMTP(
+            hostname=settings.EMAIL_HOST,
+            port=settings.EMAIL_PORT,
+            username=settings.EMAIL_HOST_USER or None,
+            password=settings.EMAIL_HOST_PASSWORD or None,
+            use_tls=settings.EMAIL_USE_SSL,
+            start_tls=settings.EMAIL_USE_TLS,
+            timeout=self.timeout,
+        )
+        await smtp.connect()
+        return smtp
+
+    async def _acquire(self) -> aiosmtplib.SMTP:
+        """Gets an idle connection of the pool, or opens a new one."""
+        while self._idle:
+            smtp = self._idle.pop()
+            if smtp.is_connected:
+                return smtp
+        return await self._connect()
+
+    def _release(self, smtp: aiosmtplib.SMTP) -> None:
+        """Returns the connection to the pool, if it's still open."""
+        if smtp.is_connected and len(self._idle) < self.pool_size:
+            self._idle.append(smtp)
+        elif smtp.is_connected:
+            smtp.close()
+
+    async def _sendmail(self, smtp: aiosmtplib.SMTP, message: EmailMessage) -> None:
+        """Sends a single message, in the same way than the SMTP backend of Django."""
+        encoding = message.encoding or settings.DEFAULT_CHARSET
+        await smtp.sendmail(
+            sanitize_address(message.from_email, encoding),
+            [sanitize_address(address, encoding) for address in message.recipients()],
+            message.message().as_bytes(linesep="\r\n"),
+        )
+
+    async def _worker(self, queue: asyncio.Queue) -> int:
+        """Sends the messages of the queue using a connection of the pool. If the
+        connection is lost, it reconnects and tries again the message that failed.
+        The messages rejected by the server are logged and not counted as sent.
+        """
+        sent = 0
+        smtp = await self._acquire()
+        try:
+            while not queue.empty():
+                message = queue.get_nowait()
+                try:
+                    try:
+                        await self._sendmail(smtp, message)
+                    except aiosmtplib.SMTPServerDisconnected as exception:
+                        logger.warning(
+                            "Reconnecting to send an email: %s", str(exception)
+                        )
+                        smtp.close()
+                        smtp = await self._connect()
+                        await self._sendmail(smtp, message)
+                    sent += 1
+                except aiosmtplib.SMTPException as exception:
+                    logger.error("Error sending an email: %s", str(exception))
+        finally:
+            self._release(smtp)
+        return sent
+
+    async def _send_all(self, messages: list[EmailMessage]) -> int:
+        """Sends all the messages concurrently, using up to the size of the pool."""
+        queue: asyncio.Queue = asyncio.Queue()
+        for message in messages:
+            queue.put_nowait(message)
+        workers = min(self.pool_size, len(messages))
+        return sum(await asyncio.gather(*[self._worker(queue) for _ in range(workers)]))
+
+    def send(self, messages: list[EmailMessage]) -> int:
+        """Sends the messages, blocking until all of them are sent. Returns the
+        number of messages sent, so the caller can check if some of them failed.
+        """
+        messages = [message for message in messages if message.recipients()]
+        if not messages:
+            return 0
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(self._send_all(messages), loop).result()
+
+    async def _quit_all(self) -> None:
+        """Closes the idle connections."""
+        idle, self._idle = self._idle, []
+        for smtp in idle:
+            try:
+                await smtp.quit()
+            except aiosmtplib.SMTPException:
+                smtp.close()
+
+    def close(self) -> None:
+        """Closes the connections and stops the event loop."""
+        with self._lock:
+            if self._loop is None:
+                return None
+            if self._pid == os.getpid():
+                asyncio.run_coroutine_threadsafe(self._quit_all(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+            self._idle = []
+        return None
+
+
+# This global object keeps the SMTP connections of the process
+smtp_client: AsyncSMTPClient = AsyncSMTPClient()
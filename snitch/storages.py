@@ -0,0 +1,189 @@
+import hashlib
+import zlib
+from typing import Any
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import Storage, default_storage
+from django.utils.module_loading import import_string
+
+from snitch.exceptions import SnitchError
+from snitch.settings import (
+    EMAIL_BODY_CACHE_ALIAS,
+    EMAIL_BODY_CACHE_TIMEOUT,
+    EMAIL_BODY_COMPRESS,
+    EMAIL_BODY_STORAGE_LOCATION,
+    EMAIL_BODY_STORE,
+)
+
+# First byte of the stored data, to know if it's compressed
+RAW = b"r"
+COMPRESSED = b"z"
+
+
+class BodyStore:
+    """Base class to store the rendered bodies and the attaches of the emails sent
+    with Celery, as a claim check: each content is stored once, using as reference
+    its hash, and only the reference is sent in the task.
+    """
+
+    compress: bool
+
+    def __init__(self, compress: bool = EMAIL_BODY_COMPRESS) -> None:
+        self.compress = compress
+
+    def save(self, reference: str, data: bytes) -> None:
+        """A subclass should save the data, if it's not saved yet."""
+        raise NotImplementedError
+
+    def load(self, reference: str) -> bytes | None:
+        """A subclass should load the data, or return None if it doesn't exist."""
+        raise NotImplementedError
+
+    def encode(self, content: bytes) -> bytes:
+        """Gets the data to store from the content, compressed if enabled."""
+        if self.compress:
+            return COMPRESSED + zlib.compress(content)
+        return RAW + content
+
+    def decode(self, data: bytes) -> bytes:
+        """Gets the content from the stored data."""
+        if data[:1] == COMPRESSED:
+            return zlib.decompress(data[1:])
+        return data[1:]
+
+    def put_bytes(self, content: bytes) -> str:
+        """Stores the binary content and returns its reference."""
+        reference = hashlib.sha256(content).hexdigest()
+        self.save(reference, self.encode(content))
+        return reference
+
+    def get_bytes(self, reference: str) -> bytes:
+        """Gets the binary content stored with the reference."""
+        data = self.load(reference)
+        if data is None:
+            raise SnitchError(f"The email content {reference} is not stored.")
+        return self.decode(data)
+
+    def put(self, body: str) -> str:
+        """Stores the body and returns its reference."""
+        return self.put_bytes(body.encode())
+
+    def get(self, reference: str) -> str:
+        """Gets the body stored with the reference."""
+        return self.get_bytes(reference).decode()
+
+    def put_attaches(self, attaches: list) -> list[list]:
+        """Stores the content of the attaches, given as tuples with the file name,
+        the content and the mimetype. Returns the attaches with the reference instead
+        of the content, and if the content is text.
+        """
+        stored = []
+        for file_name, content, mimetype in attaches:
+            if hasattr(content, "read"):
+                if hasattr(content, "seek"):
+                    content.seek(0)
+                content = content.read()
+            is_text = isinstance(content, str)
+            reference = self.put_bytes(content.encode() if is_text else content)
+            stored.append([file_name, reference, mimetype, is_text])
+        return stored
+
+    def get_attaches(self, attaches: list[list]) -> list[tuple]:
+        """Gets the attaches stored with :meth:`put_attaches`."""
+        loaded = []
+        for file_name, reference, mimetype, is_text in attaches:
+            content = self.get_bytes(reference)
+            loaded.append(
+                (file_name, content.decode() if is_text else content, mimetype)
+            )
+        return loaded
+
+
+class CacheBodyStore(BodyStore):
+    """Stores the bodies in the cache, that must be shared with the workers."""
+
+    prefix: str = "snitch"
+    cache_alias: str
+    timeout: int
+
+    def __init__(
+        self,
+        compress: bool = EMAIL_BODY_COMPRESS,
+        cache_alias: str = EMAIL_BODY_CACHE_ALIAS,
+        timeout: int = EMAIL_BODY_CACHE_TIMEOUT,
+    ) -> None:
+        super().__init__(compress=compress)
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+
+    @property
+    def _cache(self) -> Any:
+        """Gets the cache proxy using the alias."""
+        return caches[self.cache_alias]
+
+    def _key(self, reference: str) -> str:
+        """Gets the cache key for the body."""
+        return f"{self.prefix}-email-body-{reference}"
+
+    def save(self, reference: str, data: bytes) -> None:
+        # An already stored body only needs a longer expiration
+        if not self._cache.add(self._key(reference), data, self.timeout):
+            self._cache.touch(self._key(reference), self.timeout)
+
+    def load(self, reference: str) -> bytes | None:
+        return self._cache.get(self._key(reference))
+
+
+class StorageBodyStore(BodyStore):
+    """Stores the bodies as files in the default storage. The files are not removed
+    after sending the emails, because they could be shared by other tasks.
+    """
+
+    location: str
+
+    def __init__(
+        self,
+        compress: bool = EMAIL_BODY_COMPRESS,
+        location: str = EMAIL_BODY_STORAGE_LOCATION,
+    ) -> None:
+        super().__init__(compress=compress)
+        self.location = location
+
+    @property
+    def storage(self) -> Storage:
+        """Gets the storage for the files."""
+        return default_storage
+
+    def _path(self, reference: str) -> str:
+        """Gets the path of the file of the body."""
+        return f"{self.location}/{reference[:2]}/{reference}"
+
+    def save(self, reference: str, data: bytes) -> None:
+        path = self._path(reference)
+        if not self.storage.exists(path):
+            self.storage.save(path, ContentFile(data))
+
+    def load(self, reference: str) -> bytes | None:
+        try:
+            with self.storage.open(self._path(reference), "rb") as body_file:
+                return body_file.read()
+        except (FileNotFoundError, OSError):
+            return None
+
+
+_stores: dict[str, BodyStore] = {}
+
+
+def get_body_store() -> BodyStore | None:
+    """Gets the store of the email bodies, or None if they are sent in the tasks.
+    The setting is read on each call, so it can be overridden, and the store of each
+    class is created only once.
+    """
+    path = getattr(settings, "SNITCH_EMAIL_BODY_STORE", EMAIL_BODY_STORE)
+    if not path:
+        return None
+    if path not in _stores:
+        _stores[path] = import_string(path)()
+    return _stores[path]
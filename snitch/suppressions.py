@@ -0,0 +1,95 @@
+from email.utils import parseaddr
+from typing import Any, Iterable
+
+from django.apps import apps
+from django.core.cache import caches
+
+from snitch.settings import (
+    EMAIL_SUPPRESSION_CACHE_ALIAS,
+    EMAIL_SUPPRESSION_CACHE_TIMEOUT,
+)
+
+
+def normalize_email(email: str) -> str:
+    """Gets the address of an email, like "Name <email>", in lower case."""
+    return parseaddr(email)[1].strip().lower()
+
+
+class SuppressionList:
+    """List of the email addresses that shouldn't receive emails, stored in the
+    database and cached, including the addresses that are not suppressed, so the
+    recipients of a batch are checked with a single query at most.
+    """
+
+    prefix: str = "snitch"
+    cache_alias: str
+    timeout: int
+
+    def __init__(
+        self,
+        cache_alias: str = EMAIL_SUPPRESSION_CACHE_ALIAS,
+        timeout: int = EMAIL_SUPPRESSION_CACHE_TIMEOUT,
+    ) -> None:
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+
+    @property
+    def _cache(self) -> Any:
+        """Gets the cache proxy using the alias."""
+        return caches[self.cache_alias]
+
+    @property
+    def _model(self) -> Any:
+        """Gets the model of the suppressions."""
+        return apps.get_model("snitch.EmailSuppression")
+
+    def _key(self, email: str) -> str:
+        """Gets the cache key for the email."""
+        return f"{self.prefix}-suppression-{email}"
+
+    def suppressed(self, emails: Iterable[str]) -> set[str]:
+        """Gets the normalized addresses of the given emails that are suppressed."""
+        keys = {self._key(email): email for email in map(normalize_email, emails)}
+        keys.pop(self._key(""), None)
+        if not keys:
+            return set()
+        cached = self._cache.get_many(list(keys))
+        suppressed = {keys[key] for key, value in cached.items() if value}
+        missing = [email for key, email in keys.items() if key not in cached]
+        if missing:
+            found = set(
+                self._model.objects.filter(email__in=missing).values_list(
+                    "email", flat=True
+                )
+            )
+            self._cache.set_many(
+                {self._key(email): email in found for email in missing}, self.timeout
+            )
+            suppressed |= found
+        return suppressed
+
+    def is_suppressed(self, email: str) -> bool:
+        """Checks if the email is suppressed."""
+        return bool(self.suppressed([email]))
+
+    def suppress(self, email: str, reason: str | None = None) -> None:
+        """Adds the email to the list, by default as a hard bounce."""
+        email = normalize_email(email)
+        self._model.objects.update_or_create(
+            email=email, defaults={"reason": reason or self._model.HARD_BOUNCE}
+        )
+        self._cache.set(self._key(email), True, self.timeout)
+
+    def record_hard_bounce(self, email: str) -> None:
+        """Adds the email that had a hard bounce to the list."""
+        self.suppress(email, reason=self._model.HARD_BOUNCE)
+
+    def unsuppress(self, email: str) -> None:
+        """Removes the email from the list."""
+        email = normalize_email(email)
+        self._model.objects.filter(email=email).delete()
+        self._cache.set(self._key(email), False, self.timeout)
+
+
+# This global object represents the list of suppressed emails
+suppression_list: SuppressionList = SuppressionList()
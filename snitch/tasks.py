@@ -1,9 +1,15 @@
 from celery import shared_task
 from django.apps import apps
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.mail import EmailMultiAlternatives
+from django.utils import translation
+from django.utils.module_loading import import_string
 
+from snitch.exceptions import SnitchError
 from snitch.helpers import get_notification_model
+from snitch.settings import EMAIL_ASYNC_SMTP
+from snitch.storages import get_body_store
 
 
 @shared_task(serializer="json")
@@ -39,6 +45,57 @@ def send_notification_task(notification_pk: int) -> bool | None:
     return None
 
 
+@shared_task(serializer="json")
+def dispatch_admin_job_task(job_pk: int, chunk_size: int) -> int:
+    """A Celery task to split the objects of a bulk action of the admin in chunks,
+    and enqueue a task for each one."""
+    AdminJob = apps.get_model("snitch.AdminJob")
+    try:
+        job = AdminJob.objects.get(pk=job_pk)
+    except AdminJob.DoesNotExist:
+        return 0
+    return job.dispatch(chunk_size)
+
+
+@shared_task(serializer="json")
+def run_admin_job_task(job_pk: int, pks: list[int]) -> int:
+    """A Celery task to execute a bulk action of the admin for a chunk of objects."""
+    AdminJob = apps.get_model("snitch.AdminJob")
+    try:
+        job = AdminJob.objects.get(pk=job_pk)
+    except AdminJob.DoesNotExist:
+        return 0
+    return job.run(pks)
+
+
+@shared_task(serializer="json")
+def retry_push_notification_task(
+    notification_pk: int,
+    backend_path: str,
+    device_model: str,
+    device_pks: list[int],
+    attempt: int,
+    reserved: bool = False,
+) -> bool:
+    """A Celery task to retry the sending of the push notification to the devices
+    that failed in a previous attempt, or that were deferred by the quota."""
+
+    Notification = get_notification_model()
+
+    try:
+        notification = Notification.objects.get(pk=notification_pk)
+    except Notification.DoesNotExist:
+        return False
+    backend = import_string(backend_path)(notification)
+    # Activate language for translations
+    if settings.USE_I18N:
+        translation.activate(backend.handler.get_language(notification.user))
+    backend.retry(
+        apps.get_model(device_model), device_pks, attempt=attempt, reserved=reserved
+    )
+    return True
+
+
 @shared_task(serializer="json")
 def send_email_asynchronously(
     subject: str,
@@ -49,8 +106,16 @@ def send_email_asynchronously(
     cc: list | None,
     bcc: list | None,
     reply_to: list | None,
+    stored: bool = False,
+    attaches: list | None = None,
 ):
-    """Sends an email as a asynchronous task."""
+    """Sends an email as a asynchronous task. If stored, the messages are the
+    references to the bodies in the store, and the attaches are stored too.
+    """
+    if stored:
+        store = get_body_store()
+        message_txt, message = store.get(message_txt), store.get(message)
+        attaches = store.get_attaches(attaches or [])
     email = EmailMultiAlternatives(
         subject=subject,
         body=message_txt,
@@ -61,5 +126,63 @@ def send_email_asynchronously(
         reply_to=reply_to,
     )
     email.attach_alternative(message, "text/html")
-    email.send()
+    for file_name, content, mimetype in attaches or []:
+        email.attach(file_name, content, mimetype)
+    if EMAIL_ASYNC_SMTP:
+        from snitch.emails import send_messages
+
+        if not send_messages([email]) and email.recipients():
+            raise SnitchError("The email could not be sent.")
+    else:
+        email.send()
     return True
+
+
+@shared_task(serializer="json")
+def send_batch_email_asynchronously(
+    bodies: list[list[str]], emails: list[dict], stored: bool = False
+) -> int:
+    """Sends a batch of emails as a asynchronous task, using a single connection.
+    The bodies, a list with the plain and the HTML message, are shared by the
+    emails, that reference them by its index. If stored, the bodies are the
+    references to them in the store, and each email can have stored attaches. It
+    fails if some of the emails could not be sent.
+    """
+    from snitch.emails import send_messages
+
+    if stored:
+        store = get_body_store()
+        bodies = [[store.get(reference) for reference in body] for body in bodies]
+    messages = []
+    for email_kwargs in emails:
+        message_txt, message = bodies[email_kwargs.pop("body")]
+        attaches = email_kwargs.pop("attaches", None)
+        email = EmailMultiAlternatives(body=message_txt, **email_kwargs)
+        email.attach_alternative(message, "text/html")
+        if stored and attaches:
+            for file_name, content, mimetype in store.get_attaches(attaches):
+                email.attach(file_name, content, mimetype)
+        messages.append(email)
+    sent = send_messages(messages)
+    expected = len([message for message in messages if message.recipients()])
+    if sent < expected:
+        raise SnitchError(f"{expected - sent} of {expected} emails could not be sent.")
+    return sent
+
+
+@shared_task(serializer="json")
+def flush_email_digests_task() -> int:
+    """Sends the digest emails of the receivers with notifications waiting, to be
+    scheduled periodically."""
+    from snitch.backends import DigestEmailNotificationBackend
+
+    return DigestEmailNotificationBackend.flush()
+
+
+@shared_task(serializer="json")
+def prune_notifications_task() -> dict[str, int]:
+    """Deletes the notifications and the events out of the retention, to be
+    scheduled periodically."""
+    from snitch.retention import Pruner
+
+    return Pruner().prune()
@@ -4,7 +4,11 @@ from django.contrib.auth import get_user_model
 from django.db import models
 
 import snitch
-from snitch.backends import EmailNotificationBackend, PushNotificationBackend
+from snitch.backends import (
+    DigestEmailNotificationBackend,
+    EmailNotificationBackend,
+    PushNotificationBackend,
+)
 
 ACTIVATED_EVENT = "activated"
 CONFIRMED_EVENT = "confirmed"
@@ -18,6 +22,8 @@ NO_SPAM = "no spam"
 DYNAMIC_SPAM = "dynamic spam"
 OTHER_DYNAMIC_SPAM = "other dynamic spam"
 LOCALIZED_EVENT = "localized"
+NEWSLETTER_EVENT = "newsletter"
+DIGEST_EVENT = "digest"
 
 
 @snitch.register(ACTIVATED_EVENT)
@@ -163,3 +169,26 @@ class LocalizedHandler(snitch.EventHandler):
 
     def audience(self):
         return get_user_model().objects.all()
+
+
+@snitch.register(NEWSLETTER_EVENT)
+class NewsletterHandler(snitch.EventHandler):
+    notification_backends = [EmailNotificationBackend]
+    template_email_kwargs = {"template_name": "newsletter.html"}
+    template_email_recipient_keys = ["name"]
+
+    def audience(self):
+        return get_user_model().objects.all()
+
+    def get_email_extra_context(self):
+        return {"name": self.notification.user.username, "items": range(10)}
+
+
+@snitch.register(DIGEST_EVENT)
+class DigestHandler(snitch.EventHandler):
+    title = "Digested"
+    notification_backends = [DigestEmailNotificationBackend]
+    template_email_digest_interval = 600
+
+    def audience(self):
+        return get_user_model().objects.all()
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0005_remove_notification_user"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notification",
+            name="push_attempts",
+            field=models.PositiveIntegerField(default=0, verbose_name="push attempts"),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="push_delivered",
+            field=models.PositiveIntegerField(default=0, verbose_name="push delivered"),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="push_failed",
+            field=models.PositiveIntegerField(default=0, verbose_name="push failed"),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:34
+
+from django.db import migrations, models
+
+import snitch.indexes
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0006_notification_push_delivery"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notification",
+            name="email_digest_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="email digest at"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="notification",
+            index=snitch.indexes.PartialIndex(
+                condition=models.Q(("email_digest_at__isnull", False)),
+                fields=["email_digest_at"],
+                name="app_notific_email_d_a4e45a_prt",
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0008_notification_feed_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notification",
+            name="read_at",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="read at"),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="received_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="received at"
+            ),
+        ),
+    ]
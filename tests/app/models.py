@@ -7,9 +7,11 @@ from snitch.models import AbstractNotification
 from tests.app.events import (
     ACTIVATED_EVENT,
     CONFIRMED_EVENT,
+    DIGEST_EVENT,
     DUMMY_EVENT_NO_BODY,
     DYNAMIC_SPAM,
     LOCALIZED_EVENT,
+    NEWSLETTER_EVENT,
     NO_SPAM,
     OTHER_DYNAMIC_SPAM,
     SMALL_EVENT,
@@ -69,6 +71,14 @@ class Stuff(models.Model):
     def localized(self):
         pass
 
+    @snitch.dispatch(NEWSLETTER_EVENT)
+    def newsletter(self):
+        pass
+
+    @snitch.dispatch(DIGEST_EVENT)
+    def digest(self):
+        pass
+
 
 class Actor(models.Model):
     """Dummy actor."""
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import threading
+from typing import Callable
+
+
+class HTTP2Server:
+    """A stand-in push provider, that accepts HTTP/2 connections without TLS and
+    answers each request using the given responder.
+    """
+
+    def __init__(self, responder: Callable[[str, dict], tuple[int, dict]]):
+        self.responder = responder
+        self.requests: list[tuple[str, dict]] = []
+        self.connections = 0
+        self.port: int | None = None
+        self._loop = asyncio.new_event_loop()
+        self._server: asyncio.AbstractServer | None = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        from h2.config import H2Configuration
+        from h2.connection import H2Connection
+        from h2.events import DataReceived, RequestReceived, StreamEnded
+
+        self.connections += 1
+        connection = H2Connection(
+            config=H2Configuration(client_side=False, header_encoding="utf-8")
+        )
+        connection.initiate_connection()
+        writer.write(connection.data_to_send())
+        streams: dict[int, dict] = {}
+        while data := await reader.read(65535):
+            for event in connection.receive_data(data):
+                if isinstance(event, RequestReceived):
+                    streams[event.stream_id] = {
+                        "headers": dict(event.headers),
+                        "data": b"",
+                    }
+                elif isinstance(event, DataReceived):
+                    streams[event.stream_id]["data"] += event.data
+                    connection.acknowledge_received_data(
+                        event.flow_controlled_length, event.stream_id
+                    )
+                elif isinstance(event, StreamEnded):
+                    stream = streams.pop(event.stream_id)
+                    path = stream["headers"][":path"]
+                    payload = json.loads(stream["data"] or b"{}")
+                    self.requests.append((path, payload))
+                    status, body = self.responder(path, payload)
+                    content = json.dumps(body).encode()
+                    connection.send_headers(
+                        event.stream_id,
+                        [
+                            (":status", str(status)),
+                            ("content-type", "application/json"),
+                            ("content-length", str(len(content))),
+                        ],
+                    )
+                    connection.send_data(event.stream_id, content, end_stream=True)
+            writer.write(connection.data_to_send())
+            await writer.drain()
+        writer.close()
+
+    def start(self) -> None:
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        self._server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self._handle, "127.0.0.1", 0), self._loop
+        ).result()
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(_shutdown(self._server), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+async def _shutdown(server: asyncio.AbstractServer | None) -> None:
+    """Closes the server and cancels the connections still open."""
+    if server is not None:
+        server.close()
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class SMTPServer:
+    """A stand-in SMTP server, that stores the received messages, can drop the
+    connection after a number of messages, and can reject some recipients.
+    """
+
+    def __init__(self, drop_after: int | None = None):
+        self.drop_after = drop_after
+        self.rejected: set[str] = set()
+        self.messages: list[tuple[str, list[str], str]] = []
+        self.connections = 0
+        self.port: int | None = None
+        self._loop = asyncio.new_event_loop()
+        self._server: asyncio.AbstractServer | None = None
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self.connections += 1
+        received = 0
+        sender, recipients = "", []
+
+        async def reply(line: str) -> None:
+            writer.write(f"{line}\r\n".encode())
+            await writer.drain()
+
+        await reply("220 localhost ESMTP")
+        while line := await reader.readline():
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb in ("EHLO", "HELO"):
+                await reply("250 localhost")
+            elif verb == "MAIL":
+                sender, recipients = command.split(":", 1)[1].strip(" <>"), []
+                await reply("250 OK")
+            elif verb == "RCPT":
+                recipient = command.split(":", 1)[1].strip(" <>")
+                if recipient in self.rejected:
+                    await reply("550 No such user")
+                else:
+                    recipients.append(recipient)
+                    await reply("250 OK")
+            elif verb == "DATA":
+                await reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while (data_line := await reader.readline()) != b".\r\n":
+                    data.append(data_line.decode())
+                self.messages.append((sender, recipients, "".join(data)))
+                received += 1
+                await reply("250 OK")
+                if self.drop_after is not None and received >= self.drop_after:
+                    break
+            elif verb == "QUIT":
+                await reply("221 Bye")
+                break
+            else:
+                await reply("250 OK")
+        writer.close()
+
+    def start(self) -> None:
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        self._server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self._handle, "127.0.0.1", 0), self._loop
+        ).result()
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(_shutdown(self._server), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
@@ -0,0 +1,20 @@
+from unittest import mock
+
+import pytest
+from django.db.models.signals import post_delete
+
+from snitch.counters import notification_counters, update_counters_on_delete
+from tests.app.models import Notification
+
+
+@pytest.fixture
+def counters():
+    """Enables the counters of notifications, disabled by default, and counts the
+    notifications already created."""
+    with mock.patch("snitch.models.NOTIFICATION_COUNTERS", True), mock.patch(
+        "snitch.managers.NOTIFICATION_COUNTERS", True
+    ), mock.patch("snitch.retention.NOTIFICATION_COUNTERS", True):
+        post_delete.connect(update_counters_on_delete, sender=Notification)
+        notification_counters.rebuild()
+        yield notification_counters
+        post_delete.disconnect(update_counters_on_delete, sender=Notification)
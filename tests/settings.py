@@ -6,6 +6,7 @@ SECRET_KEY = "dummy"
 DATABASES = {"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}}
 
 INSTALLED_APPS = [
+    "django.contrib.admin",
     "django.contrib.auth",
     "django.contrib.contenttypes",
     "django.contrib.sites",
@@ -36,6 +37,17 @@ TEMPLATES = [
     }
 ]
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+# The admin classes are tested without the middleware, the sessions, the messages
+# or rendering their templates
+SILENCED_SYSTEM_CHECKS = [
+    "admin.E402",
+    "admin.E404",
+    "admin.E406",
+    "admin.E408",
+    "admin.E409",
+    "admin.E410",
+    "admin.W411",
+]
 
 # DJANGO PUSH NOTIFICATIONS
 # ------------------------------------------------------------------------------
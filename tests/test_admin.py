@@ -0,0 +1,197 @@
+from unittest import mock
+
+import pytest
+from django.contrib import admin
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from snitch.admin import EventAdmin, NotificationAdmin, notify_action, send_action
+from snitch.models import AdminJob, Event
+from snitch.pagination import EstimatedCountPaginator
+from snitch.tasks import run_admin_job_task
+from tests.app.factories import StuffFactory
+from tests.app.models import Notification
+from tests.factories import UserFactory
+
+
+def changelist_queries(model_admin, request) -> int:
+    """Gets the number of queries to show the rows of a page of the changelist."""
+    changelist = model_admin.get_changelist_instance(request)
+    with CaptureQueriesContext(connection) as queries:
+        for obj in changelist.result_list:
+            [
+                str(getattr(obj, field))
+                for field in model_admin.list_display
+                if hasattr(obj, field)
+            ]
+    return len(queries)
+
+
+@pytest.mark.django_db
+class TestAdmin:
+    def setup_method(self):
+        self.request = RequestFactory().get("/")
+        self.request.user = UserFactory(is_staff=True, is_superuser=True)
+
+    def test_event_changelist(self):
+        users = UserFactory.create_batch(size=2)
+        StuffFactory().spam(user=users[0])
+        model_admin = EventAdmin(Event, admin.site)
+        one = changelist_queries(model_admin, self.request)
+        for user in users:
+            StuffFactory().spam(user=user)
+        assert changelist_queries(model_admin, self.request) == one
+
+    def test_notification_changelist(self):
+        UserFactory.create_batch(size=2)
+        StuffFactory().newsletter()
+        model_admin = NotificationAdmin(Notification, admin.site)
+        one = changelist_queries(model_admin, self.request)
+        StuffFactory().newsletter()
+        assert changelist_queries(model_admin, self.request) == one
+
+
+@pytest.mark.django_db
+class TestAdminActions:
+    def setup_method(self):
+        self.request = RequestFactory().post("/")
+        self.request.user = UserFactory(is_staff=True, is_superuser=True)
+
+    def test_notify_action(self, django_capture_on_commit_callbacks):
+        UserFactory.create_batch(size=2)
+        StuffFactory().newsletter()
+        StuffFactory().newsletter()
+        Notification.objects.all().delete()
+        Event.objects.update(notified=False)
+        model_admin = EventAdmin(Event, admin.site)
+        with mock.patch.object(model_admin, "message_user"):
+            with django_capture_on_commit_callbacks() as callbacks:
+                notify_action(model_admin, self.request, Event.objects.all())
+        job = AdminJob.objects.get()
+        # Nothing is done in the request
+        assert job.status == AdminJob.PENDING
+        assert not Notification.objects.exists()
+        for callback in callbacks:
+            callback()
+        job.refresh_from_db()
+        assert job.status == AdminJob.FINISHED
+        assert job.user == self.request.user
+        assert (job.total, job.processed, job.failed) == (2, 2, 0)
+        assert job.progress == 100
+        assert Notification.objects.count() == 6
+
+    def test_send_action(self, django_capture_on_commit_callbacks):
+        UserFactory.create_batch(size=2)
+        StuffFactory().newsletter()
+        model_admin = NotificationAdmin(Notification, admin.site)
+        notifications = Notification.objects.all()
+        with mock.patch.object(model_admin, "message_user"):
+            with django_capture_on_commit_callbacks(execute=True) as callbacks:
+                send_action(model_admin, self.request, notifications)
+        assert len(callbacks) == 1
+        job = AdminJob.objects.get()
+        assert job.action == AdminJob.SEND
+        assert (job.status, job.processed) == (AdminJob.FINISHED, 3)
+
+    def test_chunks(self, django_capture_on_commit_callbacks):
+        UserFactory.create_batch(size=2)
+        StuffFactory().newsletter()
+        with mock.patch(
+            "snitch.tasks.run_admin_job_task.delay", wraps=run_admin_job_task.delay
+        ) as delay:
+            with django_capture_on_commit_callbacks(execute=True) as callbacks:
+                job = AdminJob.enqueue(
+                    AdminJob.SEND, Notification.objects.all(), chunk_size=2
+                )
+        # A single dispatcher in the request, splitting the chunks
+        assert len(callbacks) == 1
+        assert delay.call_count == 2
+        job.refresh_from_db()
+        assert (job.status, job.total, job.processed) == (AdminJob.FINISHED, 3, 3)
+
+    def test_dispatch_filter(self):
+        UserFactory.create_batch(size=2)
+        StuffFactory().newsletter()
+        notification = Notification.objects.first()
+        job = AdminJob.enqueue(
+            AdminJob.SEND, Notification.objects.exclude(pk=notification.pk)
+        )
+        assert job.dispatch() == 2
+        job.refresh_from_db()
+        assert (job.status, job.total, job.processed) == (AdminJob.FINISHED, 2, 2)
+
+    def test_redelivered_dispatch(self):
+        UserFactory.create_batch(size=2)
+        StuffFactory().newsletter()
+        job = AdminJob.enqueue(AdminJob.SEND, Notification.objects.all())
+        assert job.dispatch() == 3
+        assert job.dispatch() == 0
+        job.refresh_from_db()
+        assert (job.total, job.processed) == (3, 3)
+
+    def test_dispatch_no_objects(self):
+        job = AdminJob.enqueue(AdminJob.SEND, Notification.objects.filter(pk=0))
+        assert job.progress == 0
+        assert job.dispatch() == 0
+        job.refresh_from_db()
+        assert (job.status, job.total) == (AdminJob.FINISHED, 0)
+        assert job.progress == 100
+
+    def test_missing_objects(self):
+        job = AdminJob.objects.create(action=AdminJob.NOTIFY, total=1)
+        assert job.run([0]) == 0
+        job.refresh_from_db()
+        assert (job.status, job.failed) == (AdminJob.FINISHED, 1)
+
+    def test_redelivered_chunk(self):
+        UserFactory.create_batch(size=2)
+        StuffFactory().newsletter()
+        pks = list(Notification.objects.values_list("pk", flat=True))
+        job = AdminJob.objects.create(action=AdminJob.SEND, total=len(pks))
+        job.run(pks)
+        job.run(pks)
+        job.refresh_from_db()
+        assert (job.total, job.processed, job.failed) == (3, 3, 0)
+        assert job.progress == 100
+
+    def test_empty_job(self):
+        job = AdminJob.enqueue(AdminJob.SEND, Notification.objects.none())
+        assert job.status == AdminJob.FINISHED
+
+
+@pytest.mark.django_db
+class TestEstimatedCountPaginator:
+    def setup_method(self):
+        for _ in range(5):
+            StuffFactory().spam(user=UserFactory())
+
+    def test_count(self):
+        paginator = EstimatedCountPaginator(Event.objects.order_by("pk"), 2)
+        assert paginator.count == 5
+        assert paginator.num_pages == 3
+
+    def test_count_over_limit(self):
+        paginator = EstimatedCountPaginator(Event.objects.order_by("pk"), 2)
+        paginator.count_limit = 3
+        # There is always a page after the rows counted
+        assert paginator.count == 4
+        assert paginator.num_pages == 2
+        assert len(paginator.page(2).object_list) == 2
+
+    def test_count_up_to_page(self):
+        paginator = EstimatedCountPaginator(Event.objects.order_by("pk"), 1)
+        paginator.count_limit = 1
+        paginator.page_number = 3
+        assert paginator.count == 4
+        assert len(paginator.page(4).object_list) == 1
+
+    def test_admin_page_number(self):
+        request = RequestFactory().get("/", {"p": "3"})
+        request.user = UserFactory(is_staff=True, is_superuser=True)
+        model_admin = EventAdmin(Event, admin.site)
+        paginator = model_admin.get_paginator(request, Event.objects.all(), 2)
+        assert paginator.page_number == 3
+        request = RequestFactory().get("/", {"p": "last"})
+        paginator = model_admin.get_paginator(request, Event.objects.all(), 2)
+        assert paginator.page_number == 1
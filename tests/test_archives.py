@@ -0,0 +1,118 @@
+import gzip
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.utils import timezone
+
+from snitch import EventHandler
+from snitch.archives import Archiver
+from snitch.exceptions import InvalidArchive
+from snitch.models import Event
+from tests.app.factories import StuffFactory
+from tests.app.models import Notification
+from tests.factories import UserFactory
+
+
+@pytest.mark.django_db
+class TestArchiver:
+    def setup_method(self):
+        UserFactory.create_batch(size=3)
+        stuff = StuffFactory()
+        stuff.newsletter()
+        self.old = Event.objects.get()
+        stuff.newsletter()
+        past = timezone.now() - timedelta(days=40)
+        Event.objects.filter(pk=self.old.pk).update(created=past)
+        Notification.objects.filter(event=self.old).update(created=past)
+        self.before = timezone.now() - timedelta(days=30)
+
+    def test_export(self, tmp_path):
+        manifest = Archiver(batch_size=2).export(tmp_path, before=self.before)
+        assert manifest["files"]["notifications"]["rows"] == 3
+        assert manifest["files"]["events"]["rows"] == 1
+        with gzip.open(tmp_path / "notifications.jsonl.gz", "rt") as archive:
+            rows = [json.loads(line) for line in archive]
+        assert {row["id"] for row in rows} == set(
+            Notification.objects.filter(event=self.old).values_list("pk", flat=True)
+        )
+        assert all(row["event_id"] == self.old.pk for row in rows)
+
+    def test_export_queries(self, tmp_path, django_assert_max_num_queries):
+        # A query for each batch, and the last one empty
+        with django_assert_max_num_queries(5):
+            Archiver(batch_size=2).export(tmp_path, before=self.before)
+
+    def test_verify(self, tmp_path):
+        archiver = Archiver()
+        archiver.export(tmp_path, before=self.before)
+        assert archiver.verify(tmp_path)["before"] == self.before.isoformat()
+
+    def test_verify_corrupted(self, tmp_path):
+        archiver = Archiver()
+        archiver.export(tmp_path, before=self.before)
+        with gzip.open(tmp_path / "events.jsonl.gz", "wb") as archive:
+            archive.write(b"{}\n")
+        with pytest.raises(InvalidArchive):
+            archiver.verify(tmp_path)
+
+    def test_verify_deleted_rows(self, tmp_path):
+        archiver = Archiver()
+        archiver.export(tmp_path, before=self.before)
+        # Already pruned, so it can be resumed
+        Notification.objects.filter(event=self.old).first().delete()
+        assert archiver.verify(tmp_path)
+        Notification.objects.filter(event=self.old).delete()
+        Event.objects.filter(pk=self.old.pk).delete()
+        assert archiver.verify(tmp_path)
+
+    def test_verify_rows_not_archived(self, tmp_path):
+        archiver = Archiver()
+        archiver.export(tmp_path, before=self.before)
+        Notification.objects.exclude(event=self.old).update(
+            created=self.before - timedelta(days=1)
+        )
+        with pytest.raises(InvalidArchive):
+            archiver.verify(tmp_path)
+
+    def test_verify_empty_archive(self, tmp_path):
+        archiver = Archiver()
+        archiver.export(tmp_path, before=self.before - timedelta(days=20))
+        assert archiver.verify(tmp_path)
+        # Created before the date after exporting
+        Event.objects.filter(pk=self.old.pk).update(
+            created=self.before - timedelta(days=30)
+        )
+        with pytest.raises(InvalidArchive):
+            archiver.verify(tmp_path)
+
+    def test_command(self, tmp_path):
+        out = StringIO()
+        call_command("archive_notifications", str(tmp_path), "--days", "30", stdout=out)
+        assert "3 notifications archived." in out.getvalue()
+        call_command("archive_notifications", str(tmp_path), "--verify", stdout=out)
+        assert "is valid" in out.getvalue()
+        with pytest.raises(CommandError):
+            call_command("archive_notifications", str(tmp_path / "missing"), "--verify")
+
+    @mock.patch.object(EventHandler, "retention_days", 1)
+    def test_prune_archived(self, tmp_path):
+        Archiver().export(tmp_path, before=self.before)
+        Notification.objects.exclude(event=self.old).update(
+            created=timezone.now() - timedelta(days=10)
+        )
+        out = StringIO()
+        call_command(
+            "prune_notifications",
+            "--sleep",
+            "0",
+            "--archive",
+            str(tmp_path),
+            stdout=out,
+        )
+        # Out of the retention, but not archived
+        assert "3 notifications and 1 events deleted." in out.getvalue()
+        assert Notification.objects.count() == 3
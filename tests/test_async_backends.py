@@ -0,0 +1,96 @@
+from unittest import mock
+
+import pytest
+from push_notifications.models import GCMDevice
+
+from snitch.backends import AsyncPushNotificationBackend
+from snitch.clients import HTTP2Client
+from tests.app.factories import GCMDeviceFactory, StuffFactory
+from tests.app.models import Notification
+from tests.app.servers import HTTP2Server
+from tests.factories import UserFactory
+
+
+@pytest.fixture
+def server():
+    responses = {}
+
+    def responder(path, payload):
+        token = payload["message"]["token"]
+        return responses.get(token, (200, {"name": f"messages/{token}"}))
+
+    server = HTTP2Server(responder)
+    server.responses = responses
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def client():
+    client = HTTP2Client()
+    with mock.patch("snitch.clients.http2_client", client):
+        yield client
+    client.close()
+
+
+@pytest.mark.django_db
+class TestAsyncPushNotificationBackend:
+    def test_multiplexed_send(self, server, client):
+        user = UserFactory()
+        devices = GCMDeviceFactory.create_batch(size=50, user=user)
+        unregistered, unavailable = devices[0], devices[1]
+        server.responses[unregistered.registration_id] = (
+            404,
+            {
+                "error": {
+                    "status": "NOT_FOUND",
+                    "details": [{"errorCode": "UNREGISTERED"}],
+                }
+            },
+        )
+        server.responses[unavailable.registration_id] = (
+            503,
+            {"error": {"status": "UNAVAILABLE"}},
+        )
+        with mock.patch("snitch.backends.ENABLED_SEND_NOTIFICATIONS", False):
+            stuff = StuffFactory()
+            stuff.localized()
+        notification = Notification.objects.get()
+        backend = AsyncPushNotificationBackend(notification)
+        with mock.patch(
+            "snitch.backends.PUSH_PROVIDERS",
+            {"fcm": {"url": f"{server.url}/v1/projects/snitch/messages:send"}},
+        ), mock.patch(
+            "snitch.backends.retry_push_notification_task.apply_async"
+        ) as apply_async:
+            backend.send()
+        # All the requests use the same connection
+        assert server.connections == 1
+        assert len(server.requests) == len(devices)
+        path, payload = server.requests[0]
+        assert path == "/v1/projects/snitch/messages:send"
+        assert payload["message"]["data"]["notification"] == str(notification.pk)
+        # Unregistered devices are deactivated
+        unregistered.refresh_from_db()
+        assert not unregistered.active
+        assert GCMDevice.objects.filter(active=True).count() == len(devices) - 1
+        # Only the failed device is retried
+        assert apply_async.call_count == 1
+        assert apply_async.call_args.args[0][3] == [unavailable.pk]
+        notification.refresh_from_db()
+        assert notification.push_delivered == len(devices) - 2
+        assert notification.push_failed == 1
+
+    def test_reuses_connection(self, server, client):
+        url = f"{server.url}/v1/projects/snitch/messages:send"
+        for token in ["a", "b"]:
+            responses = client.send([(token, url, {}, {"message": {"token": token}})])
+            assert responses == [(token, 200, {"name": f"messages/{token}"})]
+        assert server.connections == 1
+
+    def test_connection_error(self, client):
+        responses = client.send(
+            [("a", "http://127.0.0.1:1/", {}, {"message": {"token": "a"}})]
+        )
+        assert responses == [("a", None, {"error": "ConnectError"})]
@@ -1,8 +1,13 @@
+from unittest import mock
+
 import pytest
 from django.contrib.contenttypes.models import ContentType
-from push_notifications.models import GCMDevice
+from django.core.cache import cache
+from push_notifications.exceptions import APNSServerError
+from push_notifications.models import APNSDevice, GCMDevice, GCMDeviceQuerySet
 
 from snitch.backends import PushNotificationBackend
+from snitch.devices import device_cache
 from snitch.models import Event
 from tests.app.events import CONFIRMED_EVENT, LOCALIZED_EVENT
 from tests.app.factories import GCMDeviceFactory, StuffFactory
@@ -88,3 +93,276 @@ class TestPushNotificationBackend:
             "title_loc_args": [],
             "title_loc_key": "localized_title",
         }
+
+    def test_get_devices_excludes_inactive(self):
+        user = UserFactory()
+        GCMDeviceFactory(user=user)
+        GCMDeviceFactory(user=user, active=False)
+        stuff = StuffFactory()
+        stuff.localized()
+        notification = Notification.objects.first()
+        backend = PushNotificationBackend(notification)
+        assert backend.get_devices(GCMDevice).count() == 1
+
+    def test_parse_response(self):
+        user = UserFactory()
+        GCMDeviceFactory(user=user)
+        stuff = StuffFactory()
+        stuff.localized()
+        backend = PushNotificationBackend(Notification.objects.first())
+        assert backend.parse_response(
+            ["a", "b"], {"results": [{"message_id": "1"}, {"error": "NotRegistered"}]}
+        ) == {"a": None, "b": "NotRegistered"}
+        assert backend.parse_response(
+            ["a", "b"], [{"a": "Success", "b": "BadDeviceToken"}]
+        ) == {"a": None, "b": "BadDeviceToken"}
+
+    def test_registration_ids_order(self, django_assert_num_queries):
+        user = UserFactory()
+        devices = [
+            GCMDeviceFactory(user=user, application_id=application_id)
+            for application_id in ["b", "a", "b", "a"]
+        ]
+        GCMDeviceFactory(user=user, application_id="a", cloud_message_type="GCM")
+        stuff = StuffFactory()
+        stuff.localized()
+        backend = PushNotificationBackend(Notification.objects.first())
+        ordered = backend.sending_order(backend.get_devices(GCMDevice))
+        with django_assert_num_queries(1):
+            registration_ids = backend._registration_ids(ordered)
+        assert registration_ids == [
+            device.registration_id
+            for device in sorted(devices, key=lambda d: (d.application_id, d.pk))
+        ]
+
+    def test_send_to_devices_batch_invalid(self):
+        user = UserFactory()
+        valid = GCMDeviceFactory(user=user, application_id="snitch")
+        invalid = GCMDeviceFactory(user=user, application_id="snitch")
+        sent_to = []
+
+        def send_message(devices, message, extra):
+            registration_ids = list(devices.values_list("registration_id", flat=True))
+            sent_to.append(registration_ids)
+            return {
+                "results": [
+                    {"error": "NotRegistered"}
+                    if registration_id == invalid.registration_id
+                    else {"message_id": "1"}
+                    for registration_id in registration_ids
+                ]
+            }
+
+        with mock.patch.object(
+            GCMDeviceQuerySet, "send_message", autospec=True, side_effect=send_message
+        ):
+            stuff = StuffFactory()
+            stuff.localized()
+        notification = Notification.objects.get()
+        # The invalid device is not retried, and django-push-notifications is the
+        # one deactivating it
+        assert len(sent_to) == 1
+        valid.refresh_from_db()
+        invalid.refresh_from_db()
+        assert valid.active and invalid.active
+        assert (notification.push_delivered, notification.push_failed) == (1, 1)
+
+    def test_send_to_devices_no_batch_invalid(self):
+        user = UserFactory()
+        device = GCMDeviceFactory(user=user)
+        stuff = StuffFactory()
+        stuff.localized()
+        notification = Notification.objects.first()
+        backend = PushNotificationBackend(notification)
+        backend.batch_sending = False
+        with mock.patch(
+            "push_notifications.models.GCMDevice.send_message",
+            side_effect=APNSServerError(status="Unregistered"),
+        ), mock.patch(
+            "snitch.backends.retry_push_notification_task.apply_async"
+        ) as apply_async:
+            backend.send()
+        assert not apply_async.called
+        device.refresh_from_db()
+        assert device.active
+
+    def test_send_to_devices_retries_failed_subset(self):
+        user = UserFactory()
+        delivered = GCMDeviceFactory(user=user)
+        failing = GCMDeviceFactory(user=user)
+        sent_to = []
+
+        def send_message(devices, message, extra):
+            registration_ids = list(devices.values_list("registration_id", flat=True))
+            sent_to.append(registration_ids)
+            return {
+                "results": [
+                    {"error": "Unavailable"}
+                    if registration_id == failing.registration_id
+                    else {"message_id": "1"}
+                    for registration_id in registration_ids
+                ]
+            }
+
+        with mock.patch.object(
+            GCMDeviceQuerySet, "send_message", autospec=True, side_effect=send_message
+        ):
+            stuff = StuffFactory()
+            stuff.localized()
+        notification = Notification.objects.get()
+        max_retries = PushNotificationBackend.max_retries
+        assert len(sent_to) == max_retries + 1
+        assert set(sent_to[0]) == {delivered.registration_id, failing.registration_id}
+        assert all(retry == [failing.registration_id] for retry in sent_to[1:])
+        assert notification.sent
+        assert notification.push_attempts == max_retries + 1
+        assert notification.push_delivered == 1
+        assert notification.push_failed == 1
+
+    def test_send_to_platforms_one_attempt(self):
+        user = UserFactory()
+        GCMDeviceFactory(user=user)
+        apns = APNSDevice.objects.create(user=user, registration_id="apns", active=True)
+        with mock.patch.object(
+            GCMDeviceQuerySet,
+            "send_message",
+            return_value={"results": [{"message_id": "1"}]},
+        ), mock.patch(
+            "push_notifications.models.APNSDeviceQuerySet.send_message",
+            return_value=[{apns.registration_id: "Success"}],
+        ):
+            stuff = StuffFactory()
+            stuff.localized()
+        notification = Notification.objects.get()
+        assert notification.push_attempts == 1
+        assert notification.push_delivered == 2
+
+    def test_retry_countdown(self):
+        user = UserFactory()
+        GCMDeviceFactory(user=user)
+        stuff = StuffFactory()
+        stuff.localized()
+        backend = PushNotificationBackend(Notification.objects.first())
+        for attempt in range(10):
+            backend.attempt = attempt
+            backoff = min(
+                backend.retry_backoff_max, backend.retry_backoff * 2**attempt
+            )
+            assert backoff / 2 <= backend.retry_countdown() <= backoff
+
+    @mock.patch("snitch.backends.PUSH_RATE_LIMITS", {"fcm": (1, 60)})
+    def test_send_to_devices_defers_over_quota(self):
+        cache.clear()
+        user = UserFactory()
+        GCMDeviceFactory(user=user)
+        GCMDeviceFactory(user=user)
+        sent_to = []
+
+        def send_message(devices, message, extra):
+            sent_to.append(list(devices.values_list("registration_id", flat=True)))
+
+        with mock.patch.object(
+            GCMDeviceQuerySet, "send_message", autospec=True, side_effect=send_message
+        ), mock.patch(
+            "snitch.backends.retry_push_notification_task.apply_async"
+        ) as apply_async:
+            stuff = StuffFactory()
+            stuff.localized()
+        notification = Notification.objects.get()
+        assert len(sent_to) == 1
+        assert len(sent_to[0]) == 1
+        assert apply_async.call_count == 1
+        args = apply_async.call_args.args[0]
+        deferred = GCMDevice.objects.get(pk__in=args[3])
+        assert deferred.registration_id not in sent_to[0]
+        # Deferring doesn't count as an attempt, and the quota is reserved
+        assert args[4:] == (0, True)
+        assert apply_async.call_args.kwargs["countdown"] == pytest.approx(60, abs=1)
+        assert notification.push_delivered == 1
+
+    @mock.patch("snitch.backends.PUSH_RATE_LIMITS", {"fcm": (1, 60)})
+    def test_send_to_devices_spreads_deferrals(self):
+        cache.clear()
+        for _ in range(3):
+            GCMDeviceFactory(user=UserFactory())
+        with mock.patch.object(GCMDeviceQuerySet, "send_message", autospec=True):
+            with mock.patch(
+                "snitch.backends.retry_push_notification_task.apply_async"
+            ) as apply_async:
+                stuff = StuffFactory()
+                stuff.localized()
+        # Each deferral waits for the previous ones
+        countdowns = [call.kwargs["countdown"] for call in apply_async.call_args_list]
+        assert countdowns == pytest.approx([60, 120], abs=1)
+
+    @mock.patch("snitch.backends.PUSH_RATE_LIMITS", {"fcm": (1, 60)})
+    def test_send_to_devices_deferred_with_reserved_quota(self):
+        cache.clear()
+        user = UserFactory()
+        GCMDeviceFactory(user=user)
+        GCMDeviceFactory(user=user)
+        # The retries run eagerly, with the quota already reserved
+        with mock.patch.object(
+            GCMDeviceQuerySet, "send_message", autospec=True
+        ) as send_message:
+            stuff = StuffFactory()
+            stuff.localized()
+        notification = Notification.objects.get()
+        assert send_message.call_count == 2
+        assert notification.push_delivered == 2
+        assert notification.push_failed == 0
+
+    @mock.patch("snitch.backends.PUSH_RATE_LIMITS", {"fcm": (1, 60)})
+    @mock.patch.object(PushNotificationBackend, "max_quota_delay", 30)
+    def test_send_to_devices_over_quota_max_delay(self):
+        cache.clear()
+        user = UserFactory()
+        GCMDeviceFactory(user=user)
+        GCMDeviceFactory(user=user)
+        with mock.patch.object(
+            GCMDeviceQuerySet, "send_message", autospec=True
+        ) as send_message:
+            stuff = StuffFactory()
+            stuff.localized()
+        notification = Notification.objects.get()
+        assert send_message.call_count == 1
+        assert notification.push_delivered == 1
+        assert notification.push_failed == 1
+
+    def test_device_cache(self, django_assert_num_queries):
+        cache.clear()
+        user = UserFactory()
+        stuff = StuffFactory()
+        stuff.localized()
+        backend = PushNotificationBackend(Notification.objects.first())
+        backend.use_device_cache = True
+        assert backend.get_devices(GCMDevice).count() == 0
+        assert backend.get_devices(APNSDevice).count() == 0
+        # The user has no devices, so there is no query
+        with django_assert_num_queries(0):
+            assert not backend.get_devices(GCMDevice).exists()
+            backend.send()
+        # Saving a device invalidates the cache
+        device = GCMDeviceFactory(user=user)
+        devices = backend.get_devices(GCMDevice)
+        assert devices.count() == 1
+        # The registration IDs are always queried, so they are never stale
+        GCMDevice.objects.filter(pk=device.pk).update(registration_id="updated")
+        assert backend._registration_ids(devices) == ["updated"]
+        device.delete()
+        assert backend.get_devices(GCMDevice).count() == 0
+
+    def test_device_cache_change_user(self):
+        cache.clear()
+        user = UserFactory()
+        other_user = UserFactory()
+        device = GCMDeviceFactory(user=other_user)
+        assert device_cache.get(GCMDevice, user.pk) is None
+        device_cache.set(GCMDevice, user.pk, False)
+        device_cache.set(GCMDevice, other_user.pk, True)
+        device = GCMDevice.objects.get(pk=device.pk)
+        device.user = user
+        device.save()
+        # Both the previous and the new user are invalidated
+        assert device_cache.get(GCMDevice, user.pk) is None
+        assert device_cache.get(GCMDevice, other_user.pk) is None
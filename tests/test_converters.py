@@ -0,0 +1,65 @@
+import pytest
+from django.template.loader import render_to_string
+from django.test import override_settings
+
+from snitch.converters import (
+    BleachPlainTextConverter,
+    HTMLParserPlainTextConverter,
+    get_plain_text_converter,
+)
+
+
+class TestPlainTextConverters:
+    @pytest.mark.parametrize(
+        "html,plain",
+        [
+            ("Hello world!", "Hello world!"),
+            (
+                "<h1>Title</h1><p>First paragraph.</p><p>Second\n  paragraph.</p>",
+                "Title\n\nFirst paragraph.\nSecond paragraph.",
+            ),
+            (
+                "<p>Fish &amp; chips &lt;3 &quot;quoted&quot; it&#x27;s</p>",
+                'Fish & chips <3 "quoted" it\'s',
+            ),
+            ("<style>p { color: red; }</style><p>Styled</p>", "Styled"),
+            ("<!-- comment --><div><b>Nested</b> tags</div>", "Nested tags"),
+            ("<a href='https://example.com/'>Link</a><br>Next", "Link\nNext"),
+        ],
+    )
+    def test_html_parser(self, html, plain):
+        assert HTMLParserPlainTextConverter().convert(html) == plain
+
+    @pytest.mark.django_db
+    def test_template(self):
+        html = render_to_string(
+            "newsletter.html", {"name": "<O'Brien>", "items": range(2)}
+        )
+        assert HTMLParserPlainTextConverter().convert(html) == (
+            "Hello <O'Brien>!\n\nItem 0 is available.\nItem 1 is available."
+        )
+
+    def test_bleach(self):
+        html = "<style>p { color: red; }</style><p>Hello world!</p>"
+        assert BleachPlainTextConverter().convert(html) == "Hello world!"
+
+    def test_cache(self):
+        converter = HTMLParserPlainTextConverter(cache_size=2)
+        for html in ["<p>First</p>", "<p>Second</p>", "<p>Third</p>"]:
+            converter.convert(html)
+        assert len(converter._cache) == 2
+        # Cached texts don't need a conversion
+        converter.to_plain = None
+        assert converter.convert("<p>Third</p>") == "Third"
+
+    def test_get_plain_text_converter(self):
+        assert isinstance(get_plain_text_converter(), BleachPlainTextConverter)
+        with override_settings(
+            SNITCH_EMAIL_PLAIN_TEXT_CONVERTER=(
+                "snitch.converters.HTMLParserPlainTextConverter"
+            )
+        ):
+            converter = get_plain_text_converter()
+            assert isinstance(converter, HTMLParserPlainTextConverter)
+            # The converter is created once, to keep its cache
+            assert get_plain_text_converter() is converter
@@ -0,0 +1,114 @@
+from unittest import mock
+
+import pytest
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.management import call_command
+
+from snitch.counters import notification_counters
+from snitch.models import NotificationCounter
+from tests.app.factories import StuffFactory
+from tests.app.models import Notification
+from tests.factories import UserFactory
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.usefixtures("counters")
+class TestNotificationCounters:
+    def setup_method(self):
+        cache.clear()
+
+    def notify(self, times: int = 3):
+        self.user, self.other = UserFactory.create_batch(size=2)
+        stuff = StuffFactory()
+        for _ in range(times):
+            stuff.newsletter()
+
+    def test_created(self):
+        self.notify()
+        assert notification_counters.get(self.user) == {"unread": 3, "unreceived": 3}
+        assert notification_counters.unread(self.other) == 3
+
+    def test_cached(self, django_assert_num_queries):
+        self.notify()
+        notification_counters.unread(self.user)
+        with django_assert_num_queries(0):
+            assert notification_counters.unread(self.user) == 3
+
+    def test_stale_value_not_cached(self):
+        self.notify()
+        receiver = (ContentType.objects.get_for_model(self.user).pk, self.user.pk)
+        # A reader gets the key and the counters before a change is committed
+        key = notification_counters._key(receiver)
+        Notification.objects.accessible(self.user).mark_read()
+        # And caches them after the change
+        cache.set(key, {"unread": 3, "unreceived": 3})
+        assert notification_counters.unread(self.user) == 0
+
+    def test_save(self):
+        self.notify()
+        notification = Notification.objects.accessible(self.user).first()
+        notification.read = True
+        notification.save()
+        notification.save()
+        assert notification_counters.unread(self.user) == 2
+        notification.received = True
+        notification.save(update_fields=["received"])
+        assert notification_counters.get(self.user) == {"unread": 2, "unreceived": 2}
+        assert notification_counters.unread(self.other) == 3
+
+    def test_bulk_update(self):
+        self.notify()
+        notifications = Notification.objects.accessible(self.user)
+        assert notifications.filter(pk=notifications.first().pk).update(read=True) == 1
+        assert notification_counters.unread(self.user) == 2
+        assert notifications.update(read=True, received=True) == 3
+        assert notification_counters.get(self.user) == {"unread": 0, "unreceived": 0}
+        notifications.update(read=False)
+        assert notification_counters.unread(self.user) == 3
+        assert notification_counters.unread(self.other) == 3
+
+    def test_update_locked_rows(self):
+        self.notify()
+        notifications = Notification.objects.accessible(self.user)
+        deltas = notification_counters.deltas
+
+        def insert_after_lock(*args, **kwargs):
+            # A notification created after the rows are locked is not updated
+            StuffFactory().newsletter()
+            return deltas(*args, **kwargs)
+
+        with mock.patch.object(
+            notification_counters, "deltas", side_effect=insert_after_lock
+        ):
+            assert notifications.mark_received() == 3
+        assert notifications.filter(received=False).count() == 1
+        assert notification_counters.get(self.user) == {"unread": 4, "unreceived": 1}
+
+    def test_update_twice(self):
+        self.notify()
+        pk = Notification.objects.accessible(self.user).first().pk
+        # A receipt delivered twice only counts once
+        assert Notification.objects.filter(pk=pk).update(received=True) == 1
+        assert Notification.objects.filter(pk=pk).update(received=True) == 0
+        assert notification_counters.get(self.user) == {"unread": 3, "unreceived": 2}
+
+    def test_delete(self):
+        self.notify()
+        Notification.objects.accessible(self.user).first().delete()
+        assert notification_counters.unread(self.user) == 2
+        Notification.objects.all().delete()
+        assert notification_counters.unread(self.other) == 0
+
+    def test_rebuild(self):
+        self.notify(times=5)
+        NotificationCounter.objects.update(unread=100, unreceived=100)
+        stale = NotificationCounter.objects.create(
+            receiver_content_type_id=NotificationCounter.objects.first().receiver_content_type_id,
+            receiver_id=self.other.pk + 1,
+            unread=1,
+        )
+        call_command("rebuild_notification_counters", batch_size=1)
+        assert notification_counters.get(self.user) == {"unread": 5, "unreceived": 5}
+        assert notification_counters.unread(self.other) == 5
+        assert not NotificationCounter.objects.filter(pk=stale.pk).exists()
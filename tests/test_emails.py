@@ -0,0 +1,250 @@
+import smtplib
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+from django.core import mail
+from django.core.cache import cache
+from django.utils import timezone
+
+from snitch.backends import DigestEmailNotificationBackend
+from snitch.emails import TemplateEmailMessage, email_batch, send_messages
+from snitch.models import Event
+from snitch.tasks import flush_email_digests_task
+from tests.app.emails import WelcomeEmail
+from tests.app.events import NewsletterHandler
+from tests.app.factories import StuffFactory
+from tests.app.models import Notification
+from tests.app.servers import SMTPServer
+from tests.factories import UserFactory
+
+
+@pytest.fixture
+def smtp_server(settings):
+    server = SMTPServer()
+    server.start()
+    settings.EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+    settings.EMAIL_HOST = "127.0.0.1"
+    settings.EMAIL_PORT = server.port
+    yield server
+    server.stop()
+
+
+def welcome_emails(size: int) -> list[WelcomeEmail]:
+    return [
+        WelcomeEmail(to=f"test{index}@example.com", context={}) for index in range(size)
+    ]
+
+
+@pytest.mark.django_db
+class TestBatchEmails:
+    def test_send_batch(self):
+        assert TemplateEmailMessage.send_batch(welcome_emails(5)) == 5
+        assert len(mail.outbox) == 5
+        assert mail.outbox[0].to == ["test0@example.com"]
+        assert mail.outbox[0].alternatives
+
+    def test_send_batch_reuses_connection(self, smtp_server):
+        assert TemplateEmailMessage.send_batch(welcome_emails(10)) == 10
+        assert smtp_server.connections == 1
+        assert [recipients for _, recipients, _ in smtp_server.messages] == [
+            [f"test{index}@example.com"] for index in range(10)
+        ]
+
+    def test_send_batch_size(self, smtp_server):
+        assert TemplateEmailMessage.send_batch(welcome_emails(10), batch_size=4) == 10
+        assert smtp_server.connections == 3
+        assert len(smtp_server.messages) == 10
+
+    def test_send_messages_reconnects(self, smtp_server):
+        smtp_server.drop_after = 3
+        messages = [email.build(*email.render()) for email in welcome_emails(7)]
+        assert send_messages(messages) == 7
+        assert smtp_server.connections == 3
+        assert len(smtp_server.messages) == 7
+
+    def test_send_batch_without_recipients(self):
+        emails = welcome_emails(2)
+        emails[0].to = [""]
+        assert TemplateEmailMessage.send_batch(emails) == 1
+        assert len(mail.outbox) == 1
+
+    def test_send_batch_fake(self):
+        emails = welcome_emails(2)
+        emails[0].fake = True
+        assert TemplateEmailMessage.send_batch(emails) == 1
+        assert len(mail.outbox) == 1
+
+    def test_async_send_batch(self, smtp_server):
+        sent = TemplateEmailMessage.send_batch(
+            welcome_emails(5), batch_size=2, use_async=True
+        )
+        assert sent == 5
+        assert smtp_server.connections == 3
+        assert len(smtp_server.messages) == 5
+
+    def test_async_send_batch_shares_bodies(self):
+        with mock.patch("snitch.emails.send_batch_email_asynchronously.delay") as delay:
+            TemplateEmailMessage.send_batch(welcome_emails(5), use_async=True)
+        assert delay.call_count == 1
+        bodies, emails = delay.call_args.args
+        assert len(bodies) == 1
+        assert len(emails) == 5
+        assert all(email["body"] == 0 for email in emails)
+
+    def test_email_batch(self, smtp_server):
+        with email_batch():
+            for email in welcome_emails(3):
+                email.send(use_async=False)
+            # Nested blocks are sent by the outer one
+            with email_batch():
+                welcome_emails(1)[0].send(use_async=False)
+            assert not smtp_server.messages
+        assert smtp_server.connections == 1
+        assert len(smtp_server.messages) == 4
+
+    def test_notify_reuses_connection(self, smtp_server):
+        for index in range(3):
+            UserFactory(email=f"test{index}@example.com")
+        StuffFactory().newsletter()
+        assert smtp_server.connections == 1
+        assert len(smtp_server.messages) == 3
+
+    @mock.patch.object(NewsletterHandler, "template_email_async", True, create=True)
+    def test_notify_async_batch(self):
+        for index in range(3):
+            UserFactory(email=f"test{index}@example.com")
+        with mock.patch("snitch.emails.send_batch_email_asynchronously.delay") as delay:
+            StuffFactory().newsletter()
+        assert delay.call_count == 1
+        _, emails = delay.call_args.args
+        assert len(emails) == 3
+
+
+@pytest.mark.django_db
+class TestSharedEmails:
+    def setup_method(self):
+        cache.clear()
+
+    def newsletter(self, name, shared_key=None):
+        return TemplateEmailMessage(
+            to="test@example.com",
+            template_name="newsletter.html",
+            context={"items": range(3)},
+            recipient_context={"name": name},
+            shared_key=shared_key,
+        )
+
+    def test_shared_messages(self):
+        name = "<b>O'Brien</b>"
+        assert self.newsletter(name, "key").render() == self.newsletter(name).render()
+
+    def test_render_once(self):
+        with mock.patch.object(
+            TemplateEmailMessage,
+            "get_message",
+            autospec=True,
+            side_effect=TemplateEmailMessage.get_message,
+        ) as get_message:
+            first, _ = self.newsletter("first", "key").render()
+            second, _ = self.newsletter("second", "key").render()
+        assert get_message.call_count == 1
+        assert "Hello first!" in first
+        assert "Hello second!" in second
+
+    def test_email_backend(self):
+        users = [UserFactory(email=f"test{index}@example.com") for index in range(3)]
+        stuff = StuffFactory()
+        with mock.patch.object(
+            TemplateEmailMessage,
+            "get_message",
+            autospec=True,
+            side_effect=TemplateEmailMessage.get_message,
+        ) as get_message:
+            stuff.newsletter()
+        assert Event.objects.count() == 1
+        assert get_message.call_count == 1
+        # The shared message is not rendered with the notification of a recipient
+        email_message = get_message.call_args.args[0]
+        assert "notification" not in email_message.default_context
+        assert len(mail.outbox) == len(users)
+        for email, user in zip(mail.outbox, users):
+            assert f"Hello {user.username}!" in email.alternatives[0][0]
+            assert f"Hello {user.username}!" in email.body
+        # The kwargs of the handler class are not changed
+        assert NewsletterHandler.template_email_kwargs == {
+            "template_name": "newsletter.html"
+        }
+
+
+@pytest.mark.django_db
+class TestDigestEmails:
+    def test_queue(self):
+        users = UserFactory.create_batch(size=2)
+        for user in users:
+            user.email = f"{user.username}@example.com"
+            user.save()
+        stuff = StuffFactory()
+        for _ in range(3):
+            stuff.digest()
+        assert len(mail.outbox) == 0
+        assert Notification.objects.filter(email_digest_at__isnull=False).count() == 6
+        # Nothing is sent before the interval
+        assert DigestEmailNotificationBackend.flush() == 0
+        now = timezone.now() + timedelta(seconds=600)
+        assert DigestEmailNotificationBackend.flush(now=now) == 2
+        assert sorted(email.to[0] for email in mail.outbox) == sorted(
+            user.email for user in users
+        )
+        assert mail.outbox[0].body.count("Digested") == 3
+        assert not Notification.objects.filter(email_digest_at__isnull=False).exists()
+        assert DigestEmailNotificationBackend.flush(now=now) == 0
+
+    def test_flush_all_queued(self):
+        user = UserFactory(email="test@example.com")
+        stuff = StuffFactory()
+        stuff.digest()
+        # The notifications of the receiver that are not due yet are sent too
+        with mock.patch(
+            "tests.app.events.DigestHandler.template_email_digest_interval", 3600
+        ):
+            stuff.digest()
+        now = timezone.now() + timedelta(seconds=600)
+        assert flush_email_digests_task.delay().get() == 0
+        with mock.patch("snitch.backends.timezone.now", return_value=now):
+            assert flush_email_digests_task.delay().get() == 1
+        assert mail.outbox[0].to == [user.email]
+        assert mail.outbox[0].body.count("Digested") == 2
+
+    def test_flush_send_error(self):
+        UserFactory(email="test@example.com")
+        StuffFactory().digest()
+        queued = Notification.objects.get().email_digest_at
+        now = timezone.now() + timedelta(seconds=600)
+        with mock.patch(
+            "snitch.backends.send_messages", side_effect=smtplib.SMTPException
+        ):
+            with pytest.raises(smtplib.SMTPException):
+                DigestEmailNotificationBackend.flush(now=now)
+        # The notifications are queued again, to be sent in the next flush
+        assert Notification.objects.get().email_digest_at == queued
+        assert DigestEmailNotificationBackend.flush(now=now) == 1
+
+    def test_flush_render_error(self):
+        users = [UserFactory(email=f"test{index}@example.com") for index in range(3)]
+        StuffFactory().digest()
+        now = timezone.now() + timedelta(seconds=600)
+        render = TemplateEmailMessage.render
+
+        def fail(email):
+            if email.to == [users[0].email]:
+                raise ValueError
+            return render(email)
+
+        with mock.patch.object(
+            TemplateEmailMessage, "render", autospec=True, side_effect=fail
+        ):
+            assert DigestEmailNotificationBackend.flush(now=now, batch_size=2) == 2
+        assert users[0].email not in [email.to[0] for email in mail.outbox]
+        queued = Notification.objects.filter(email_digest_at__isnull=False)
+        assert [notification.receiver_id for notification in queued] == [users[0].pk]
@@ -0,0 +1,67 @@
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+
+from snitch.limiters import QuotaLimiter
+
+
+class TestQuotaLimiter:
+    def setup_method(self):
+        cache.clear()
+
+    def test_acquire(self):
+        limiter = QuotaLimiter(name="test", tokens=10, period=60)
+        assert limiter.acquire(4) == 4
+        assert limiter.acquire(4) == 4
+        assert limiter.acquire(4) == 2
+        assert limiter.acquire(1) == 0
+
+    def test_shared_bucket(self):
+        limiter = QuotaLimiter(name="test", tokens=10, period=60)
+        other_limiter = QuotaLimiter(name="test", tokens=10, period=60)
+        assert limiter.acquire(8) == 8
+        assert other_limiter.acquire(8) == 2
+
+    def test_wait_time(self):
+        limiter = QuotaLimiter(name="test", tokens=10, period=60)
+        assert limiter.wait_time() == 0
+        limiter.acquire(10)
+        assert 0 < limiter.wait_time() <= 6
+        assert 54 < limiter.wait_time(10) <= 60
+        # After the tokens reserved
+        limiter.reserve(10)
+        assert 114 < limiter.wait_time(10) <= 120
+
+    def test_reserve(self):
+        limiter = QuotaLimiter(name="test", tokens=10, period=1)
+        with mock.patch("snitch.limiters.time.time", return_value=1000.0):
+            assert limiter.reserve(4) == 0
+            assert limiter.acquire(10) == 6
+            # Each reservation waits for the previous ones
+            assert limiter.reserve(1) == pytest.approx(0.1)
+            assert limiter.reserve(1) == pytest.approx(0.2)
+            assert limiter.reserve(10, max_wait=0.5) is None
+            assert limiter.reserve(3, max_wait=0.5) == pytest.approx(0.5)
+            # Nothing is granted while in debt
+            assert limiter.acquire(1) == 0
+        with mock.patch("snitch.limiters.time.time", return_value=1001.0):
+            assert limiter.acquire(10) == 5
+
+    def test_refill(self):
+        limiter = QuotaLimiter(name="test", tokens=10, period=60)
+        with mock.patch("snitch.limiters.time.time", return_value=1000.0):
+            assert limiter.acquire(10) == 10
+            assert limiter.acquire(1) == 0
+        # The tokens are refilled continuously
+        with mock.patch("snitch.limiters.time.time", return_value=1030.0):
+            assert limiter.acquire(10) == 5
+        # The bucket doesn't hold more than the given tokens
+        with mock.patch("snitch.limiters.time.time", return_value=2000.0):
+            assert limiter.acquire(20) == 10
+
+    @pytest.mark.parametrize("tokens", [0, -1])
+    def test_acquire_nothing(self, tokens):
+        limiter = QuotaLimiter(name="test", tokens=10, period=60)
+        assert limiter.acquire(tokens) == 0
+        assert limiter.acquire(10) == 10
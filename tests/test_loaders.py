@@ -0,0 +1,53 @@
+from unittest import mock
+
+import pytest
+from celery.signals import worker_process_init
+from django.utils import translation
+
+from snitch.loaders import TemplateCache, handler_template_names, template_cache
+from snitch.settings import EMAIL_DIGEST_TEMPLATE
+from tests.app.emails import WelcomeEmail
+
+
+class TestTemplateCache:
+    def test_hits_and_misses(self):
+        cache = TemplateCache()
+        assert cache.render("email.html", {}) == "Hello world!"
+        assert cache.render("email.html", {}) == "Hello world!"
+        # The same template for all the languages
+        with translation.override("es"):
+            cache.get("email.html")
+        assert cache.stats() == {"hits": 2, "misses": 1, "size": 1}
+        cache.clear()
+        assert cache.stats() == {"hits": 0, "misses": 0, "size": 0}
+
+    def test_handler_template_names(self):
+        template_names = handler_template_names()
+        assert "email.html" in template_names
+        assert "newsletter.html" in template_names
+        assert EMAIL_DIGEST_TEMPLATE in template_names
+
+    @pytest.mark.django_db
+    def test_warm(self):
+        cache = TemplateCache()
+        assert cache.warm(["email.html", "missing.html", "email.html"]) == 1
+        assert cache.warm(["email.html"]) == 0
+        with translation.override("es"):
+            cache.get("email.html")
+        assert cache.stats() == {"hits": 1, "misses": 0, "size": 1}
+
+    @pytest.mark.django_db
+    def test_warm_at_worker_start(self):
+        cache = TemplateCache()
+        with mock.patch("snitch.loaders.template_cache", cache):
+            worker_process_init.send(sender=None)
+        assert cache.stats()["size"] == len(set(handler_template_names()))
+
+    @pytest.mark.django_db
+    def test_email_uses_cache(self):
+        template_cache.clear()
+        with mock.patch("snitch.emails.EMAIL_TEMPLATE_CACHE", True):
+            for _ in range(3):
+                WelcomeEmail(to="test@example.com", context={}).get_message()
+        assert template_cache.stats()["misses"] == 1
+        assert template_cache.stats()["hits"] == 2
@@ -0,0 +1,174 @@
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from snitch.exceptions import InvalidCursor, InvalidPageSize
+from snitch.models import Event, NotificationCounter
+from snitch.pagination import encode_cursor
+from tests.app.events import SPAM
+from tests.app.factories import StuffFactory
+from tests.app.models import Notification
+from tests.factories import UserFactory
+
+
+@pytest.mark.django_db
+class TestEventQuerySet:
+    def setup_method(self):
+        self.users = UserFactory.create_batch(size=3)
+        Event.objects.bulk_create(
+            [
+                Event(verb=SPAM, actor=user, trigger=other, target=StuffFactory())
+                for user, other in zip(self.users, reversed(self.users))
+            ]
+        )
+
+    def test_with_event_objects(self):
+        # A query for the events, and one for each content type
+        with CaptureQueriesContext(connection) as queries:
+            events = list(Event.objects.with_event_objects())
+            actors = [event.actor for event in events]
+            targets = [event.target for event in events]
+            [str(event) for event in events]
+        assert len(queries) == 3
+        assert set(actors) == set(self.users)
+        assert all(target is not None for target in targets)
+        assert [event.trigger for event in events] == list(reversed(actors))
+
+    def test_with_event_objects_chained(self):
+        events = Event.objects.with_event_objects().filter(
+            actor_object_id=self.users[0].pk
+        )
+        with CaptureQueriesContext(connection) as queries:
+            assert [event.actor for event in events] == [self.users[0]]
+        assert len(queries) == 3
+
+    def test_with_event_objects_values(self):
+        events = Event.objects.with_event_objects().values_list("verb", flat=True)
+        assert len(list(events)) == 3
+
+
+@pytest.mark.django_db
+class TestNotificationQuerySet:
+    def setup_method(self):
+        self.users = UserFactory.create_batch(size=3)
+        stuff = StuffFactory()
+        for _ in range(5):
+            stuff.newsletter()
+        Notification.objects.filter(pk__in=Notification.objects.all()[:4]).update(
+            read=True
+        )
+
+    def test_accessible(self):
+        user = self.users[0]
+        notifications = Notification.objects.accessible(user)
+        assert notifications.count() == 5
+        assert all(notification.receiver == user for notification in notifications)
+        assert not Notification.objects.accessible(AnonymousUser()).exists()
+
+    def test_unread(self):
+        assert Notification.objects.unread().count() == 11
+
+    def test_index_names(self):
+        # The names are short enough for all the databases
+        assert all(len(index.name) <= 30 for index in Notification._meta.indexes)
+
+    def test_accessible_uses_index(self):
+        plan = Notification.objects.accessible(self.users[0]).explain()
+        assert Notification._meta.indexes[0].name in plan
+        # The index is also used for the ordering
+        assert "TEMP B-TREE" not in plan
+
+    def test_unread_uses_partial_index(self):
+        plan = Notification.objects.accessible(self.users[0]).unread().explain()
+        assert Notification._meta.indexes[1].name in plan
+        assert "TEMP B-TREE" not in plan
+
+    def test_after_uses_index(self):
+        plan = Notification.objects.accessible(self.users[0]).after().explain()
+        assert Notification._meta.indexes[0].name in plan
+        # The primary key that breaks the ties is in the index too
+        assert "TEMP B-TREE" not in plan
+        notification = Notification.objects.accessible(self.users[0]).after()[2]
+        cursor = encode_cursor(notification.created, notification.pk)
+        plan = Notification.objects.accessible(self.users[0]).after(cursor).explain()
+        assert "TEMP B-TREE" not in plan
+
+    @pytest.mark.usefixtures("counters")
+    def test_mark_read(self):
+        notifications = Notification.objects.accessible(self.users[0])
+        unread = notifications.unread().count()
+        assert notifications.mark_read() == unread
+        assert notifications.mark_read() == 0
+        assert notifications.filter(read_at__isnull=False).count() == unread
+        assert NotificationCounter.objects.get(receiver_id=self.users[0].pk).unread == 0
+
+    def test_mark_all_read(self):
+        user = self.users[1]
+        first = Notification.objects.accessible(user).order_by("created").first()
+        assert Notification.objects.mark_all_read(user, before=first.created) == 1
+        assert Notification.objects.mark_all_read(user) == 3
+        assert Notification.objects.mark_all_read(AnonymousUser()) == 0
+
+    @pytest.mark.usefixtures("counters")
+    def test_mark_received(self):
+        ids = list(Notification.objects.values_list("pk", flat=True))
+        now = timezone.now()
+        # The queries don't depend on the number of receivers
+        with CaptureQueriesContext(connection) as one_receiver:
+            assert (
+                Notification.objects.filter(
+                    pk__in=ids, receiver_id=self.users[0].pk
+                ).mark_received()
+                == 5
+            )
+        with CaptureQueriesContext(connection) as two_receivers:
+            assert Notification.objects.filter(pk__in=ids).mark_received() == 10
+        assert len(one_receiver) == len(two_receivers)
+        assert not Notification.objects.filter(received_at__lt=now).exists()
+        assert set(
+            NotificationCounter.objects.values_list("unreceived", flat=True)
+        ) == {0}
+
+    def test_page(self):
+        notifications = Notification.objects.accessible(self.users[0])
+        # Same creation date, the ID breaks the tie
+        notifications.filter(pk__in=notifications[:2]).update(created=timezone.now())
+        first = notifications.page(size=2)
+        assert first.has_next
+        second = notifications.page(cursor=first.next_cursor, size=2)
+        third = notifications.page(cursor=second.next_cursor, size=2)
+        assert not third.has_next
+        pages = [*first, *second, *third]
+        assert len(pages) == 5
+        assert [notification.pk for notification in pages] == list(
+            notifications.order_by("-created", "-pk").values_list("pk", flat=True)
+        )
+
+    def test_page_queries(self):
+        notifications = Notification.objects.accessible(self.users[0])
+        with CaptureQueriesContext(connection) as small:
+            page = notifications.page(size=1)
+            [str(notification.event.actor) for notification in page]
+        with CaptureQueriesContext(connection) as big:
+            page = notifications.page(size=5)
+            [str(notification.event.actor) for notification in page]
+        assert len(small) == len(big)
+
+    def test_with_event_objects(self):
+        with CaptureQueriesContext(connection) as queries:
+            notifications = list(Notification.objects.with_event_objects())
+            [str(notification.event.actor) for notification in notifications]
+        # The notifications with the events, and the actors
+        assert len(queries) == 2
+
+    def test_page_invalid_cursor(self):
+        with pytest.raises(InvalidCursor):
+            Notification.objects.page(cursor="invalid")
+
+    @pytest.mark.parametrize("size", [0, -1])
+    def test_page_invalid_size(self, size):
+        StuffFactory().newsletter()
+        with pytest.raises(InvalidPageSize):
+            Notification.objects.page(size=size)
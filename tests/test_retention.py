@@ -0,0 +1,108 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+import pytest
+from django.core.management import call_command
+from django.db.models.signals import post_delete, pre_delete
+from django.utils import timezone
+
+from snitch import EventHandler
+from snitch.managers import NotificationQuerySet
+from snitch.models import Event, NotificationCounter
+from snitch.retention import Pruner
+from tests.app.events import NewsletterHandler
+from tests.app.factories import StuffFactory
+from tests.app.models import Notification
+from tests.factories import UserFactory
+
+
+@pytest.mark.django_db
+class TestPruner:
+    def setup_method(self):
+        self.users = UserFactory.create_batch(size=2)
+        stuff = StuffFactory()
+        stuff.newsletter()
+        self.old = Event.objects.get()
+        stuff.newsletter()
+        past = timezone.now() - timedelta(days=40)
+        Event.objects.filter(pk=self.old.pk).update(created=past)
+        Notification.objects.filter(event=self.old).update(created=past)
+        self.pruner = Pruner(sleep=0)
+
+    def test_nothing_by_default(self):
+        assert self.pruner.prune() == {"notifications": 0, "events": 0}
+        assert Notification.objects.count() == 4
+
+    @mock.patch.object(EventHandler, "retention_days", 30)
+    def test_old(self):
+        assert self.pruner.prune() == {"notifications": 2, "events": 1}
+        assert not Notification.objects.filter(event=self.old).exists()
+        assert not Event.objects.filter(pk=self.old.pk).exists()
+        assert Notification.objects.count() == 2
+
+    @mock.patch.object(EventHandler, "retention_days", 30)
+    @mock.patch.object(NewsletterHandler, "retention_days", None, create=True)
+    def test_retention_of_verb(self):
+        assert self.pruner.prune() == {"notifications": 0, "events": 0}
+
+    @mock.patch.object(EventHandler, "read_retention_days", 30)
+    @pytest.mark.usefixtures("counters")
+    def test_read(self):
+        Notification.objects.filter(receiver_id=self.users[0].pk).mark_read()
+        assert self.pruner.prune_notifications() == 1
+        # The event still has a notification
+        assert self.pruner.prune_events() == 0
+        counter = NotificationCounter.objects.get(receiver_id=self.users[1].pk)
+        assert (counter.unread, counter.unreceived) == (2, 2)
+
+    @mock.patch.object(EventHandler, "retention_days", 30)
+    @pytest.mark.usefixtures("counters")
+    def test_counters(self):
+        self.pruner.prune_notifications()
+        for user in self.users:
+            counter = NotificationCounter.objects.get(receiver_id=user.pk)
+            assert (counter.unread, counter.unreceived) == (1, 1)
+
+    @mock.patch.object(EventHandler, "retention_days", 30)
+    @pytest.mark.usefixtures("counters")
+    def test_signals(self):
+        receiver = mock.Mock()
+        pre_delete.connect(receiver, sender=Notification)
+        try:
+            assert self.pruner.prune_notifications() == 2
+        finally:
+            pre_delete.disconnect(receiver, sender=Notification)
+        # Deleted with the collector, without updating the counters twice
+        assert receiver.call_count == 2
+        for user in self.users:
+            counter = NotificationCounter.objects.get(receiver_id=user.pk)
+            assert (counter.unread, counter.unreceived) == (1, 1)
+
+    @mock.patch.object(EventHandler, "retention_days", 30)
+    @pytest.mark.usefixtures("counters")
+    def test_fast_delete(self):
+        with mock.patch.object(NotificationQuerySet, "delete") as delete:
+            assert self.pruner.prune_notifications() == 2
+        # The receiver of the counters is paused, so it doesn't need the collector
+        delete.assert_not_called()
+        assert post_delete.has_listeners(Notification)
+        # And only while pruning
+        notification = Notification.objects.first()
+        notification.delete()
+        counter = NotificationCounter.objects.get(receiver_id=notification.receiver_id)
+        assert (counter.unread, counter.unreceived) == (0, 0)
+
+    @mock.patch.object(EventHandler, "retention_days", 30)
+    def test_batches(self):
+        pruner = Pruner(batch_size=1, sleep=0.5)
+        with mock.patch("snitch.retention.time.sleep") as sleep:
+            assert pruner.prune() == {"notifications": 2, "events": 1}
+        # Only after the batches with deleted rows
+        assert sleep.call_count == 3
+
+    @mock.patch.object(EventHandler, "retention_days", 30)
+    def test_command(self):
+        out = StringIO()
+        call_command("prune_notifications", "--sleep", "0", stdout=out)
+        assert "2 notifications and 1 events deleted." in out.getvalue()
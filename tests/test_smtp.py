@@ -0,0 +1,102 @@
+from unittest import mock
+
+import pytest
+from django.core.mail import EmailMessage
+
+from snitch.emails import TemplateEmailMessage
+from snitch.exceptions import SnitchError
+from snitch.smtp import AsyncSMTPClient
+from tests.app.emails import WelcomeEmail
+from tests.app.servers import SMTPServer
+
+
+@pytest.fixture
+def smtp_server(settings):
+    server = SMTPServer()
+    server.start()
+    settings.EMAIL_HOST = "127.0.0.1"
+    settings.EMAIL_PORT = server.port
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def client():
+    client = AsyncSMTPClient(pool_size=3)
+    with mock.patch("snitch.smtp.smtp_client", client):
+        yield client
+    client.close()
+
+
+def messages(size: int) -> list[EmailMessage]:
+    return [
+        EmailMessage(subject="Hello", body="Hello world!", to=[f"test{index}@a.com"])
+        for index in range(size)
+    ]
+
+
+class TestAsyncSMTPClient:
+    def test_send_concurrently(self, smtp_server, client):
+        assert client.send(messages(20)) == 20
+        # All the connections of the pool are used
+        assert smtp_server.connections == 3
+        assert sorted(recipients[0] for _, recipients, _ in smtp_server.messages) == (
+            sorted(f"test{index}@a.com" for index in range(20))
+        )
+
+    def test_reuses_connections(self, smtp_server, client):
+        client.send(messages(6))
+        client.send(messages(6))
+        assert smtp_server.connections == 3
+        assert len(smtp_server.messages) == 12
+
+    def test_reconnects(self, smtp_server, client):
+        smtp_server.drop_after = 2
+        assert client.send(messages(12)) == 12
+        assert len(smtp_server.messages) == 12
+
+    def test_rejected(self, smtp_server, client):
+        smtp_server.rejected = {"test1@a.com", "test3@a.com"}
+        assert client.send(messages(6)) == 4
+        assert len(smtp_server.messages) == 4
+
+
+@pytest.mark.django_db
+class TestAsyncSMTPEmails:
+    def test_send_batch(self, smtp_server, client):
+        emails = [
+            WelcomeEmail(to=f"test{index}@example.com", context={})
+            for index in range(10)
+        ]
+        with mock.patch("snitch.emails.EMAIL_ASYNC_SMTP", True):
+            assert TemplateEmailMessage.send_batch(emails, use_async=True) == 10
+        assert smtp_server.connections == 3
+        assert len(smtp_server.messages) == 10
+
+    def test_send_async(self, smtp_server, client):
+        email = WelcomeEmail(to="test@example.com", context={})
+        with mock.patch("snitch.tasks.EMAIL_ASYNC_SMTP", True), mock.patch(
+            "snitch.emails.EMAIL_ASYNC_SMTP", True
+        ):
+            email.send()
+        assert smtp_server.messages[0][1] == ["test@example.com"]
+
+    def test_send_async_rejected(self, smtp_server, client):
+        smtp_server.rejected = {"test@example.com"}
+        email = WelcomeEmail(to="test@example.com", context={})
+        with mock.patch("snitch.tasks.EMAIL_ASYNC_SMTP", True), mock.patch(
+            "snitch.emails.EMAIL_ASYNC_SMTP", True
+        ), pytest.raises(SnitchError):
+            email.send()
+
+    def test_send_batch_rejected(self, smtp_server, client):
+        smtp_server.rejected = {"test1@example.com"}
+        emails = [
+            WelcomeEmail(to=f"test{index}@example.com", context={})
+            for index in range(3)
+        ]
+        with mock.patch("snitch.emails.EMAIL_ASYNC_SMTP", True), pytest.raises(
+            SnitchError, match="1 of 3 emails"
+        ):
+            TemplateEmailMessage.send_batch(emails, use_async=True)
+        assert len(smtp_server.messages) == 2
@@ -0,0 +1,97 @@
+from io import StringIO
+from unittest import mock
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from snitch.managers import NotificationQuerySet
+from snitch.settings import RENDER_BATCH_SIZE
+from tests.app.factories import StuffFactory
+from tests.app.models import Notification
+from tests.factories import UserFactory
+
+
+@pytest.mark.django_db
+class TestNotificationSnapshot:
+    def setup_method(self):
+        self.users = UserFactory.create_batch(size=3)
+
+    @mock.patch("snitch.models.NOTIFICATION_SNAPSHOT", True)
+    def test_rendered_when_created(self):
+        StuffFactory().newsletter()
+        notification = Notification.objects.first()
+        assert notification.rendered_at is not None
+        expected = notification.handler().get_text(receivers=notification.receiver)
+        with CaptureQueriesContext(connection) as queries:
+            rendered = notification.rendered()
+        assert len(queries) == 0
+        assert rendered["text"] == expected
+        assert rendered["action_type"] == "app.stuff"
+        assert rendered["extra_data"] == {}
+
+    @mock.patch("snitch.models.NOTIFICATION_SNAPSHOT", True)
+    def test_render_error_when_created(self):
+        with mock.patch.object(Notification, "render", side_effect=ValueError):
+            StuffFactory().newsletter()
+        # Created anyway, to be rendered later
+        assert Notification.objects.filter(rendered_at__isnull=True).count() == 3
+
+    def test_not_rendered(self):
+        StuffFactory().newsletter()
+        notification = Notification.objects.first()
+        assert notification.rendered_at is None
+        # From the handler
+        assert notification.rendered()["text"] is not None
+
+    @mock.patch("snitch.models.NOTIFICATION_SNAPSHOT", True)
+    @mock.patch("snitch.managers.NOTIFICATION_SNAPSHOT", True)
+    def test_page(self):
+        StuffFactory().newsletter()
+        with CaptureQueriesContext(connection) as queries:
+            page = Notification.objects.accessible(self.users[0]).page()
+            [notification.rendered() for notification in page]
+        assert len(queries) == 1
+
+    def test_backfill(self):
+        stuff = StuffFactory()
+        stuff.newsletter()
+        stuff.newsletter()
+        with CaptureQueriesContext(connection) as queries:
+            rendered = Notification.objects.render(batch_size=4)
+        assert rendered == 6
+        # Each batch reads the notifications, the events objects and the receivers,
+        # and updates them, and the last one is empty
+        assert len(queries) == 2 * 4 + 1
+        assert not Notification.objects.filter(rendered_at__isnull=True).exists()
+        assert Notification.objects.render() == 0
+
+    def test_backfill_error(self):
+        StuffFactory().newsletter()
+        failing = Notification.objects.first()
+        render = Notification.render
+
+        def fail(notification):
+            if notification.pk == failing.pk:
+                raise ValueError
+            render(notification)
+
+        with mock.patch.object(Notification, "render", autospec=True) as mocked:
+            mocked.side_effect = fail
+            assert Notification.objects.render(batch_size=2) == 2
+        # Skipped, to be rendered again
+        assert list(Notification.objects.filter(rendered_at__isnull=True)) == [failing]
+
+    def test_command(self):
+        StuffFactory().newsletter()
+        out = StringIO()
+        call_command("render_notifications", "--batch-size", "2", stdout=out)
+        assert "3 notifications rendered." in out.getvalue()
+
+    def test_command_batch_size(self):
+        with mock.patch.object(
+            NotificationQuerySet, "render", return_value=0
+        ) as render:
+            call_command("render_notifications", stdout=StringIO())
+        render.assert_called_once_with(batch_size=RENDER_BATCH_SIZE)
@@ -0,0 +1,122 @@
+import io
+from unittest import mock
+
+import pytest
+from django.core import mail
+from django.core.cache import cache
+
+from snitch.emails import TemplateEmailMessage
+from snitch.exceptions import SnitchError
+from snitch.storages import CacheBodyStore, StorageBodyStore, get_body_store
+from snitch.tasks import send_email_asynchronously
+from tests.app.emails import WelcomeEmail
+
+
+class TestBodyStores:
+    def setup_method(self):
+        cache.clear()
+
+    @pytest.mark.parametrize("compress", [False, True])
+    def test_cache(self, compress):
+        store = CacheBodyStore(compress=compress)
+        body = "<p>Hello world!</p>" * 100
+        reference = store.put(body)
+        assert store.put(body) == reference
+        assert store.get(reference) == body
+        data = cache.get(store._key(reference))
+        assert (len(data) < len(body)) is compress
+
+    def test_storage(self, settings, tmp_path):
+        settings.MEDIA_ROOT = str(tmp_path)
+        store = StorageBodyStore(compress=True)
+        reference = store.put("Hello world!")
+        assert store.put("Hello world!") == reference
+        assert len(list(tmp_path.glob("snitch/emails/*/*"))) == 1
+        assert store.get(reference) == "Hello world!"
+
+    def test_missing(self):
+        with pytest.raises(SnitchError):
+            CacheBodyStore().get("missing")
+
+
+@pytest.mark.django_db
+class TestStoredEmails:
+    @pytest.fixture(autouse=True)
+    def body_store(self, settings):
+        settings.SNITCH_EMAIL_BODY_STORE = "snitch.storages.CacheBodyStore"
+
+    def setup_method(self):
+        cache.clear()
+
+    def test_get_body_store(self, settings):
+        store = get_body_store()
+        assert isinstance(store, CacheBodyStore)
+        assert get_body_store() is store
+        settings.SNITCH_EMAIL_BODY_STORE = "snitch.storages.StorageBodyStore"
+        assert isinstance(get_body_store(), StorageBodyStore)
+        settings.SNITCH_EMAIL_BODY_STORE = None
+        assert get_body_store() is None
+
+    def test_async_send(self):
+        email = WelcomeEmail(to="test@example.com", context={})
+        store = CacheBodyStore(compress=True)
+        with mock.patch.dict(
+            "snitch.storages._stores", {"snitch.storages.CacheBodyStore": store}
+        ), mock.patch.object(
+            send_email_asynchronously, "delay", wraps=send_email_asynchronously.delay
+        ) as delay:
+            email.send()
+        # Only the references are sent in the task
+        _, message_plain, message, *_ = delay.call_args.args
+        assert delay.call_args.kwargs["stored"]
+        assert store.get(message) == mail.outbox[0].alternatives[0][0]
+        assert store.get(message_plain) == mail.outbox[0].body
+
+    def test_async_send_batch(self):
+        emails = [
+            WelcomeEmail(to=f"test{index}@example.com", context={})
+            for index in range(5)
+        ]
+        assert TemplateEmailMessage.send_batch(emails, use_async=True) == 5
+        assert len(mail.outbox) == 5
+        assert mail.outbox[0].alternatives
+
+    def test_send_attaches(self):
+        email = WelcomeEmail(
+            to="test@example.com",
+            context={},
+            attaches=[
+                ("dummy.txt", io.StringIO("dummy"), "text/plain"),
+                ("dummy.bin", b"\x00\x01", "application/octet-stream"),
+            ],
+        )
+        with mock.patch("snitch.emails.send_email_asynchronously.delay") as delay:
+            email.send()
+        # The email is sent in a task, without the content of the attaches
+        attaches = delay.call_args.kwargs["attaches"]
+        assert [attach[0] for attach in attaches] == ["dummy.txt", "dummy.bin"]
+        assert all(len(attach[1]) == 64 for attach in attaches)
+
+    def test_send_attaches_delivered(self):
+        email = WelcomeEmail(
+            to="test@example.com",
+            context={},
+            attaches=[("dummy.bin", b"\x00\x01", "application/octet-stream")],
+        )
+        TemplateEmailMessage.send_batch([email, email], use_async=True)
+        assert len(mail.outbox) == 2
+        assert mail.outbox[0].attachments == [
+            ("dummy.bin", b"\x00\x01", "application/octet-stream")
+        ]
+
+    def test_send_attaches_without_store(self, settings):
+        settings.SNITCH_EMAIL_BODY_STORE = None
+        email = WelcomeEmail(
+            to="test@example.com",
+            context={},
+            attaches=[("dummy.txt", "dummy", "text/plain")],
+        )
+        with mock.patch("snitch.emails.send_email_asynchronously.delay") as delay:
+            email.send()
+        assert not delay.called
+        assert mail.outbox[0].attachments == [("dummy.txt", "dummy", "text/plain")]
@@ -0,0 +1,95 @@
+from unittest import mock
+
+import pytest
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from snitch.emails import TemplateEmailMessage
+from snitch.models import EmailSuppression
+from snitch.suppressions import suppression_list
+from tests.app.emails import WelcomeEmail
+from tests.app.factories import StuffFactory
+from tests.factories import UserFactory
+
+
+@pytest.mark.django_db
+class TestSuppressionList:
+    @pytest.fixture(autouse=True)
+    def suppression(self):
+        cache.clear()
+        with mock.patch("snitch.emails.EMAIL_SUPPRESSION", True):
+            yield
+
+    def test_record_hard_bounce(self):
+        suppression_list.record_hard_bounce("Bounced <Bounced@Example.com>")
+        suppression = EmailSuppression.objects.get()
+        assert suppression.email == "bounced@example.com"
+        assert suppression.reason == EmailSuppression.HARD_BOUNCE
+        assert suppression_list.is_suppressed("bounced@example.com")
+        suppression_list.unsuppress("bounced@example.com")
+        assert not suppression_list.is_suppressed("bounced@example.com")
+
+    def test_bulk_check(self, django_assert_num_queries):
+        EmailSuppression.objects.create(email="bounced@example.com")
+        emails = [f"test{index}@example.com" for index in range(10)]
+        with django_assert_num_queries(1):
+            assert suppression_list.suppressed(emails + ["bounced@example.com"]) == {
+                "bounced@example.com"
+            }
+        # The results are cached, including the addresses not suppressed
+        with django_assert_num_queries(0):
+            assert suppression_list.suppressed(emails + ["bounced@example.com"])
+
+    def test_send_skips_rendering(self):
+        suppression_list.record_hard_bounce("bounced@example.com")
+        email = WelcomeEmail(to="bounced@example.com", context={})
+        with mock.patch.object(WelcomeEmail, "render") as render:
+            email.send(use_async=False)
+        assert not render.called
+        assert len(mail.outbox) == 0
+
+    def test_send_batch(self):
+        suppression_list.record_hard_bounce("test1@example.com")
+        cache.clear()
+        emails = [
+            WelcomeEmail(to=f"test{index}@example.com", context={})
+            for index in range(4)
+        ]
+        emails[2].cc = ["test1@example.com"]
+        with mock.patch.object(
+            WelcomeEmail,
+            "render",
+            autospec=True,
+            side_effect=TemplateEmailMessage.render,
+        ) as render:
+            assert TemplateEmailMessage.send_batch(emails) == 3
+        assert render.call_count == 3
+        assert [email.to for email in mail.outbox] == [
+            ["test0@example.com"],
+            ["test2@example.com"],
+            ["test3@example.com"],
+        ]
+        assert mail.outbox[1].cc == []
+
+    def test_notify_checks_audience_at_once(self):
+        users = [UserFactory(email=f"test{index}@example.com") for index in range(3)]
+        suppression_list.record_hard_bounce(users[1].email)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            StuffFactory().newsletter()
+        suppression_queries = [
+            query for query in queries if "emailsuppression" in query["sql"]
+        ]
+        assert len(suppression_queries) == 1
+        assert [email.to for email in mail.outbox] == [
+            [users[0].email],
+            [users[2].email],
+        ]
+
+    def test_disabled(self):
+        suppression_list.record_hard_bounce("bounced@example.com")
+        with mock.patch("snitch.emails.EMAIL_SUPPRESSION", False):
+            WelcomeEmail(to="bounced@example.com", context={}).send(use_async=False)
+        assert len(mail.outbox) == 1